@@ -1,1022 +1,6444 @@
-import tkinter as tk
-from tkinter import filedialog, ttk, messagebox
-import os
-import yaml
-import torch
-from torch.hub import download_url_to_file
-import subprocess
-import sys
-import json
-import webbrowser
-import logging
-import re
-import tempfile
-import time
-import shutil
-
-#logging.basicConfig(filename='music_separation.log', level=logging.DEBUG,
-#                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-class MusicSeparationGUI:
-    def __init__(self, master):
-        self.master = master
-        master.title("Music Source Separation")
-
-        self.config_file = 'config.json'
-        self.models_file = 'models.json'
-        # Load config (creates an empty one if it doesn't exist)
-        self.load_config()
-        self.load_models()
-
-        # Modify inference.py if needed
-        self.check_and_modify_inference_py()
-
-        # Create the main frame
-        self.main_frame = ttk.Frame(master, padding="10")
-        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        master.columnconfigure(0, weight=1)
-        master.rowconfigure(0, weight=1)
-
-        # Create sections
-        self.create_io_section()
-        self.create_model_section()
-        self.create_options_section()
-        self.create_action_section()
-
-        # Multi-model window (initialized as None)
-        self.multi_model_window = None
-
-    def check_and_modify_inference_py(self):
-        inference_py_path = "inference.py"
-        if not os.path.exists(inference_py_path):
-            logging.error("inference.py not found.")
-            return
-
-        with open(inference_py_path, "r", encoding='utf-8') as f:
-            code = f.read()
-
-        modified = False
-
-        # --- PATCH 1: Intercept --input_path before the parser crashes ---
-        # The standard parser doesn't know --input_path, so we steal it from sys.argv 
-        # before the parser sees it.
-        if "custom_input_path = None" not in code:
-            print("Patching inference.py: Injecting argument interceptor...")
-            
-            # We look for the start of the proc_folder function
-            target_str = "def proc_folder(dict_args):"
-            inject_str = """def proc_folder(dict_args):
-    # --- GUI PATCH START: Intercept input_path ---
-    custom_input_path = None
-    if "--input_path" in sys.argv:
-        try:
-            idx = sys.argv.index("--input_path")
-            if idx + 1 < len(sys.argv):
-                custom_input_path = sys.argv[idx + 1]
-                del sys.argv[idx:idx + 2]
-        except: pass
-    # --- GUI PATCH END ---
-"""
-            code = code.replace(target_str, inject_str)
-
-            # Re-inject the path after parsing
-            target_str_2 = "args = parse_args_inference(dict_args)"
-            inject_str_2 = """args = parse_args_inference(dict_args)
-    # --- GUI PATCH START: Restore input_path ---
-    if custom_input_path:
-        args.input_path = custom_input_path
-        if not args.input_folder:
-            args.input_folder = os.path.dirname(custom_input_path)
-    # --- GUI PATCH END ---"""
-            code = code.replace(target_str_2, inject_str_2)
-            modified = True
-
-        # --- PATCH 2: Handle Single File Logic in run_folder ---
-        # Standard code only globs a folder. We add a check for the specific file.
-        if "if getattr(args, 'input_path', None)" not in code:
-            print("Patching inference.py: Injecting single file logic...")
-            target_str = "mixture_paths = sorted(glob.glob(os.path.join(args.input_folder, '*.*')))"
-            inject_str = """if getattr(args, 'input_path', None) and os.path.isfile(args.input_path):
-        mixture_paths = [args.input_path]
-    else:
-        mixture_paths = sorted(glob.glob(os.path.join(args.input_folder, '*.*')))"""
-            code = code.replace(target_str, inject_str)
-            modified = True
-
-        # --- PATCH 3: Flat Output Directory Structure ---
-        # Standard code creates subfolders (output/TrackName/vocals.wav).
-        # We want output/TrackName_vocals.wav
-        if "output_dir = os.path.join(args.store_dir, file_name)" in code:
-            print("Patching inference.py: Flattening output directory structure...")
-            # Remove the subfolder creation
-            code = code.replace("output_dir = os.path.join(args.store_dir, file_name)", 
-                                "# output_dir = os.path.join(args.store_dir, file_name) # GUI PATCH")
-            
-            # Fix the output path construction
-            # Original looks like: output_path = os.path.join(output_dir, f"{instr}.{codec}")
-            # We change regex broadly to catch variants
-            code = code.replace('output_path = os.path.join(output_dir, f"{instr}.{codec}")', 
-                                'output_path = os.path.join(args.store_dir, f"{file_name}_{instr}.{codec}")')
-            
-            # Also fix the spectrogram output path if it exists
-            code = code.replace('output_img_path = os.path.join(output_dir, f"{instr}.jpg")',
-                                'output_img_path = os.path.join(args.store_dir, f"{file_name}_{instr}.jpg")')
-            
-            modified = True
-
-        # --- SAVE CHANGES ---
-        if modified:
-            try:
-                with open(inference_py_path, "w", encoding='utf-8') as f:
-                    f.write(code)
-                print("inference.py successfully patched.")
-                # Update timestamp to prevent re-patching loops if you use that logic
-                self.config['last_inference_py_edit'] = os.path.getmtime(inference_py_path)
-                self.save_config()
-            except Exception as e:
-                logging.error(f"Failed to write patched inference.py: {e}")
-                messagebox.showerror("Error", f"Failed to patch inference.py:\n{e}")
-
-    def modify_inference_py(self, inference_py_path, inference_code):
-        # Replace with the "old" code pattern
-        inference_code = inference_code.replace(
-            "output_dir = os.path.join(args.store_dir, file_name)\n        os.makedirs(output_dir, exist_ok=True)",
-            ""  # Remove the lines that create subfolders
-        )
-        inference_code = inference_code.replace(
-            "output_path = os.path.join(output_dir, f\"{instr}.{codec}\")",
-            "output_path = os.path.join(args.store_dir, f\"{file_name}_{instr}.{codec}\")"  # Modify output path
-        )
-        with open(inference_py_path, "w") as f:
-            f.write(inference_code)
-
-        # Record the modification time in config.json (only timestamp update)
-        self.update_last_inference_py_edit()
-        print("Modified inference.py to use the old output path structure.")
-
-    def update_last_inference_py_edit(self):
-        # Update only the timestamp part of the config
-        self.config['last_inference_py_edit'] = os.path.getmtime("inference.py")
-        self.save_timestamp()
-
-    def save_timestamp(self):
-        # Save only the timestamp without GUI data
-        temp_config = {'last_inference_py_edit': self.config.get('last_inference_py_edit', None)}
-        with open(self.config_file, 'w') as f:
-            json.dump(temp_config, f, indent=4)
-
-    def create_io_section(self):
-        io_frame = ttk.LabelFrame(self.main_frame, text="Input/Output", padding="10")
-        io_frame.grid(column=0, row=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        io_frame.columnconfigure(1, weight=1)
-
-        # Input path (now can be file or folder)
-        ttk.Label(io_frame, text="Input Path:").grid(column=0, row=0, sticky=tk.W)
-        self.input_path = tk.StringVar(value=self.config.get('input_path', '')) # Changed variable name
-        ttk.Entry(io_frame, width=50, textvariable=self.input_path).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5) # Changed variable name
-        ttk.Button(io_frame, text="Browse", command=self.browse_input_path).grid(column=2, row=0) # Changed browse function
-
-        # Output folder
-        ttk.Label(io_frame, text="Output Folder:").grid(column=0, row=1, sticky=tk.W)
-        self.output_folder = tk.StringVar(value=self.config.get('output_folder', ''))
-        ttk.Entry(io_frame, width=50, textvariable=self.output_folder).grid(column=1, row=1, sticky=(tk.W, tk.E), padx=5)
-        ttk.Button(io_frame, text="Browse", command=self.browse_output).grid(column=2, row=1)
-
-        # Model Folder Sort checkbox
-        self.model_folder_sort = tk.BooleanVar(value=self.config.get('model_folder_sort', False))
-        ttk.Checkbutton(io_frame, text="Organize Output Per Model", variable=self.model_folder_sort).grid(column=0, row=2, sticky=tk.W, columnspan=2)
-
-    def create_model_section(self):
-        model_frame = ttk.LabelFrame(self.main_frame, text="Model Selection", padding="10")
-        model_frame.grid(column=0, row=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        model_frame.columnconfigure(1, weight=1)  # Allow column 1 to expand
-        model_frame.rowconfigure(1, weight=1)
-
-        # Model Type Selection
-        ttk.Label(model_frame, text="Model Type:").grid(column=0, row=0, sticky=tk.W)
-        self.model_type = tk.StringVar(value=self.config.get('model_type', 'VOCALS'))
-
-        self.model_type_options = sorted(set(model['SORT'] for model in self.model_info.values()))
-        self.model_type_combo = ttk.Combobox(model_frame, textvariable=self.model_type,
-                                             values=self.model_type_options, width=30)
-        self.model_type_combo.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
-        self.model_type_combo.bind("<<ComboboxSelected>>", self.update_model_list)
-
-        # Specific Model Selection
-        ttk.Label(model_frame, text="Specific Model:").grid(column=0, row=1, sticky=tk.NW)
-        self.model = tk.StringVar(value=self.config.get('model', ''))
-        self.model_list = tk.Listbox(model_frame, selectmode=tk.SINGLE, height=5)
-        self.model_list.grid(column=1, row=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
-        model_scrollbar = ttk.Scrollbar(model_frame, orient="vertical", command=self.model_list.yview)
-        model_scrollbar.grid(column=2, row=1, sticky=(tk.N, tk.S))
-        self.model_list.configure(yscrollcommand=model_scrollbar.set)
-
-        # Create a frame for the buttons to prevent them from expanding
-        buttons_frame = ttk.Frame(model_frame)
-        buttons_frame.grid(column=1, row=2, pady=(5, 0))
-
-        # Center the buttons within the buttons_frame
-        buttons_frame.columnconfigure(0, weight=1)
-        buttons_frame.columnconfigure(1, weight=1)
-
-        # Multi-Model Selection Button
-        ttk.Button(buttons_frame, text="Multi-Model", command=self.open_multi_model_window).grid(column=0, row=0, padx=(0, 5))
-
-        # Ensemble Mode Button
-        ttk.Button(buttons_frame, text="Ensemble", command=self.open_ensemble_window).grid(column=1, row=0)
-
-        # Update Models button
-        ttk.Button(model_frame, text="Update Models", command=self.update_models_from_github).grid(column=1, row=3, pady=(5, 0))
-
-        self.update_model_list()
-
-    def create_options_section(self):
-        options_frame = ttk.LabelFrame(self.main_frame, text="Processing Options", padding="10")
-        options_frame.grid(column=0, row=2, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        options_frame.columnconfigure(1, weight=1)
-
-        # Extract instrumental
-        self.extract_instrumental = tk.BooleanVar(value=self.config.get('extract_instrumental', True))
-        ttk.Checkbutton(options_frame, text="Extract other stem", variable=self.extract_instrumental).grid(column=0, row=0, sticky=tk.W, columnspan=2)
-
-        # Export format
-        ttk.Label(options_frame, text="Export Format:").grid(column=0, row=1, sticky=tk.W)
-        self.export_format = tk.StringVar(value=self.config.get('export_format', 'wav FLOAT'))
-        ttk.Combobox(options_frame, textvariable=self.export_format, values=['wav FLOAT', 'flac PCM_16', 'flac PCM_24']).grid(column=1, row=1, sticky=(tk.W, tk.E))
-
-        # Advanced Options Frame
-        advanced_frame = ttk.LabelFrame(options_frame, text="Advanced Options", padding="10")
-        advanced_frame.grid(column=0, row=2, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=(10, 0)) # Add padding at the top
-
-        # Use default parameters checkbox
-        self.use_default_params = tk.BooleanVar(value=True)  # Initially checked
-        ttk.Checkbutton(advanced_frame, text="Use Default Parameters", variable=self.use_default_params, command=self.toggle_advanced_options).grid(column=0, row=0, sticky=tk.W, columnspan=3)
-
-        # Use TTA
-        self.use_tta = tk.BooleanVar(value=self.config.get('use_tta', False))
-        self.tta_checkbutton = ttk.Checkbutton(advanced_frame, text="Use TTA", variable=self.use_tta, state=tk.DISABLED)  # Initially disabled
-        self.tta_checkbutton.grid(column=0, row=1, sticky=tk.W, columnspan=3)
-
-        # Overlap
-        ttk.Label(advanced_frame, text="Overlap:").grid(column=0, row=2, sticky=tk.W)
-        self.overlap = tk.IntVar(value=self.config.get('overlap', 2))
-
-        # Use a Frame to hold the Entry and Scale
-        overlap_frame = ttk.Frame(advanced_frame)
-        overlap_frame.grid(column=1, row=2, sticky=(tk.W, tk.E))
-
-        self.overlap_entry = ttk.Entry(overlap_frame, width=5, textvariable=self.overlap, state=tk.DISABLED)
-        self.overlap_entry.pack(side=tk.LEFT, padx=(0, 5))
-
-        self.overlap_scale = ttk.Scale(overlap_frame, from_=1, to=40, variable=self.overlap, orient=tk.HORIZONTAL, state=tk.DISABLED, command=self.update_overlap_entry)
-        self.overlap_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
-
-        # Bind <Return> on Entry to update the Scale
-        self.overlap_entry.bind("<Return>", self.update_overlap_scale)
-
-        # Chunk size
-        ttk.Label(advanced_frame, text="Chunk Size:").grid(column=0, row=3, sticky=tk.W)
-        self.chunk_size = tk.IntVar(value=self.config.get('chunk_size', 352800))
-        values = [352800, 485100]
-        self.chunk_size_combo = ttk.Combobox(advanced_frame, textvariable=self.chunk_size, values=values, state=tk.DISABLED)
-        self.chunk_size_combo.grid(column=1, row=3, sticky=(tk.W, tk.E))
-        self.chunk_size_combo.current(values.index(self.chunk_size.get()) if self.chunk_size.get() in values else 0) # Set current value based on self.chunk_size
-
-    def update_overlap_entry(self, *args):
-        """Updates the overlap entry when the slider is moved."""
-        try:
-            value = int(self.overlap_scale.get())
-            self.overlap.set(value)
-        except ValueError:
-            pass
-
-    def update_overlap_scale(self, event=None):
-        """Updates the slider when the overlap entry is changed."""
-        try:
-            value = self.overlap.get()
-            if 1 <= value <= 40:
-                self.overlap_scale.set(value)
-        except (ValueError, tk.TclError):
-            pass
-
-    def toggle_advanced_options(self):
-        state = tk.NORMAL if not self.use_default_params.get() else tk.DISABLED
-        self.tta_checkbutton.config(state=state)
-        self.overlap_entry.config(state=state)
-        self.overlap_scale.config(state=state)  # Enable/disable the slider too
-        self.chunk_size_combo.config(state=state)
-
-    def create_action_section(self):
-        action_frame = ttk.Frame(self.main_frame, padding="10")
-        action_frame.grid(column=0, row=3, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        action_frame.columnconfigure(0, weight=1)
-
-        # Separate button
-        ttk.Button(action_frame, text="Separate", command=self.separate).grid(column=0, row=0, pady=(0, 5))
-
-        # Status label
-        self.status = tk.StringVar(value="Ready")
-        ttk.Label(action_frame, textvariable=self.status).grid(column=0, row=1)
-
-        # Progress bar
-        self.progress_var = tk.DoubleVar(value=0.0)
-        self.progress_bar = ttk.Progressbar(action_frame, orient="horizontal", mode="determinate", variable=self.progress_var, maximum=100)
-        self.progress_bar.grid(column=0, row=2, pady=(5, 0))
-
-        # Credit label with hyperlink
-        credit_label = ttk.Label(action_frame, text="GUI made by Sifted Sand Records",
-                                  cursor="hand2", font=("TkDefaultFont", 8, "underline"), foreground="blue")
-        credit_label.grid(column=0, row=3, pady=(5, 0))
-        credit_label.bind("<Button-1>", lambda e: webbrowser.open_new("https://lnk.bio/siftedsand"))
-
-    def load_config(self):
-        try:
-            with open(self.config_file, 'r') as f:
-                self.config = json.load(f)
-        except FileNotFoundError:
-            self.config = {}
-
-    def load_models(self):
-        try:
-            with open(self.models_file, 'r') as f:
-                self.model_info = json.load(f)
-        except FileNotFoundError:
-            self.model_info = {}
-
-    def save_config(self):
-        self.config['input_path'] = self.input_path.get() # Changed to input_path
-        self.config['output_folder'] = self.output_folder.get()
-        self.config['model_type'] = self.model_type.get()
-        self.config['model'] = self.model.get()
-        self.config['model_folder_sort'] = self.model_folder_sort.get()
-        self.config['extract_instrumental'] = self.extract_instrumental.get()
-        self.config['export_format'] = self.export_format.get()
-        self.config['use_tta'] = self.use_tta.get()
-        self.config['overlap'] = self.overlap.get()
-        self.config['chunk_size'] = self.chunk_size.get()
-        self.config['last_inference_py_edit'] = self.config.get('last_inference_py_edit') # Save the timestamp
-
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=4)
-
-
-    def update_model_list(self, event=None):
-        selected_type = self.model_type.get()
-        self.model_list.delete(0, tk.END)
-
-        filtered_models = [
-            model_name for model_name, model_data in self.model_info.items()
-            if model_data.get('SORT') == selected_type
-        ]
-        filtered_models.sort(key=lambda x: x.lower())
-
-        for model_name in filtered_models:
-            self.model_list.insert(tk.END, model_name)
-
-        # Select the first model by default if available
-        if self.model_list.size() > 0:
-            self.model_list.selection_set(0)
-            self.model_list.see(0)
-
-    def browse_input_path(self): # Changed function name
-        file_or_folder = filedialog.askopenfilename(filetypes=[("Audio files", "*.wav;*.flac;*.mp3;*.aiff;*.aif"), ("Folders", "*")]) # Allow file or folder selection
-        if file_or_folder:
-            if os.path.isfile(file_or_folder) or os.path.isdir(file_or_folder): # Check if selected path is valid
-                self.input_path.set(file_or_folder) # Changed to input_path
-                self.save_config()
-            else:
-                messagebox.showerror("Error", "Invalid input path selected.")
-                return
-
-    def browse_output(self):
-        folder = filedialog.askdirectory()
-        if folder:
-            if not os.path.isdir(folder):
-                messagebox.showerror("Error", "Invalid output folder selected.")
-                return
-            self.output_folder.set(folder)
-            self.save_config()
-
-    def download_file(self, url, filename):
-        path = 'ckpts'
-        os.makedirs(path, exist_ok=True)
-        file_path = os.path.join(path, filename)
-
-        if os.path.exists(file_path):
-            self.status.set(f"File '{filename}' already exists.")
-            self.master.update()
-            return file_path
-
-        try:
-            self.status.set(f"Downloading '{filename}'...")
-            self.master.update()
-            download_url_to_file(url, file_path)
-            self.status.set(f"File '{filename}' downloaded successfully")
-            self.master.update()
-            return file_path
-        except Exception as e:
-            self.status.set(f"Error downloading file '{filename}': {e}")
-            self.master.update()
-            return None
-
-    def modify_yaml(self, original_config_path):
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.yaml', delete=False) as temp_yaml:
-                self.temp_config_path = temp_yaml.name
-
-                with open(original_config_path, 'r') as f:
-                    data = yaml.safe_load(f)
-
-                # Ensure necessary sections exist
-                if 'training' not in data:
-                    data['training'] = {}
-                if 'audio' not in data:
-                    data['audio'] = {}
-                if 'inference' not in data:
-                    data['inference'] = {}
-
-                if 'use_amp' not in data['training']:
-                    data['training']['use_amp'] = True
-                data['audio']['chunk_size'] = self.chunk_size.get()
-                data['inference']['num_overlap'] = self.overlap.get()
-
-                if data['inference'].get('batch_size') == 1:  # Only update batch size if necessary
-                    data['inference']['batch_size'] = 2
-
-                yaml.safe_dump(data, temp_yaml, default_flow_style=False, sort_keys=False, indent=4)
-                logging.debug(f"Modified YAML (temp file): {self.temp_config_path}")
-
-        except Exception as e:
-            logging.exception(f"Error modifying YAML: {e}")
-            messagebox.showerror("Error", f"Error modifying YAML file: {e}")
-            return False
-
-        return True
-
-    def separate(self):
-        selected_model = self.model_list.get(tk.ANCHOR)
-        if not selected_model or selected_model not in self.model_info:
-            messagebox.showerror("Error", "Please select a valid model.")
-            return
-
-        logging.info(f"Starting separation with model: {selected_model}")
-        input_path = self.input_path.get() # Changed to input_path
-        output_dir = self._get_output_directory(selected_model)
-
-        try:
-            if not self._download_model_files(selected_model):
-                return  # _download_model_files handles error messages
-
-            # No need for temp folders in a straight separation
-            cmd = self._build_separation_command(selected_model, output_dir, input_path) # Changed to input_path
-
-            logging.info(f"Separation command: {cmd}")  # Log the full command
-
-            # Run separation directly (no threading)
-            self._run_separation(cmd, selected_model)
-
-        except Exception as e:
-            logging.exception(f"An unexpected error occurred during separation: {e}")  # Log the full traceback
-            messagebox.showerror("Error", f"An unexpected error occurred during separation: {e}")
-
-        finally:
-            self.save_config()
-
-    def _download_model_files(self, selected_model):
-        info = self.model_info[selected_model]
-        config_url = info['config_url']
-        config_name = info['config_name']
-        checkpoint_url = info['checkpoint_url']
-        checkpoint_name = info['checkpoint_name']
-
-        config_path = self.download_file(config_url, config_name)
-        checkpoint_path = self.download_file(checkpoint_url, checkpoint_name)
-
-        if not config_path or not checkpoint_path:
-            messagebox.showerror("Error", "Failed to download necessary files.")
-            logging.error("Failed to download config or checkpoint files.")
-            return False
-
-        if not self.use_default_params.get():  # Only modify YAML if not using defaults
-            if not self.modify_yaml(config_path):
-                logging.error("Failed to modify YAML file.")  # Add more specific logging
-                return False
-
-        return True
-
-    def _get_output_directory(self, selected_model):
-        output_dir = self.output_folder.get()
-        if self.model_folder_sort.get():
-            output_dir = os.path.join(output_dir, selected_model)
-            os.makedirs(output_dir, exist_ok=True)
-        return output_dir
-
-    def _build_separation_command(self, selected_model, output_dir, input_path): # Modified function to handle input_path
-        info = self.model_info[selected_model]
-
-        if not self.use_default_params.get():
-            config_path = self.temp_config_path
-        else:
-            config_path = os.path.join('ckpts', info['config_name'])
-
-        checkpoint_path = os.path.join('ckpts', info['checkpoint_name'])
-
-        cmd = [
-            sys.executable,
-            "inference.py",
-            "--model_type", info['model_type'],
-            "--config_path", config_path,
-            "--start_check_point", checkpoint_path,
-            "--store_dir", output_dir,
-            "--input_path", input_path,  # <--- ALWAYS use --input_path and pass input_path
-        ]
-
-        # Remove the old if/elif/else block completely
-        # No longer need to check if it's a dir or file here. inference.py handles it.
-
-        # Add other options (rest of the function remains the same)
-        if self.extract_instrumental.get():
-            cmd.append("--extract_instrumental")
-
-        export_format = self.export_format.get()
-        if export_format.startswith('flac'):
-            cmd.append("--flac_file")
-            cmd.append(f"--pcm_type={export_format.split()[1]}")
-        elif export_format == "wav FLOAT":
-            cmd.append("--wav_file")
-
-        if self.use_tta.get():
-            cmd.append("--use_tta")
-
-        logging.debug(f"Built command: {cmd}")
-        return cmd
-
-    def _update_progress_from_output(self, output_line):
-        # Windows: "Processing audio chunks:   7%|█████                                     | 134400/1926339 [00:00<00:02, 652215.64it/s]"
-        # Linux: "Processing audio chunks:  73%|███████████████████████████████▌           | 1411200/1926339 [00:03<00:01, 416574.69it/s]"
-        match = re.search(r"Processing audio chunks:\s+(\d+)%|", output_line)
-        if match:
-            try:
-                progress_percentage = int(match.group(1))
-                self.progress_var.set(progress_percentage)
-                self.master.update_idletasks()
-            except (ValueError, TypeError) as e:
-                logging.warning(f"Could not convert progress value to integer: {e}")
-                logging.warning(f"Problematic line: {output_line.strip()}")
-        elif "%" in output_line:
-            logging.warning(f"Percentage character found but regex didn't match: {output_line.strip()}")
-
-    def _prepare_input_files(self, input_folder):
-        """
-        Prepares input files by creating temporary subfolders for each track.
-
-        Args:
-            input_folder: The original input folder containing audio files.
-
-        Returns:
-            A list of paths to the temporary subfolders, or None if an error occurs.
-        """
-        temp_folders = []
-        audio_files = [f for f in os.listdir(input_folder) if os.path.isfile(os.path.join(input_folder, f)) and f.lower().endswith(('.wav', '.flac', '.aif', '.aiff', '.mp3'))]
-
-        if not audio_files:
-            messagebox.showerror("Error", "No valid audio files found in the input folder.")
-            return None
-
-        for i, audio_file in enumerate(audio_files):
-            temp_folder_name = f"temp{i+1}"
-            temp_folder_path = os.path.join(input_folder, temp_folder_name)
-            os.makedirs(temp_folder_path, exist_ok=True)
-
-            source_path = os.path.join(input_folder, audio_file)
-            destination_path = os.path.join(temp_folder_path, audio_file)
-            shutil.copy2(source_path, destination_path)  # Copy the file to the temp folder
-
-            temp_folders.append(temp_folder_path)
-
-        return temp_folders
-
-    def _cleanup_temp_folders(self, temp_folders, output_dir):
-        """
-        Cleans up temporary folders by moving output files and deleting the folders.
-
-        Args:
-            temp_folders: A list of paths to the temporary subfolders.
-            output_dir: The final output directory.
-        """
-        for temp_folder in temp_folders:
-            try:
-                # Move output files from temp folder to final output folder
-                for item in os.listdir(temp_folder):
-                    source_item_path = os.path.join(temp_folder, item)
-                    destination_item_path = os.path.join(output_dir, item)
-                    if os.path.isfile(source_item_path):  # Only move files
-                        shutil.move(source_item_path, destination_item_path)
-
-                # Delete the empty temporary folder
-                shutil.rmtree(temp_folder)
-            except Exception as e:
-                logging.error(f"Error during cleanup of {temp_folder}: {e}")
-
-    def _run_separation(self, cmd, model_name):
-        """
-        Runs the separation process using the given command.
-
-        Args:
-            cmd: The command to execute for separation.
-            model_name: The name of the model being used.
-        """
-
-        self.status.set(f"Separating ({model_name})...")
-
-        try:
-            # Run the process without capturing output
-            subprocess.run(cmd, check=True)  # check=True raises an exception if the command fails
-            self.status.set(f"Separation of {model_name} completed successfully!")
-            logging.info(f"Separation of {model_name} completed successfully.")
-
-        except subprocess.CalledProcessError as e:
-            error_message = f"An error occurred during separation of {model_name} (return code {e.returncode}):\n{e.stderr}"
-            self.status.set(error_message)
-            logging.error(error_message)  # Log the error
-            messagebox.showerror("Error", error_message)  # Display error message
-
-        except FileNotFoundError:
-            self.status.set("Could not find inference.py script.")
-            logging.error("Could not find inference.py script.")
-            messagebox.showerror("Error", "Could not find the inference.py script. Ensure it's in the correct location.")
-        except Exception as e:
-            self.status.set(f"An unexpected error occurred: {e}")
-            logging.exception(f"An unexpected error occurred: {e}")
-            messagebox.showerror("Error", f"An unexpected error occurred: {e}")
-        finally:
-            self.master.update_idletasks()  # Update the GUI
-
-    def update_models_from_github(self):
-        models_url = "https://raw.githubusercontent.com/SiftedSand/MusicSepGUI/refs/heads/main/models.json"
-        try:
-            self.status.set("Updating models...")
-            self.master.update()
-            download_url_to_file(models_url, self.models_file)
-            self.load_models()
-            self.update_model_list()
-            self.status.set("Models updated successfully!")
-        except Exception as e:
-            self.status.set(f"Error updating models: {e}")
-
-    def open_multi_model_window(self):
-        if self.multi_model_window is None or not self.multi_model_window.master.winfo_exists():
-            self.multi_model_window = MultiModelWindow(self)
-        else:
-            self.multi_model_window.master.lift()  # Bring window to the front
-
-        # Update the list of models in the multi-model window
-        self.multi_model_window.update_model_list()
-
-    def open_ensemble_window(self):
-        EnsembleWindow(self)
-
-class MultiModelWindow:
-    def __init__(self, parent):
-        self.parent = parent
-        self.master = tk.Toplevel(parent.master)
-        self.master.title("Multi-Model Selection")
-
-        # Frame
-        self.main_frame = ttk.Frame(self.master, padding="10")
-        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        self.master.columnconfigure(0, weight=1)
-        self.master.rowconfigure(0, weight=1)
-        self.master.resizable(True, True)  # Allow resizing in both directions
-
-        # Filter Entry
-        ttk.Label(self.main_frame, text="Filter:").grid(column=0, row=0, sticky=tk.W)
-        self.filter_var = tk.StringVar()
-        self.filter_var.trace_add("write", self.update_model_list)
-        ttk.Entry(self.main_frame, textvariable=self.filter_var).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
-
-        # Model Listbox
-        self.model_list = tk.Listbox(self.main_frame, selectmode=tk.EXTENDED, exportselection=False, height=10)
-        self.model_list.grid(column=0, row=1, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
-        model_scrollbar = ttk.Scrollbar(self.main_frame, orient="vertical", command=self.model_list.yview)
-        model_scrollbar.grid(column=3, row=1, sticky=(tk.N, tk.S))
-        self.model_list.configure(yscrollcommand=model_scrollbar.set)
-        self.main_frame.columnconfigure(0, weight=1)  # Column 0 expands horizontally
-        self.main_frame.columnconfigure(1, weight=1)  # Column 1 expands horizontally
-        self.main_frame.columnconfigure(2, weight=0) # Column 2 doesn't expand
-        self.main_frame.columnconfigure(4, weight=1)  # Column 4 expands horizontally
-        self.main_frame.rowconfigure(1, weight=1)    # Row 1 expands vertically
-        self.model_list.config(width=0) # Listbox width will now adjust to fit content
-
-        # Model Order Listbox
-        ttk.Label(self.main_frame, text="Model Order:").grid(column=4, row=0, sticky=tk.W)
-        self.order_list = tk.Listbox(self.main_frame, height=10)
-        self.order_list.grid(column=4, row=1, padx=5, sticky=(tk.W, tk.E, tk.N, tk.S))
-
-        # Add Model Button
-        ttk.Button(self.main_frame, text="Add ->", command=self.add_to_order).grid(column=1, row=2, pady=5)
-
-        # Remove Model Button
-        ttk.Button(self.main_frame, text="<- Remove", command=self.remove_from_order).grid(column=2, row=2, pady=5)
-
-        # Move Up Button
-        ttk.Button(self.main_frame, text="Move Up", command=lambda: self.move_in_order(-1)).grid(column=4, row=2, sticky=tk.W, pady=5)
-
-        # Move Down Button
-        ttk.Button(self.main_frame, text="Move Down", command=lambda: self.move_in_order(1)).grid(column=4, row=2, sticky=tk.E, pady=5)
-
-        # Processing Mode
-        ttk.Label(self.main_frame, text="Mode:").grid(column=0, row=3, sticky=tk.W, pady=(5, 0))
-        self.processing_mode = tk.StringVar(value="Sequential")  # Default mode
-        tk.Radiobutton(self.main_frame, text="Sequential", variable=self.processing_mode, value="Sequential").grid(column=1, row=3, sticky=tk.W, pady=(5, 0))
-        tk.Radiobutton(self.main_frame, text="Independent", variable=self.processing_mode, value="Independent").grid(column=2, row=3, sticky=tk.W, pady=(5, 0))
-
-        # Process Button
-        ttk.Button(self.main_frame, text="Process", command=self.process_multi_model).grid(column=4, row=3, pady=5)
-
-        # Close Button
-        ttk.Button(self.main_frame, text="Close", command=self.close_window).grid(column=0, row=4, pady=5)
-
-        ttk.Entry(self.main_frame, textvariable=self.filter_var).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5) # Sticky expands to fill the space in the resizable mainframe
-
-        self.master.geometry("800x400") # Initial size, but user can resize
-
-        self.update_model_list()
-
-    def update_model_list(self, *args):
-        self.model_list.delete(0, tk.END)
-        filter_text = self.filter_var.get().lower()
-
-        sorted_models = sorted(self.parent.model_info.items(), key=lambda item: (item[1].get('SORT', ''), item[0].lower()))
-
-        current_category = None
-        for model_name, model_data in sorted_models:
-            model_category = model_data.get('SORT', '')
-            display_name = model_name
-
-            if filter_text and filter_text not in model_name.lower() and filter_text not in model_category.lower():
-                continue
-
-            if model_category != current_category:
-                if model_category:
-                    self.model_list.insert(tk.END, f"--- {model_category} ---")
-                    self.model_list.itemconfig(tk.END, {'fg': 'blue'})
-                current_category = model_category
-
-            self.model_list.insert(tk.END, display_name)
-
-    def add_to_order(self):
-        selected_indices = self.model_list.curselection()
-        for i in selected_indices:
-            model = self.model_list.get(i)
-            if not model.startswith("---") and model not in self.order_list.get(0, tk.END):
-                self.order_list.insert(tk.END, model)
-
-    def remove_from_order(self):
-        selected_indices = self.order_list.curselection()
-        for i in reversed(selected_indices):  # Reverse to avoid index issues
-            self.order_list.delete(i)
-
-    def move_in_order(self, direction):
-        selected_indices = self.order_list.curselection()
-        for i in selected_indices:
-            if 0 <= i + direction < self.order_list.size():
-                model = self.order_list.get(i)
-                self.order_list.delete(i)
-                self.order_list.insert(i + direction, model)
-                self.order_list.selection_set(i + direction)
-
-
-    def process_multi_model(self):
-        ordered_models = self.order_list.get(0, tk.END)
-        if not ordered_models:
-            messagebox.showerror("Error", "Please add at least one model to the order list.")
-            return
-
-        separate_button = self.parent.main_frame.winfo_children()[-1].winfo_children()[0]
-        separate_button.config(state=tk.DISABLED)
-        multi_model_button = self.parent.main_frame.winfo_children()[1].winfo_children()[2]
-        multi_model_button.config(state=tk.DISABLED)
-
-        original_model_folder_sort = self.parent.model_folder_sort.get()
-        self.parent.model_folder_sort.set(True)  # Organize output per model
-
-        input_path = self.parent.input_path.get() # Changed to input_path
-        output_folder = self.parent.output_folder.get()
-
-        processing_mode = self.processing_mode.get()
-
-        try:
-            if processing_mode == "Sequential":
-                # Sequential mode: Use temp folders and process sequentially
-                temp_folders = self.parent._prepare_input_files(os.path.dirname(input_path) if os.path.isfile(input_path) else input_path) # Modified for single file input
-                if not temp_folders:
-                    return  # Error already handled in _prepare_input_files
-
-                for i, selected_model in enumerate(ordered_models):
-                    if selected_model not in self.parent.model_info:
-                        messagebox.showerror("Error", f"Invalid model selected: {selected_model}")
-                        return
-
-                    if not self.parent._download_model_files(selected_model):
-                        return
-
-                    current_output_folder = os.path.join(output_folder, selected_model)
-                    os.makedirs(current_output_folder, exist_ok=True)
-
-                    for temp_folder in temp_folders:
-                        track_name = os.path.splitext(os.path.basename(os.path.join(temp_folder, os.listdir(temp_folder)[0])))[0]
-                        track_output_folder = os.path.join(current_output_folder, track_name)
-                        os.makedirs(track_output_folder, exist_ok=True)
-
-                        if i == 0:  # First model
-                            cmd = self.parent._build_separation_command(selected_model, track_output_folder, temp_folder)
-                            self.parent._run_separation(cmd, selected_model)
-                        else:  # Subsequent models
-                            prev_model_output = os.path.join(output_folder, ordered_models[i - 1], track_name)
-                            if os.path.exists(prev_model_output):
-                                cmd = self.parent._build_separation_command(selected_model, track_output_folder, prev_model_output)
-                                self.parent._run_separation(cmd, selected_model)
-                            else:
-                                logging.warning(f"Output folder from previous model not found: {prev_model_output}")
-
-                self.parent._cleanup_temp_folders(temp_folders, output_folder)
-
-            elif processing_mode == "Independent":
-                # Independent mode: Process input folder directly with each model
-                for selected_model in ordered_models:
-                    if selected_model not in self.parent.model_info:
-                        messagebox.showerror("Error", f"Invalid model selected: {selected_model}")
-                        return
-
-                    if not self.parent._download_model_files(selected_model):
-                        return
-
-                    current_output_folder = os.path.join(output_folder, selected_model)
-                    os.makedirs(current_output_folder, exist_ok=True)
-
-                    cmd = self.parent._build_separation_command(selected_model, current_output_folder, input_path) # Changed to input_path
-                    self.parent._run_separation(cmd, selected_model)
-
-            else:
-                messagebox.showerror("Error", f"Invalid processing mode selected: {processing_mode}")
-                return
-
-        except Exception as e:
-            error_message = f"An unexpected error occurred during multi-model processing: {e}"
-            logging.exception(error_message)
-            messagebox.showerror("Error", error_message)
-            return
-        finally:
-            self.parent.model_folder_sort.set(original_model_folder_sort)
-            self.parent.input_path.set(input_path) # Changed to input_path
-            self.parent.save_config()
-            separate_button.config(state=tk.NORMAL)
-            multi_model_button.config(state=tk.NORMAL)
-            self.close_window()
-
-    def close_window(self):
-        self.parent.multi_model_window = None  # Allow the window to be opened again
-        self.master.destroy()
-
-class EnsembleWindow:
-    def __init__(self, parent):
-        self.parent = parent
-        self.master = tk.Toplevel(parent.master)
-        self.master.title("Ensemble Mode")
-
-        self.ensemble_frame = ttk.Frame(self.master, padding="10")
-        self.ensemble_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        self.master.columnconfigure(0, weight=1)
-        self.master.rowconfigure(0, weight=1)
-
-        # Ensemble Type
-        ttk.Label(self.ensemble_frame, text="Ensemble Type:").grid(column=0, row=0, sticky=tk.W)
-        self.ensemble_type = tk.StringVar(value="avg_wave")
-        ensemble_types = ["avg_wave", "median_wave", "min_wave", "max_wave", "avg_fft", "median_fft", "min_fft", "max_fft"]
-        self.ensemble_type_combo = ttk.Combobox(self.ensemble_frame, textvariable=self.ensemble_type, values=ensemble_types, width=15)
-        self.ensemble_type_combo.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
-
-        # Input Files Frame
-        self.input_files_frame = ttk.LabelFrame(self.ensemble_frame, text="Input Files (Select the 'other' stem from each model)", padding="10")
-        self.input_files_frame.grid(column=0, row=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-        self.input_files_frame.columnconfigure(1, weight=1)  # Allow the column with file entries to expand
-        for i in range(10):  # Assuming 10 is the maximum number of input files
-            self.input_files_frame.rowconfigure(i, weight=0)  # Allow rows to expand if needed
-            self.input_files_frame.grid(column=0, row=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
-
-        self.ensemble_frame.columnconfigure(0, weight=1)
-        self.ensemble_frame.rowconfigure(1, weight=1)  # Make row 1 (input_files_frame) expand
-
-        self.input_files = []
-        self.weights = []
-        self.create_input_file_widgets(10)  # Create widgets for up to 10 input files
-
-        # Output File
-        ttk.Label(self.ensemble_frame, text="Output File:").grid(column=0, row=2, sticky=tk.W)
-        self.output_file = tk.StringVar(value=os.path.join(self.parent.output_folder.get(), "ensemble_output.wav"))
-        self.output_entry = ttk.Entry(self.ensemble_frame, width=40, textvariable=self.output_file)
-        self.output_entry.grid(column=1, row=2, sticky=(tk.W, tk.E), padx=5)
-
-        # Make the column with the output entry expand
-        self.ensemble_frame.columnconfigure(1, weight=1)
-
-        # Button Frame
-        button_frame = ttk.Frame(self.ensemble_frame)
-        button_frame.grid(column=0, row=4, columnspan=2, sticky=(tk.W, tk.E), pady=5)
-        button_frame.columnconfigure(0, weight=1)
-
-        # Process Button
-        ttk.Button(button_frame, text="Process", command=self.process_ensemble).grid(column=0, row=0, sticky=tk.W, padx=5)
-
-        # Close Button
-        ttk.Button(button_frame, text="Close", command=self.master.destroy).grid(column=1, row=0, sticky=tk.W, padx=5)
-
-        self.master.geometry("700x600")
-
-    def create_input_file_widgets(self, num_files):
-        for i in range(num_files):
-            ttk.Label(self.input_files_frame, text=f"Input File {i + 1}:").grid(column=0, row=i, sticky=tk.W)
-            input_file_var = tk.StringVar()
-            ttk.Entry(self.input_files_frame, width=30, textvariable=input_file_var).grid(column=1, row=i, sticky=(tk.W, tk.E), padx=5)
-            self.input_files.append(input_file_var)
-
-            ttk.Button(self.input_files_frame, text="Browse", command=lambda i=i: self.browse_input_file(i)).grid(column=2, row=i)
-
-            ttk.Label(self.input_files_frame, text=f"Weight:").grid(column=3, row=i, sticky=tk.W)
-            weight_var = tk.IntVar(value=1)
-            self.weights.append(weight_var)
-
-            # Add an Entry widget for the weight
-            weight_entry = ttk.Entry(self.input_files_frame, width=5, textvariable=weight_var)
-            weight_entry.grid(column=4, row=i, sticky=(tk.W, tk.E))
-
-            # Add the Scale widget (optional - you can keep it or remove it)
-            ttk.Scale(self.input_files_frame, from_=1, to=10, variable=weight_var, orient=tk.HORIZONTAL).grid(column=5, row=i, sticky=(tk.W, tk.E))
-
-    def browse_input_file(self, index):
-        file_path = filedialog.askopenfilename(
-            initialdir=self.parent.output_folder.get(),
-            title="Select Input File",
-            filetypes=(("Audio Files", "*.wav *.flac *.mp3"), ("All Files", "*.*"))
-        )
-        if file_path:
-            self.input_files[index].set(file_path)
-            self.master.focus_set()  # Keep focus on the Ensemble window
-
-    def process_ensemble(self):
-        ensemble_type = self.ensemble_type.get()
-        output_file = self.output_file.get()
-        input_files = [f.get() for f in self.input_files if f.get()]
-        weights = [w.get() for w in self.weights][:len(input_files)]
-
-        if not all(input_files):
-            messagebox.showerror("Error", "Please specify all input files.")
-            return
-
-        if not output_file:
-            messagebox.showerror("Error", "Please specify an output file.")
-            return
-
-        if not os.path.exists("ensemble.py"):
-            messagebox.showerror("Error", "Could not find ensemble.py. Ensure it's in the correct location")
-            return
-
-        cmd = [
-            sys.executable,
-            "ensemble.py",
-            "--type", ensemble_type,
-            "--output", output_file,
-            "--files"
-        ]
-        cmd.extend(input_files)
-        cmd.append("--weights")
-        cmd.extend(map(str, weights))
-
-        try:
-            self.parent.status.set("Running ensemble...")
-            self.master.update()
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            self.parent.status.set("Ensemble process completed.")
-            messagebox.showinfo("Ensemble", "Ensemble process completed successfully!")
-        except subprocess.CalledProcessError as e:
-            self.parent.status.set(f"Ensemble process failed: {e.stderr}")
-            messagebox.showerror("Error", f"Ensemble process failed:\n{e.stderr}")
-        except Exception as e:
-            self.parent.status.set(f"An unexpected error occurred: {e}")
-            messagebox.showerror("Error", f"An unexpected error occurred:\n{e}")
-
-root = tk.Tk()
-
-def on_closing():
-    try:
-        if gui.temp_config_path:
-            os.remove(gui.temp_config_path)
-    except (AttributeError, FileNotFoundError):
-        pass  # Handle cases where temp_config_path is not set or file doesn't exist.
-    root.destroy()
-
-root.protocol("WM_DELETE_WINDOW", on_closing)
-
-gui = MusicSeparationGUI(root)
-root.mainloop()
+import time
+_START_TIME = time.perf_counter()  # Reported by the startup-time command
+
+try:
+    import tkinter as tk
+    from tkinter import filedialog, ttk, messagebox
+except ImportError:  # Headless installs can still use the command line
+    tk = None
+import os
+import subprocess
+import sys
+import json
+import logging
+import re
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+import concurrent.futures
+import pathlib
+import atexit
+import socket
+import shutil
+import threading
+import queue
+import collections
+import copy
+import hashlib
+import traceback
+import argparse
+import gc
+import bisect
+import sqlite3
+import struct
+
+#logging.basicConfig(filename='music_separation.log', level=logging.DEBUG,
+#                    format='%(asctime)s - %(levelname)s - %(message)s')
+
+# tqdm line printed by inference.py for every track, e.g.
+# "Processing audio chunks:  73%|███████▌    | 1411200/1926339 [00:03<00:01, 416574.69it/s]"
+PROGRESS_RE = re.compile(r"Processing audio chunks:\s+(\d+)%")
+
+AUDIO_EXTENSIONS = ('.wav', '.flac', '.aif', '.aiff', '.mp3')
+
+MODELS_URL = "https://raw.githubusercontent.com/SiftedSand/MusicSepGUI/refs/heads/main/models.json"
+
+# Modules the GUI process must not import at start-up (they cost seconds and the
+# separation itself runs in another process anyway)
+HEAVY_MODULES = ('torch', 'yaml', 'numpy')
+STARTUP_PROBE_ENV = 'MUSICSEPGUI_STARTUP_PROBE'
+
+def stage_link(source, destination):
+    """
+    Makes source available as destination without copying it: a hardlink, else a symlink
+    (other filesystem), and only as a last resort a copy.
+    """
+    try:
+        os.link(source, destination)
+        return
+    except OSError:
+        pass
+    try:
+        os.symlink(os.path.abspath(source), destination)
+    except OSError:  # e.g. Windows without the symlink privilege
+        shutil.copy2(source, destination)
+
+def pid_alive(pid):
+    """Returns whether a process with this pid is running on this machine."""
+    if os.name == 'nt':
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # Exists, but belongs to someone else
+    return True
+
+class ScratchSpace:
+    """
+    Private scratch folders for staging inputs, outside the user's folders.
+
+    Every process works in its own root/run-<pid>-<id>/ folder, removed by cleanup() (and
+    at exit). Folders left behind by a crashed process are removed the next time a
+    ScratchSpace is created on the same root.
+    """
+
+    STALE_SECONDS = 24 * 3600  # For folders of other machines sharing the root
+
+    def __init__(self, root):
+        self.root = root
+        self.run_dir = None
+        self.lock = threading.Lock()
+        self.sweep()
+        atexit.register(self.cleanup)
+
+    def new_dir(self, prefix='stage-'):
+        """Returns a new, empty folder inside this process's run folder."""
+        with self.lock:
+            if self.run_dir is None or not os.path.isdir(self.run_dir):
+                os.makedirs(self.root, exist_ok=True)
+                self.run_dir = tempfile.mkdtemp(prefix=f'run-{os.getpid()}-', dir=self.root)
+                with open(os.path.join(self.run_dir, 'owner.json'), 'w', encoding='utf-8') as f:
+                    json.dump({'pid': os.getpid(), 'host': socket.gethostname()}, f)
+        return tempfile.mkdtemp(prefix=prefix, dir=self.run_dir)
+
+    def stage(self, paths):
+        """
+        Returns an inference.py input holding exactly paths: the file itself when there is
+        only one, otherwise a scratch folder of links to them (release it when done).
+        """
+        if len(paths) == 1:
+            return paths[0]
+        staging_dir = self.new_dir()
+        for path in paths:
+            stage_link(path, os.path.join(staging_dir, os.path.basename(path)))
+        return staging_dir
+
+    def release(self, path):
+        """Removes a folder made by new_dir or stage; other paths are left alone."""
+        run_dir = self.run_dir
+        if run_dir and os.path.dirname(os.path.abspath(path)) == os.path.abspath(run_dir):
+            shutil.rmtree(path, ignore_errors=True)
+
+    def cleanup(self):
+        with self.lock:
+            if self.run_dir is not None:
+                shutil.rmtree(self.run_dir, ignore_errors=True)
+                self.run_dir = None
+
+    def sweep(self):
+        """Removes run folders whose process is gone."""
+        if not os.path.isdir(self.root):
+            return
+        host = socket.gethostname()
+        for name in os.listdir(self.root):
+            run_dir = os.path.join(self.root, name)
+            if not name.startswith('run-') or not os.path.isdir(run_dir):
+                continue
+            try:
+                with open(os.path.join(run_dir, 'owner.json'), 'r', encoding='utf-8') as f:
+                    owner = json.load(f)
+                if owner['host'] == host:
+                    stale = owner['pid'] != os.getpid() and not pid_alive(owner['pid'])
+                else:
+                    stale = time.time() - os.stat(run_dir).st_mtime > self.STALE_SECONDS
+            except (OSError, ValueError, KeyError):
+                # Crashed before writing its owner file
+                stale = time.time() - os.stat(run_dir).st_mtime > 60
+            if stale:
+                logging.info(f"Removing leftover scratch folder {run_dir}")
+                shutil.rmtree(run_dir, ignore_errors=True)
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class DownloadError(Exception):
+    """Raised when a download fails or doesn't match the expected size or sha256."""
+
+def download_url(url, file_path, on_progress=None, chunk_size=1024 * 1024, expected_size=None, sha256=None, cancel_event=None):
+    """
+    Streams url to file_path in chunks, resuming an earlier attempt if there is one.
+
+    The data goes to file_path + '.part', which is only renamed to file_path once it is
+    complete and verified, so an interrupted download never leaves a file that looks
+    finished. The next call continues the .part file with an HTTP Range request (or starts
+    over if the server doesn't support ranges).
+
+    Args:
+        url: The URL to download (http(s):// or file://).
+        file_path: Where to save it.
+        on_progress: Called with (bytes_done, bytes_total) after every chunk; bytes_total
+            is 0 when the size is unknown.
+        chunk_size: Bytes read per chunk.
+        expected_size: If given, the size the finished file must have.
+        sha256: If given, the hex digest the finished file must have.
+        cancel_event: A threading.Event; when set, the download stops (raising
+            JobCancelled) and the .part file is kept for resuming.
+
+    Raises:
+        DownloadError: The file didn't match expected_size or sha256 (the .part file is
+            deleted so the next attempt starts over).
+    """
+    part_path = file_path + '.part'
+    done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+    headers = {'User-Agent': 'MusicSepGUI'}
+    if done and not (expected_size and done >= expected_size):
+        headers['Range'] = f'bytes={done}-'
+    if not (expected_size and done >= expected_size):
+        try:
+            response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60)
+        except urllib.error.HTTPError as e:
+            if e.code != 416:  # 416: nothing left to fetch, the .part file is already complete
+                raise
+            response = None
+
+        if response is not None:
+            with response:
+                if done and getattr(response, 'status', None) != 206:
+                    done = 0  # Range ignored (or file://), start over
+                length = int(response.headers.get('Content-Length') or 0)
+                total = expected_size or (done + length if length else 0)
+                with open(part_path, 'ab' if done else 'wb') as f:
+                    while True:
+                        if cancel_event is not None and cancel_event.is_set():
+                            raise JobCancelled()
+                        chunk = response.read(chunk_size)
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        done += len(chunk)
+                        if on_progress:
+                            on_progress(done, total)
+
+    if expected_size and os.path.getsize(part_path) != expected_size:
+        size = os.path.getsize(part_path)
+        if size > expected_size:
+            os.remove(part_path)
+        raise DownloadError(f"{os.path.basename(file_path)}: got {size} bytes, expected {expected_size}")
+    if sha256 and file_sha256(part_path) != sha256.lower():
+        os.remove(part_path)
+        raise DownloadError(f"{os.path.basename(file_path)}: sha256 mismatch")
+    os.replace(part_path, file_path)
+
+class DownloadManager:
+    """
+    Fetches model files into a folder: resumable, verified and atomic (see download_url),
+    several at a time, and from a local mirror first when one is configured.
+
+    The mirror is a directory or a base URL (file://, http://...) holding the files under
+    their models.json names. Files missing from the mirror come from their public URL.
+    """
+
+    def __init__(self, target_dir='ckpts', mirror=None, max_workers=2, on_status=None, cancel_event=None, store=None):
+        self.target_dir = target_dir
+        self.mirror = mirror
+        self.store = store  # CheckpointStore recording use, enforcing the quota and holding the shared tier
+        self.max_workers = max_workers
+        self.on_status = on_status
+        self.cancel_event = cancel_event
+        self.locks = collections.defaultdict(threading.Lock)  # One download per file at a time
+        self.locks_lock = threading.Lock()
+        self.executor = None  # Started with the first background download
+        self.pending = {}  # filename -> Future of a queued or running download
+
+    def fetch(self, url, filename, sha256=None, size=None):
+        """
+        Makes sure filename is in target_dir, downloading it if needed.
+
+        Returns:
+            The local path of the file.
+
+        Raises:
+            DownloadError, OSError: The file couldn't be downloaded from anywhere.
+        """
+        os.makedirs(self.target_dir, exist_ok=True)
+        file_path = os.path.join(self.target_dir, filename)
+        with self.locks_lock:
+            lock = self.locks[file_path]
+        with lock:
+            if os.path.exists(file_path):
+                if size is None or os.path.getsize(file_path) == size:
+                    self._status(f"File '{filename}' already exists.")
+                    if self.store:
+                        self.store.touch(filename)
+                    return file_path
+                logging.warning(f"'{filename}' has the wrong size, downloading it again")
+                os.remove(file_path)
+
+            shared_path = self.store.shared_path(filename, size) if self.store else None
+            if shared_path and not self.store.make_room(os.path.getsize(shared_path), keep=(filename,)):
+                # No room in the local tier: use the shared copy where it is
+                self._status(f"Using '{filename}' from the shared store.")
+                self.store.touch(filename, shared_path)
+                return shared_path
+            if self.store and size:
+                self.store.make_room(size, keep=(filename,))
+
+            errors = []
+            sources = self._sources(url, filename)
+            if shared_path:
+                sources = [pathlib.Path(os.path.abspath(shared_path)).as_uri(), *sources]
+            for source in sources:
+                try:
+                    self._status(f"Downloading '{filename}'...")
+                    download_url(source, file_path, self._progress_reporter(filename),
+                                 expected_size=size, sha256=sha256, cancel_event=self.cancel_event)
+                    self._status(f"File '{filename}' downloaded successfully")
+                    if self.store:
+                        self.store.touch(filename)
+                        self.store.make_room(0, keep=(filename,))
+                    return file_path
+                except (DownloadError, OSError) as e:
+                    logging.warning(f"Could not download '{filename}' from {source}: {e}")
+                    errors.append(e)
+            raise errors[-1]
+
+    def submit(self, url, filename, sha256=None, size=None):
+        """
+        Queues a background fetch; at most max_workers run at once, in submission order.
+
+        Returns:
+            A Future whose result is the local path, or the exception that stopped the
+            download. Submitting a file that is already queued returns the same Future.
+        """
+        with self.locks_lock:
+            future = self.pending.get(filename)
+            if future is not None and not future.done():
+                return future
+            if self.executor is None:
+                self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, self.max_workers),
+                                                                      thread_name_prefix='download')
+            future = self.pending[filename] = self.executor.submit(self._fetch_or_error, url, filename, sha256, size)
+            return future
+
+    def fetch_many(self, items):
+        """
+        Fetches several files concurrently, waiting for all of them.
+
+        Args:
+            items: (url, filename, sha256, size) tuples.
+
+        Returns:
+            A list with the local path of every item, or the exception that stopped it.
+        """
+        futures = [self.submit(*item) for item in items]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        """Drops queued downloads; running ones stop at their next chunk if cancel_event is set."""
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _fetch_or_error(self, url, filename, sha256=None, size=None):
+        try:
+            return self.fetch(url, filename, sha256, size)
+        except (DownloadError, OSError, JobCancelled) as e:
+            return e
+
+    def _sources(self, url, filename):
+        mirror = self.mirror
+        if mirror:
+            if '://' not in mirror:
+                mirror = pathlib.Path(os.path.abspath(mirror)).as_uri()
+            yield mirror.rstrip('/') + '/' + urllib.parse.quote(filename)
+        yield url
+
+    def _progress_reporter(self, filename):
+        last_step = None
+
+        def on_progress(done, total):
+            # Only report whole percents (or whole MB when the size is unknown)
+            nonlocal last_step
+            step = int(100 * done / total) if total else done // 1024 ** 2
+            if step != last_step:
+                last_step = step
+                unit = "%" if total else " MB"
+                self._status(f"Downloading '{filename}'... {step}{unit}")
+        return on_progress
+
+    def _status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+class CheckpointStore:
+    """
+    Keeps ckpts/ within a disk quota and records how each model file is used.
+
+    A usage index (ckpts/.usage.json) holds the size, last use and hit count of every
+    file. When a new file needs room, the least recently used files that aren't pinned
+    are deleted. Models in saved chains are pinned so batches that rely on them never
+    have to download them again.
+
+    An optional shared store (e.g. an NFS folder filled by other machines) is read-only:
+    files found there are copied into ckpts/, which acts as a cache in front of it, or
+    used in place when the quota leaves no room. Several processes may share ckpts/;
+    the index is re-read before every update, so at worst a hit count is lost.
+    """
+
+    INDEX_NAME = '.usage.json'
+
+    def __init__(self, root='ckpts', quota_bytes=None, shared_dir=None):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        self.shared_dir = shared_dir
+        self.index_path = os.path.join(root, self.INDEX_NAME)
+        self.lock = threading.Lock()
+        self.held = collections.Counter()  # Files of the batches running in this process
+
+    def path(self, filename):
+        """Returns where a model file is: ckpts/, else the shared store, else where it will be downloaded."""
+        local_path = os.path.join(self.root, filename)
+        if not os.path.exists(local_path):
+            shared_path = self.shared_path(filename)
+            if shared_path:
+                return shared_path
+        return local_path
+
+    def shared_path(self, filename, size=None):
+        """Returns the file's path in the shared store if it is there (with the expected size)."""
+        if not self.shared_dir:
+            return None
+        shared_path = os.path.join(self.shared_dir, filename)
+        try:
+            if os.path.isfile(shared_path) and (size is None or os.path.getsize(shared_path) == size):
+                return shared_path
+        except OSError:  # The share is unreachable
+            pass
+        return None
+
+    def touch(self, filename, file_path=None):
+        """Records a use of filename (in ckpts/, or file_path for a shared file used in place)."""
+        with self.lock:
+            index = self._load()
+            entry = index['files'].setdefault(filename, {'hits': 0})
+            entry['hits'] += 1
+            entry['last_used'] = time.time()
+            entry['size'] = os.path.getsize(file_path or os.path.join(self.root, filename))
+            entry['shared'] = file_path is not None
+            self._save(index)
+
+    def pin(self, filenames):
+        with self.lock:
+            index = self._load()
+            index['pinned'] = sorted(set(index['pinned']) | set(filenames))
+            self._save(index)
+
+    def unpin(self, filenames):
+        with self.lock:
+            index = self._load()
+            index['pinned'] = sorted(set(index['pinned']) - set(filenames))
+            self._save(index)
+
+    def hold(self, filenames):
+        """Protects filenames from eviction until release(), e.g. the models of a running batch."""
+        with self.lock:
+            self.held.update(filenames)
+
+    def release(self, filenames):
+        with self.lock:
+            self.held.subtract(filenames)
+            self.held = +self.held  # Drops the files no batch holds any more
+
+    def usage(self):
+        """Returns {filename: {'size', 'last_used', 'hits', 'pinned', 'shared'}} for every known file."""
+        with self.lock:
+            index = self._load()
+        pinned = set(index['pinned'])
+        return {filename: dict(entry, pinned=filename in pinned) for filename, entry in index['files'].items()}
+
+    def make_room(self, incoming_bytes, keep=()):
+        """
+        Evicts least recently used, unpinned files until incoming_bytes more fit in the quota.
+
+        Nothing is evicted when the pinned, held and kept files alone leave too little
+        room, as the evictions wouldn't make the files fit anyway.
+
+        Args:
+            incoming_bytes: Size of the file about to be added (0 to just enforce the quota).
+            keep: Filenames never to evict (e.g. the model being loaded).
+
+        Returns:
+            True if the files fit, False if they can't even after evicting everything allowed.
+        """
+        if not self.quota_bytes:
+            return True
+        with self.lock:
+            index = self._load()
+            local = {filename: entry for filename, entry in index['files'].items() if not entry.get('shared')}
+            used = sum(entry['size'] for entry in local.values())
+            pinned = set(index['pinned']) | set(self.held) | set(keep)
+            candidates = sorted((entry.get('last_used', 0), filename) for filename, entry in local.items() if filename not in pinned)
+            if used - sum(local[filename]['size'] for _, filename in candidates) + incoming_bytes > self.quota_bytes:
+                return False
+            for _, filename in candidates:
+                if used + incoming_bytes <= self.quota_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.root, filename))
+                except FileNotFoundError:
+                    pass
+                used -= local[filename]['size']
+                del index['files'][filename]
+                logging.info(f"Evicted '{filename}' from {self.root} ({local[filename]['size'] / 1024 ** 2:.0f} MB)")
+            self._save(index)
+            return used + incoming_bytes <= self.quota_bytes
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = {}
+        index.setdefault('files', {})
+        index.setdefault('pinned', [])
+
+        # Files downloaded before the index existed count as unused since their mtime;
+        # files deleted by hand drop out
+        present = set()
+        if os.path.isdir(self.root):
+            for entry in os.scandir(self.root):
+                if entry.is_file() and not entry.name.startswith('.') and not entry.name.endswith(('.part', '.tmp')):
+                    present.add(entry.name)
+                    if entry.name not in index['files']:
+                        stat = entry.stat()
+                        index['files'][entry.name] = {'size': stat.st_size, 'last_used': stat.st_mtime, 'hits': 0}
+        for filename, entry in list(index['files'].items()):
+            if filename not in present and not (entry.get('shared') and self.shared_path(filename)):
+                del index['files'][filename]
+        return index
+
+    def _save(self, index):
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix='.usage-', suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=4)
+        os.replace(temp_path, self.index_path)
+
+class JobCancelled(Exception):
+    """Raised inside a background job when the user cancels it."""
+
+def list_audio_files(input_path):
+    """Returns the audio files of a folder (sorted), or the path itself if it is a file."""
+    if os.path.isfile(input_path):
+        return [input_path]
+    if not os.path.isdir(input_path):
+        return []
+    return [os.path.join(input_path, f) for f in sorted(os.listdir(input_path))
+            if os.path.isfile(os.path.join(input_path, f)) and f.lower().endswith(AUDIO_EXTENSIONS)]
+
+def audio_duration(path):
+    """
+    Returns the duration of a WAV or FLAC file in seconds from its header, or None for
+    other formats and unreadable files.
+    """
+    try:
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+                byte_rate = None
+                while True:
+                    chunk = f.read(8)
+                    if len(chunk) < 8:
+                        return None
+                    chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+                    if chunk_id == b'fmt ':
+                        byte_rate = struct.unpack('<HHII', f.read(12))[3]
+                        f.seek(chunk_size - 12 + (chunk_size & 1), os.SEEK_CUR)
+                    elif chunk_id == b'data':
+                        return chunk_size / byte_rate if byte_rate else None
+                    else:
+                        f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+            if header[:4] == b'fLaC':
+                # STREAMINFO is always the first metadata block
+                f.seek(4 + 4 + 10)
+                packed = int.from_bytes(f.read(8), 'big')
+                sample_rate = packed >> 44
+                total_samples = packed & ((1 << 36) - 1)
+                return total_samples / sample_rate if sample_rate and total_samples else None
+    except (OSError, struct.error):
+        pass
+    return None
+
+def verify_audio_file(path, size=None):
+    """
+    Checks that an output file looks complete: it exists, has the expected size (if
+    given) and a header that says it was finished. WAV files must hold the data their
+    header announces; FLAC files must have their total sample count filled in, which
+    encoders only do when they close the file. Other formats only need to be non-empty.
+    """
+    try:
+        actual_size = os.path.getsize(path)
+        if actual_size == 0 or (size is not None and actual_size != size):
+            return False
+        with open(path, 'rb') as f:
+            header = f.read(42)
+    except OSError:
+        return False
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        try:
+            info = AudioBlockReader._read_wav_header(path)
+        except (OSError, struct.error):
+            return False
+        return info is not None and info[5] > 0 and info[4] + info[5] <= actual_size
+    if header[:4] == b'RF64':
+        return True  # Sizes live in the ds64 chunk; trust the size check
+    if header[:4] == b'fLaC':
+        # STREAMINFO: 4 bits of the total sample count in byte 21, the other 32 in bytes 22-25
+        return len(header) >= 26 and ((header[21] & 0x0F) << 32 | struct.unpack('>I', header[22:26])[0]) > 0
+    return True
+
+def percentile(values, percent):
+    """Returns the nearest-rank percentile of values (None if there are none)."""
+    values = sorted(value for value in values if value is not None)
+    if not values:
+        return None
+    return values[max(0, -(-len(values) * percent // 100) - 1)]
+
+def iter_output_lines(stream, echo=None):
+    """
+    Yields the lines of a child's binary output stream as they arrive.
+
+    tqdm redraws its bar with carriage returns, so both '\\r' and '\\n' end a line.
+    If echo is given, the raw output is also written to it (usually the console).
+    """
+    pending = ''
+    while True:
+        chunk = stream.read1(4096) if hasattr(stream, 'read1') else stream.read(4096)
+        if not chunk:
+            break
+        text = chunk.decode('utf-8', errors='replace')
+        if echo is not None:
+            echo.write(text)
+            echo.flush()
+        parts = re.split(r'[\r\n]', pending + text)
+        pending = parts.pop()
+        for part in parts:
+            if part:
+                yield part
+    if pending:
+        yield pending
+
+def stop_process(process, timeout=5):
+    """Terminates a child process, killing it if it doesn't exit within timeout seconds."""
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+class BatchProgress:
+    """
+    Turns the tqdm chunk progress of inference.py runs into per-track and whole-batch progress.
+
+    A batch is a known number of runs (inference.py invocations). A run may process several
+    tracks, and tqdm starts again from 0% for each of them.
+    """
+
+    def __init__(self, total_runs, on_update=None):
+        self.total_runs = max(1, total_runs)
+        self.on_update = on_update
+        self.runs_done = 0
+        self.running = False
+        self.label = ''
+        self.track_count = 1
+        self.track_index = 0
+        self.track_percent = 0
+        self.last_percent = None
+
+    def start_run(self, label, track_count):
+        self.running = True
+        self.label = label
+        self.track_count = max(1, track_count)
+        self.track_index = 0
+        self.track_percent = 0
+        self.last_percent = None
+        self._notify()
+
+    def feed(self, line):
+        match = PROGRESS_RE.search(line)
+        if match:
+            self.update(int(match.group(1)))
+
+    def update(self, percent):
+        if percent == self.last_percent:
+            return
+        if self.last_percent is not None and percent < self.last_percent:
+            # tqdm restarted, so inference.py moved on to the next track
+            self.track_index = min(self.track_index + 1, self.track_count - 1)
+        self.last_percent = percent
+        self.track_percent = percent
+        self._notify()
+
+    def finish_run(self):
+        self.running = False
+        self.runs_done = min(self.runs_done + 1, self.total_runs)
+        self.track_index = self.track_count - 1
+        self.track_percent = 100
+        self.last_percent = None
+        self._notify()
+
+    @property
+    def batch_percent(self):
+        run_fraction = (self.track_index + self.track_percent / 100) / self.track_count if self.running else 0
+        return 100 * (self.runs_done + run_fraction) / self.total_runs
+
+    def _notify(self):
+        if self.on_update:
+            self.on_update(self)
+
+class ParallelProgress(BatchProgress):
+    """
+    BatchProgress for runs that happen at the same time. Each run reports to its own
+    BatchProgress from run_progress(); this one shows the latest of them and the
+    combined batch percentage.
+    """
+
+    def __init__(self, total_runs, on_update=None):
+        super().__init__(total_runs, on_update)
+        self.children = []
+        self.lock = threading.Lock()
+
+    def run_progress(self):
+        child = BatchProgress(1, self._child_updated)
+        with self.lock:
+            self.children.append(child)
+        return child
+
+    def _child_updated(self, child):
+        with self.lock:
+            running = sum(1 for c in self.children if c.running)
+            self.running = running > 0
+            self.label = f"{child.label}, {running} running" if running > 1 else child.label
+            self.track_count = child.track_count
+            self.track_index = child.track_index
+            self.track_percent = child.track_percent
+            self.runs_done = sum(c.runs_done for c in self.children)
+        self._notify()
+
+    @property
+    def batch_percent(self):
+        with self.lock:
+            return min(100, sum(c.batch_percent for c in self.children) / self.total_runs)
+
+class RunMetrics:
+    """
+    Measures one inference run per track, standing in for its BatchProgress.
+
+    Progress goes on to the wrapped BatchProgress; the moments tqdm starts over mark where
+    one track ends and the next begins, and the first progress line marks the end of
+    model loading. For child processes, the peak memory is sampled while they run.
+    """
+
+    def __init__(self, progress, model_name, tracks):
+        self.progress = progress
+        self.model_name = model_name
+        self.tracks = tracks
+        self.start = time.time()
+        self.track_starts = []
+        self.last_percent = None
+        self.peak_rss = None
+        self.exit_code = None
+        self.params = None  # Settings the memory estimate depends on (see MemoryEstimator.run_params)
+        self.estimate_mb = None
+        self.prior_mb = None
+        self.in_worker = False
+
+    def feed(self, line):
+        match = PROGRESS_RE.search(line)
+        if match:
+            self.update(int(match.group(1)))
+        self.progress.feed(line)
+
+    def update(self, percent):
+        if self.last_percent is None or percent < self.last_percent:
+            self.track_starts.append(time.time())
+        self.last_percent = percent
+        self.progress.update(percent)
+
+    def __getattr__(self, name):
+        return getattr(self.progress, name)
+
+    def watch(self, process):
+        """Samples the peak memory of process until it exits (only where /proc exists)."""
+        def sample():
+            while process.poll() is None:
+                self.peak_rss = process_peak_memory(process.pid) or self.peak_rss
+                time.sleep(0.2)
+        threading.Thread(target=sample, daemon=True).start()
+
+    def records(self, output_dir, ok):
+        """
+        Returns one metrics dict per track: audio duration, wall time (the first track's
+        includes loading the model), real-time factor, time to the first chunk, the run's
+        peak memory, bytes read and written, and the exit code.
+        """
+        end = time.time()
+        stems = {os.path.splitext(os.path.basename(track))[0]: track for track in self.tracks}
+        written = collections.Counter()
+        try:
+            for name in os.listdir(output_dir):
+                path = os.path.join(output_dir, name)
+                owner = SeparationCore._output_owner(name, stems)
+                if owner is not None and os.path.isfile(path) and os.stat(path).st_mtime >= self.start - 1:
+                    written[owner] += os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+
+        # Track i ran from its first progress line (the run's start for the first) to the next track's
+        bounds = [self.start] + self.track_starts[1:len(self.tracks)]
+        bounds += [end] * (len(self.tracks) + 1 - len(bounds))
+        first_chunk = self.track_starts[0] - self.start if self.track_starts else None
+        records = []
+        for index, (stem, track) in enumerate(stems.items()):
+            duration = audio_duration(track)
+            wall = bounds[index + 1] - bounds[index]
+            records.append({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.start)),
+                'model': self.model_name,
+                'track': os.path.basename(track),  # The path may be a link in the scratch folder
+                'output_dir': os.path.dirname(output_dir) if os.path.basename(output_dir).startswith('.batch-') else output_dir,
+                'audio_seconds': None if duration is None else round(duration, 3),
+                'wall_seconds': round(wall, 3),
+                'rtf': round(wall / duration, 4) if duration else None,
+                'first_chunk_seconds': None if first_chunk is None else round(first_chunk, 3),
+                'peak_rss_mb': None if self.peak_rss is None else round(self.peak_rss / 1024 ** 2, 1),
+                'bytes_read': os.path.getsize(track) if os.path.exists(track) else None,
+                'bytes_written': written[stem],
+                'exit_code': self.exit_code if self.exit_code is not None else (0 if ok else 1),
+                'run_tracks': len(self.tracks),
+                'worker': self.in_worker,
+                'estimate_mb': None if self.estimate_mb is None else round(self.estimate_mb, 1),
+                'prior_mb': None if self.prior_mb is None else round(self.prior_mb, 1),
+                **{key: value for key, value in (self.params or {}).items() if key != 'instruments'},
+            })
+        return records
+
+def summarize_metrics(records, cache_hits=0):
+    """Totals and per-model p50/p95 of the metrics records of a batch."""
+    summary = {
+        'tracks': len(records),
+        'cache_hits': cache_hits,
+        'failed': sum(1 for record in records if record['exit_code'] != 0),
+        'audio_seconds': round(sum(record['audio_seconds'] or 0 for record in records), 3),
+        'wall_seconds': round(sum(record['wall_seconds'] for record in records), 3),
+        'bytes_read': sum(record['bytes_read'] or 0 for record in records),
+        'bytes_written': sum(record['bytes_written'] for record in records),
+        'models': {},
+    }
+    by_model = collections.defaultdict(list)
+    for record in records:
+        by_model[record['model']].append(record)
+    for model_name, model_records in by_model.items():
+        stats = {'tracks': len(model_records)}
+        for key in ('wall_seconds', 'rtf', 'first_chunk_seconds', 'peak_rss_mb'):
+            values = [record[key] for record in model_records]
+            stats[key] = {'p50': percentile(values, 50), 'p95': percentile(values, 95)}
+        summary['models'][model_name] = stats
+    return summary
+
+def cpu_slots(count):
+    """
+    Splits the CPUs this process may use into count disjoint, contiguous slices.
+
+    Returns:
+        A list of CPU id lists (fewer than count if there are fewer CPUs).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    count = max(1, min(count, len(cpus)))
+    size, extra = divmod(len(cpus), count)
+    slots = []
+    start = 0
+    for i in range(count):
+        end = start + size + (1 if i < extra else 0)
+        slots.append(cpus[start:end])
+        start = end
+    return slots
+
+def link_or_copy(source, destination):
+    """Hardlinks source to destination, copying instead when linking isn't possible."""
+    if os.path.lexists(destination):
+        os.remove(destination)
+    try:
+        os.link(source, destination)
+    except OSError:  # Other filesystem, or links not supported
+        shutil.copy2(source, destination)
+
+class DerivedConfigStore:
+    """
+    Model configs with the chunk size, overlap, batch size and AMP setting of a job applied.
+
+    Each variant is written once to root/<config>-<key>.yaml, where key hashes the source
+    config's bytes and the parameters, so any number of jobs (or processes) can share a
+    variant and differing jobs never overwrite each other's file. Parsed source configs
+    are kept in memory. Variants not used for max_age_days, or beyond the max_files most
+    recently used, are removed.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, root, max_files=200, max_age_days=30):
+        self.root = root
+        self.max_files = max_files
+        self.max_age = max_age_days * 86400
+        self.lock = threading.Lock()
+        self.sources = {}  # (path, size, mtime_ns) -> (sha256, parsed config)
+        self.paths = {}  # key -> path of a variant this process already wrote or touched
+
+    def get(self, source_path, chunk_size=None, num_overlap=None, batch_size=None, use_amp=None):
+        """
+        Returns the path of source_path's variant with the given parameters.
+
+        Args:
+            source_path: The model's config file from ckpts/.
+            chunk_size: audio.chunk_size, or None to keep the config's.
+            num_overlap: inference.num_overlap, or None to keep the config's.
+            batch_size: inference.batch_size, or None for the config's (raised to 2 if it is 1).
+            use_amp: training.use_amp, or None for the config's (True if missing).
+        """
+        with self.lock:
+            digest, base = self._source(source_path)
+
+            params = {'chunk_size': chunk_size, 'num_overlap': num_overlap, 'batch_size': batch_size, 'use_amp': use_amp}
+            key = hashlib.sha256(json.dumps({'version': self.FORMAT_VERSION, 'source': digest, 'params': params},
+                                            sort_keys=True).encode('utf-8')).hexdigest()[:20]
+            path = self.paths.get(key)
+            if path is not None and os.path.exists(path):
+                return path
+
+            stem = os.path.splitext(os.path.basename(source_path))[0]
+            path = os.path.join(self.root, f"{stem}-{key}.yaml")
+            if os.path.exists(path):
+                os.utime(path)  # Marks it as recently used for collect()
+            else:
+                self._write(path, self._derive(base, **params))
+                logging.debug(f"Derived config written: {path}")
+                self.collect()
+            self.paths[key] = path
+            return path
+
+    def load(self, path):
+        """Returns the parsed config at path (don't modify it; it is shared)."""
+        with self.lock:
+            return self._source(path)[1]
+
+    def _source(self, source_path):
+        import yaml  # Only needed when the parameters are customised
+
+        stat = os.stat(source_path)
+        source = self.sources.get((source_path, stat.st_size, stat.st_mtime_ns))
+        if source is None:
+            with open(source_path, 'rb') as f:
+                raw = f.read()
+            source = (hashlib.sha256(raw).hexdigest(), yaml.safe_load(raw) or {})
+            self.sources[(source_path, stat.st_size, stat.st_mtime_ns)] = source
+        return source
+
+    def _derive(self, base, chunk_size, num_overlap, batch_size, use_amp):
+        data = copy.deepcopy(base)  # The parsed source is shared by every variant
+        # Ensure necessary sections exist
+        for section in ('training', 'audio', 'inference'):
+            if not isinstance(data.get(section), dict):
+                data[section] = {}
+
+        if use_amp is not None:
+            data['training']['use_amp'] = use_amp
+        elif 'use_amp' not in data['training']:
+            data['training']['use_amp'] = True
+        # None keeps the value from the model's config
+        if chunk_size is not None:
+            data['audio']['chunk_size'] = chunk_size
+        if num_overlap is not None:
+            data['inference']['num_overlap'] = num_overlap
+        if batch_size is not None:
+            data['inference']['batch_size'] = batch_size
+        elif data['inference'].get('batch_size') == 1:  # Only update batch size if necessary
+            data['inference']['batch_size'] = 2
+        return data
+
+    def _write(self, path, data):
+        import yaml
+
+        os.makedirs(self.root, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.root, prefix='.incoming-', suffix='.yaml')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                yaml.safe_dump(data, f, default_flow_style=False, sort_keys=False, indent=4)
+            os.replace(temp_path, path)  # Another process writing the same variant writes the same bytes
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def collect(self):
+        """Removes variants unused for max_age, then the least recently used beyond max_files."""
+        try:
+            names = [name for name in os.listdir(self.root) if name.endswith('.yaml')]
+        except FileNotFoundError:
+            return
+        files = []
+        for name in names:
+            path = os.path.join(self.root, name)
+            try:
+                files.append((os.stat(path).st_mtime, path))
+            except FileNotFoundError:
+                continue
+        files.sort(reverse=True)
+        now = time.time()
+        for index, (mtime, path) in enumerate(files):
+            if index >= self.max_files or now - mtime > self.max_age:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+class TuningStore:
+    """
+    Auto-tuned chunk_size, num_overlap and batch_size per model and machine.
+
+    Settings are kept in one JSON file under "<model>@<host>", so a tuning file on a
+    shared drive serves several machines, each with its own values.
+    """
+
+    def __init__(self, path, host=None):
+        self.path = path
+        self.host = host or socket.gethostname()
+        self.lock = threading.Lock()
+        self.data = None  # Read on first use
+
+    def get(self, model_name):
+        """Returns the tuned settings of model_name on this host, or None if it wasn't tuned here."""
+        with self.lock:
+            return self._load().get(f"{model_name}@{self.host}")
+
+    def put(self, model_name, settings):
+        with self.lock:
+            self.data = None  # Pick up what other machines saved meanwhile
+            data = self._load()
+            data[f"{model_name}@{self.host}"] = settings
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.json')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4, sort_keys=True)
+            os.replace(temp_path, self.path)
+
+    def _load(self):
+        if self.data is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.data = json.load(f)
+            except FileNotFoundError:
+                self.data = {}
+            except ValueError as e:
+                logging.warning(f"Ignoring unreadable tuning file {self.path}: {e}")
+                self.data = {}
+        return self.data
+
+def process_peak_memory(pid):
+    """Returns the peak resident memory of a running process in bytes, or None where /proc isn't available."""
+    try:
+        with open(f"/proc/{pid}/status", 'r') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+def physical_memory_bytes():
+    """Returns the machine's RAM in bytes, or None if it can't be determined."""
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class MemoryEstimator:
+    """
+    Estimates the peak memory of an inference.py run from its settings.
+
+    The prior is a rough model per model type: a fixed part (weights, framework), a part
+    that grows with the samples processed at once (chunk_size x batch_size, more with TTA)
+    and a part that grows with the longest track (the mix and one result buffer per stem,
+    padded by the overlap border). It is scaled by how far off it was for earlier runs:
+    the 90th percentile of measured/estimated peak memory in the metrics records of the
+    same model (else the same model type), so the estimates follow what this machine
+    actually sees.
+    """
+
+    # Model type -> (fixed MB, MB per million samples in a batch)
+    PRIORS = {
+        'bs_roformer': (1200, 2600),
+        'mel_band_roformer': (1200, 2600),
+        'mdx23c': (900, 700),
+        'htdemucs': (900, 900),
+        'scnet': (900, 1200),
+    }
+    DEFAULT_PRIOR = (1000, 1000)
+    TTA_FACTOR = 1.5
+    MB_PER_STEREO_SECOND = 44100 * 2 * 4 / 1024 ** 2  # float32
+    HISTORY = 50  # Most recent records per model used for calibration
+    MIN_FACTOR, MAX_FACTOR = 0.25, 4.0
+    # An ensemble_audio process: interpreter and numpy, plus the blocks and spectra per input
+    ENSEMBLE_BASE_MB, ENSEMBLE_INPUT_MB = 64, 16
+
+    def __init__(self, metrics_file=None):
+        self.metrics_file = metrics_file
+        self.ratios = None  # (model, use_tta) and (model_type, use_tta) -> measured / estimated peaks
+        self.lock = threading.Lock()
+
+    @classmethod
+    def ensemble_mb(cls, inputs):
+        """Returns the peak memory of ensembling inputs files with ensemble_audio (blocks of 65536 frames)."""
+        return cls.ENSEMBLE_BASE_MB + cls.ENSEMBLE_INPUT_MB * inputs
+
+    @staticmethod
+    def run_params(config, model_type, use_tta):
+        """Returns the settings of a run that its memory depends on, from its parsed config."""
+        audio = config.get('audio') or {}
+        inference = config.get('inference') or {}
+        instruments = (config.get('training') or {}).get('instruments') or ['', '']
+        return {
+            'model_type': model_type,
+            'chunk_size': audio.get('chunk_size', 485100),
+            'batch_size': inference.get('batch_size', 1),
+            'num_overlap': inference.get('num_overlap', 4),
+            'use_tta': use_tta,
+            'instruments': len(instruments),
+        }
+
+    def prior(self, params, audio_seconds):
+        """Returns the uncalibrated peak estimate in MB for a run over tracks up to audio_seconds long."""
+        fixed, per_msample = self.PRIORS.get(params['model_type'], self.DEFAULT_PRIOR)
+        activations = per_msample * params['chunk_size'] * params['batch_size'] / 1e6
+        if params['use_tta']:
+            activations *= self.TTA_FACTOR
+        # Result buffers are padded by the chunk minus one step on both sides
+        border = params['chunk_size'] - params['chunk_size'] // max(1, params['num_overlap'])
+        seconds = (audio_seconds or 0) + 2 * border / 44100
+        buffers = self.MB_PER_STEREO_SECOND * seconds * (1 + 2 * params['instruments'])
+        return fixed + activations + buffers
+
+    def estimate(self, model_name, params, audio_seconds):
+        """Returns (calibrated estimate in MB, prior in MB)."""
+        prior = self.prior(params, audio_seconds)
+        return prior * self.factor(model_name, params), prior
+
+    def factor(self, model_name, params):
+        with self.lock:
+            if self.ratios is None:
+                self._load()
+            for key in ((model_name, params['use_tta']), (params['model_type'], params['use_tta'])):
+                ratios = self.ratios.get(key)
+                if ratios:
+                    # Bounded, so a few odd runs can't make the estimates meaningless
+                    return min(max(percentile(list(ratios), 90), self.MIN_FACTOR), self.MAX_FACTOR)
+        return 1.0
+
+    def add(self, records):
+        """Learns from the metrics records of a finished run (see RunMetrics.records)."""
+        with self.lock:
+            if self.ratios is not None:
+                for record in records:
+                    self._learn(record)
+
+    def _learn(self, record):
+        # Worker runs report the worker's peak, which includes the other models it keeps loaded
+        if record.get('worker') or not record.get('prior_mb') or not record.get('peak_rss_mb') or record.get('exit_code'):
+            return
+        ratio = record['peak_rss_mb'] / record['prior_mb']
+        for key in ((record['model'], record.get('use_tta')), (record.get('model_type'), record.get('use_tta'))):
+            self.ratios.setdefault(key, collections.deque(maxlen=self.HISTORY)).append(ratio)
+
+    def _load(self):
+        self.ratios = {}
+        if not self.metrics_file:
+            return
+        try:
+            with open(self.metrics_file, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self._learn(json.loads(line))
+                    except (ValueError, TypeError, KeyError):
+                        continue
+        except OSError:
+            pass
+
+class MemoryAdmission:
+    """
+    Lets concurrent runs start only while the sum of their estimated peak memory fits a
+    budget. A run is always let in when nothing else is running, so one that doesn't fit
+    on its own still runs (alone) rather than waiting forever.
+    """
+
+    def __init__(self, budget_mb):
+        self.budget_mb = budget_mb
+        self.in_use_mb = 0
+        self.running = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, estimate_mb, cancel_event=None, on_wait=None):
+        """
+        Waits until a run estimated at estimate_mb fits next to the running ones.
+
+        Args:
+            cancel_event: Stops the wait (raising JobCancelled) when set.
+            on_wait: Called once if the run has to wait.
+        """
+        with self.condition:
+            while self.running and self.in_use_mb + estimate_mb > self.budget_mb:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                if on_wait is not None:
+                    on_wait()
+                    on_wait = None
+                self.condition.wait(0.5)
+            self.in_use_mb += estimate_mb
+            self.running += 1
+
+    def release(self, estimate_mb):
+        with self.condition:
+            self.in_use_mb -= estimate_mb
+            self.running -= 1
+            self.condition.notify_all()
+
+def write_sample_clip(source_path, clip_path, seconds):
+    """
+    Writes the first seconds of a PCM WAV file to clip_path.
+
+    Returns:
+        The clip's duration in seconds, or None if source_path isn't a WAV file the
+        wave module can read (e.g. FLAC or 32-bit float), in which case nothing is written.
+    """
+    import wave
+
+    try:
+        with wave.open(source_path, 'rb') as source:
+            frames = min(source.getnframes(), int(seconds * source.getframerate()))
+            with wave.open(clip_path, 'wb') as clip:
+                clip.setparams(source.getparams())
+                clip.writeframes(source.readframes(frames))
+            return frames / source.getframerate()
+    except (wave.Error, EOFError):
+        if os.path.exists(clip_path):
+            os.remove(clip_path)
+        return None
+
+ENSEMBLE_TYPES = ("avg_wave", "median_wave", "min_wave", "max_wave", "avg_fft", "median_fft", "min_fft", "max_fft")
+
+class UnsupportedAudioError(Exception):
+    """The built-in ensemble can't read a file (or numpy is missing); ensemble.py may still manage."""
+
+class AudioBlockReader:
+    """
+    Reads blocks of an audio file as float64 (channels, frames) arrays scaled to -1..1,
+    like soundfile/librosa.load, without loading the whole file. WAV data is
+    memory-mapped, and the pages before each block are dropped again, so reading a
+    file from start to end keeps only a block resident. Other formats are streamed
+    through soundfile if it is installed.
+    """
+
+    # WAVE format tags
+    PCM = 1
+    IEEE_FLOAT = 3
+    EXTENSIBLE = 0xFFFE
+
+    def __init__(self, path):
+        try:
+            import numpy as np
+        except ImportError:
+            raise UnsupportedAudioError("numpy is not installed")
+        self.np = np
+        self.path = path
+        self.data = None
+        self.mmap = None
+        self.sound_file = None
+
+        info = self._read_wav_header(path)
+        if info is not None:
+            format_tag, self.channels, self.rate, bits, offset, size = info
+            frame_bytes = self.channels * bits // 8
+            self.frames = min(size, os.path.getsize(path) - offset) // frame_bytes if frame_bytes else 0
+            if format_tag == self.IEEE_FLOAT and bits in (32, 64):
+                dtype, self.scale = ('<f4' if bits == 32 else '<f8'), 1.0
+            elif format_tag == self.PCM and bits in (16, 32):
+                dtype, self.scale = ('<i2' if bits == 16 else '<i4'), 2.0 ** (bits - 1)
+            elif format_tag == self.PCM and bits in (8, 24):
+                dtype, self.scale = 'u1', 2.0 ** (bits - 1)
+            else:
+                raise UnsupportedAudioError(f"{path}: WAV format {format_tag} with {bits} bits")
+            self.bits = bits
+            self.offset, self.frame_bytes = offset, frame_bytes
+            if self.frames:
+                import mmap
+
+                with open(path, 'rb') as f:
+                    self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                columns = self.channels * (3 if bits == 24 else 1)
+                self.data = np.frombuffer(self.mmap, dtype=dtype, count=self.frames * columns, offset=offset).reshape(self.frames, columns)
+            return
+
+        try:
+            import soundfile
+        except ImportError:
+            raise UnsupportedAudioError(f"{path}: only WAV files can be read without the soundfile package")
+        try:
+            self.sound_file = soundfile.SoundFile(path)
+        except RuntimeError as e:  # soundfile's error for unknown formats
+            raise UnsupportedAudioError(f"{path}: {e}")
+        self.channels, self.rate, self.frames = self.sound_file.channels, self.sound_file.samplerate, self.sound_file.frames
+
+    @classmethod
+    def _read_wav_header(cls, path):
+        """Returns (format tag, channels, rate, bits, data offset, data size) of a WAV file, or None."""
+        with open(path, 'rb') as f:
+            header = f.read(12)
+            if header[:4] != b'RIFF' or header[8:12] != b'WAVE':
+                return None
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+                if chunk_id == b'fmt ':
+                    body = f.read(chunk_size + (chunk_size & 1))
+                    format_tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+                    if format_tag == cls.EXTENSIBLE and len(body) >= 26:
+                        format_tag = struct.unpack('<H', body[24:26])[0]  # First bytes of the sub-format GUID
+                    fmt = (format_tag, channels, rate, bits)
+                elif chunk_id == b'data':
+                    return fmt + (f.tell(), chunk_size) if fmt else None
+                else:
+                    f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    def read(self, start, count):
+        """Returns frames [start, start + count) as a (channels, count) array; frames outside the file are zeros."""
+        np = self.np
+        block = np.zeros((self.channels, count))
+        begin, end = max(start, 0), min(start + count, self.frames)
+        if begin >= end:
+            return block
+        if self.sound_file is not None:
+            self.sound_file.seek(begin)
+            samples = self.sound_file.read(end - begin, dtype='float64', always_2d=True)
+        elif self.bits == 24:
+            raw = self.data[begin:end].reshape(end - begin, self.channels, 3).astype(np.int32)
+            samples = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+            samples = ((samples ^ 0x800000) - 0x800000) / self.scale
+        elif self.bits == 8:
+            samples = (self.data[begin:end].astype(np.float64) - 128) / self.scale
+        else:
+            samples = self.data[begin:end].astype(np.float64) / self.scale
+        block[:, begin - start:end - start] = samples.T
+
+        if self.mmap is not None and hasattr(self.mmap, 'madvise'):
+            # Reads move forward, so the pages before this block won't be needed again soon
+            import mmap
+
+            done = (self.offset + begin * self.frame_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+            if done:
+                self.mmap.madvise(mmap.MADV_DONTNEED, 0, done)
+        return block
+
+    def close(self):
+        if self.sound_file is not None:
+            self.sound_file.close()
+        self.data = None  # Releases the buffer so the map can be closed
+        if self.mmap is not None:
+            self.mmap.close()
+
+class FloatWavWriter:
+    """Writes a 32-bit float WAV file block by block, filling in the sizes on close."""
+
+    def __init__(self, path, channels, rate):
+        self.path = path
+        self.channels = channels
+        self.frames = 0
+        self.file = open(path, 'wb')
+        self.file.write(self._header(channels, rate, 0))
+
+    def _header(self, channels, rate, frames):
+        data_size = frames * channels * 4
+        return (b'RIFF' + struct.pack('<I', 4 + 26 + 12 + 8 + data_size) + b'WAVE'
+                + b'fmt ' + struct.pack('<IHHIIHHH', 18, AudioBlockReader.IEEE_FLOAT, channels, rate, rate * channels * 4, channels * 4, 32, 0)
+                + b'fact' + struct.pack('<II', 4, frames)
+                + b'data' + struct.pack('<I', data_size))
+
+    def write(self, block):
+        """Appends a (channels, frames) array."""
+        self.file.write(block.T.astype('<f4').tobytes())
+        self.frames += block.shape[1]
+
+    def close(self, rate):
+        """Fills in the header; a file that can't be completed is removed rather than left half-written."""
+        ok = False
+        try:
+            if self.frames * self.channels * 4 > 0xFFFFFFFF - 64:
+                raise ValueError("The audio is too long for a WAV file")
+            self.file.seek(0)
+            self.file.write(self._header(self.channels, rate, self.frames))
+            ok = True
+        finally:
+            self.file.close()
+            if not ok:
+                os.remove(self.path)
+
+def _pick_by_magnitude(np, stacked, largest):
+    # The value with the largest/smallest magnitude across the inputs (axis 0), like ensemble.py's lambda_max/lambda_min
+    indices = (np.abs(stacked).argmax if largest else np.abs(stacked).argmin)(axis=0)
+    return np.take_along_axis(stacked, indices[None], axis=0)[0]
+
+def _combine_inputs(np, stacked, weights, method):
+    """Combines (inputs, ...) samples or spectra into one with ensemble.py's avg/median/min/max."""
+    if method == 'avg':
+        return (stacked * weights.reshape((-1,) + (1,) * (stacked.ndim - 1))).sum(axis=0) / weights.sum()
+    if method == 'median':
+        return np.median(stacked, axis=0)
+    return _pick_by_magnitude(np, stacked, largest=method == 'max')
+
+def ensemble_audio(files, weights, ensemble_type, output_file, block_frames=65536, cancel_event=None, on_progress=None):
+    """
+    Ensembles files into output_file like ensemble.py, a block at a time, so memory use
+    doesn't grow with the length of the tracks.
+
+    The *_wave types combine the samples directly. The *_fft types combine the STFTs
+    (2048-point Hann, hop 1024, centred with zero padding, as librosa computes them in
+    ensemble.py) and resynthesise by overlap-add; each output block only needs the
+    frames that overlap it, so the result matches a whole-file STFT.
+
+    Args:
+        files: Input audio files. Shorter ones are padded with silence.
+        weights: One weight per file (used by avg_wave and avg_fft).
+        ensemble_type: One of ENSEMBLE_TYPES.
+        output_file: A .wav file (32-bit float), or another format soundfile can write.
+        block_frames: Frames per block; rounded to a multiple of the hop.
+        cancel_event: Stops the ensemble (raising JobCancelled) when set.
+        on_progress: Called with the percentage done.
+
+    Raises:
+        UnsupportedAudioError: An input can't be read this way (try ensemble.py).
+        ValueError: The inputs don't match (channels, sample rate) or the type is unknown.
+    """
+    if ensemble_type not in ENSEMBLE_TYPES:
+        raise ValueError(f"Unknown ensemble type: {ensemble_type}")
+    if len(weights) != len(files):
+        raise ValueError("Should be equal number of weights and files")
+    readers = []
+    try:
+        for path in files:  # Opened inside the try, so the ones already open are closed if one fails
+            readers.append(AudioBlockReader(path))
+        np = readers[0].np
+        if len({reader.channels for reader in readers}) > 1:
+            raise ValueError("The input files have different numbers of channels")
+        if len({reader.rate for reader in readers}) > 1:
+            raise ValueError("The input files have different sample rates")
+        channels, rate = readers[0].channels, readers[0].rate
+        length = max(reader.frames for reader in readers)
+        weights = np.asarray(weights, dtype=np.float64)
+        method, domain = ensemble_type.split('_')
+
+        n_fft, hop = 2048, 1024
+        block_frames = max(hop, block_frames // hop * hop)
+        window = 0.5 - 0.5 * np.cos(2 * np.pi * np.arange(n_fft) / n_fft)  # Periodic Hann, as librosa uses
+        frame_count = 1 + length // hop
+
+        # ensemble.py creates the output folder too
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        temp_file = output_file + '.part'
+        if output_file.lower().endswith('.wav'):
+            writer = FloatWavWriter(temp_file, channels, rate)
+        else:
+            import soundfile
+            writer = soundfile.SoundFile(temp_file, 'w', rate, channels, format=os.path.splitext(output_file)[1][1:].upper())
+        try:
+            for start in range(0, length, block_frames):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                end = min(start + block_frames, length)
+                if domain == 'wave':
+                    block = _combine_inputs(np, np.stack([reader.read(start, end - start) for reader in readers]), weights, method)
+                else:
+                    # Frame t covers [(t - 1) * hop, (t + 1) * hop); these are the ones overlapping [start, end)
+                    first, last = start // hop, min((end - 1) // hop + 1, frame_count - 1)
+                    frames = last - first + 1
+                    segment_start = (first - 1) * hop
+                    positions = np.arange(frames)[:, None] * hop + np.arange(n_fft)
+                    spectra = np.stack([np.fft.rfft(reader.read(segment_start, (frames + 1) * hop)[:, positions] * window, axis=-1)
+                                        for reader in readers])
+                    combined = np.fft.irfft(_combine_inputs(np, spectra, weights, method), n=n_fft, axis=-1) * window
+                    signal = np.zeros((channels, (frames + 1) * hop))
+                    norm = np.zeros((frames + 1) * hop)
+                    for i in range(frames):
+                        signal[:, i * hop:i * hop + n_fft] += combined[:, i]
+                        norm[i * hop:i * hop + n_fft] += window ** 2
+                    offset = start - segment_start
+                    block, norm = signal[:, offset:offset + end - start], norm[offset:offset + end - start]
+                    nonzero = norm > np.finfo(np.float32).tiny
+                    block[:, nonzero] /= norm[nonzero]
+                if isinstance(writer, FloatWavWriter):
+                    writer.write(block)
+                else:
+                    writer.write(block.T)
+                if on_progress is not None:
+                    on_progress(int(100 * end / length))
+            if isinstance(writer, FloatWavWriter):
+                writer.close(rate)
+            else:
+                writer.close()
+            os.replace(temp_file, output_file)
+        except BaseException:
+            if isinstance(writer, FloatWavWriter):
+                writer.file.close()
+            else:
+                writer.close()
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+            raise
+    finally:
+        for reader in readers:
+            reader.close()
+
+def ensemble_py_command(ensemble_type, input_files, weights, output_file):
+    """Returns the ensemble.py command line for combining input_files into output_file."""
+    cmd = [
+        sys.executable,
+        "ensemble.py",
+        "--type", ensemble_type,
+        "--output", output_file,
+        "--files"
+    ]
+    cmd.extend(input_files)
+    cmd.append("--weights")
+    cmd.extend(map(str, weights))
+    return cmd
+
+def match_ensemble_inputs(folders, stems=None):
+    """
+    Pairs up the outputs of several models by track and stem.
+
+    Outputs are named '<track>_<stem>.<ext>' as the patched inference.py writes them,
+    either directly in each folder (Independent mode) or in per-track subfolders.
+
+    Args:
+        folders: One output folder per model.
+        stems: Stems to ensemble (case-insensitive), or None for all of them.
+
+    Returns:
+        {(track, stem): [one path per folder]} for the tracks and stems every folder has.
+    """
+    wanted = {stem.lower() for stem in stems} if stems else None
+    per_folder = []
+    for folder in folders:
+        found = {}
+        paths = list_audio_files(folder)
+        for entry in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            if os.path.isdir(os.path.join(folder, entry)):
+                paths.extend(list_audio_files(os.path.join(folder, entry)))
+        for path in paths:
+            name = os.path.splitext(os.path.basename(path))[0]
+            if '_' not in name:
+                continue
+            track, stem = name.rsplit('_', 1)
+            if wanted is None or stem.lower() in wanted:
+                found.setdefault((track, stem.lower()), path)
+        per_folder.append(found)
+    if not per_folder:
+        return {}
+    common = set(per_folder[0]).intersection(*per_folder[1:])
+    return {key: [found[key] for found in per_folder] for key in sorted(common)}
+
+def _ensemble_task(ensemble_type, input_files, weights, output_file):
+    """
+    Ensembles one track in a pool process.
+
+    Returns:
+        None on success, else the error message.
+    """
+    try:
+        ensemble_audio(input_files, weights, ensemble_type, output_file)
+        return None
+    except UnsupportedAudioError:
+        if not os.path.exists("ensemble.py"):
+            return "Could not find ensemble.py"
+        result = subprocess.run(ensemble_py_command(ensemble_type, input_files, weights, output_file), capture_output=True, text=True)
+        return None if result.returncode == 0 else result.stderr.strip()[-2000:]
+    except (ValueError, OSError) as e:
+        return str(e)
+
+def plan_segments(frames, segment_frames, overlap_frames):
+    """
+    Splits frames into segments of segment_frames that overlap their neighbours by
+    overlap_frames (the last one ends at frames).
+
+    Returns:
+        A list of (start, end) frame ranges.
+    """
+    if frames <= segment_frames:
+        return [(0, frames)]
+    step = segment_frames - overlap_frames
+    segments = []
+    start = 0
+    while start + segment_frames < frames:
+        segments.append((start, start + segment_frames))
+        start += step
+    segments.append((start, frames))
+    return segments
+
+def split_audio(reader, segments, output_dir, stem, block_frames=65536, cancel_event=None):
+    """
+    Writes the segments of an AudioBlockReader as float WAV files output_dir/<stem>.seg<i>.wav.
+
+    Returns:
+        The paths written, in segment order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for i, (start, end) in enumerate(segments):
+        path = os.path.join(output_dir, f"{stem}.seg{i:04d}.wav")
+        writer = FloatWavWriter(path, reader.channels, reader.rate)
+        try:
+            for block_start in range(start, end, block_frames):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                writer.write(reader.read(block_start, min(block_frames, end - block_start)))
+        except BaseException:
+            # Don't leave a segment with a placeholder header where a resume could find it
+            writer.file.close()
+            os.remove(path)
+            raise
+        writer.close(reader.rate)
+        paths.append(path)
+    return paths
+
+def open_audio_writer(path, channels, rate, frames, export_format='wav FLOAT'):
+    """
+    Returns a writer with write((channels, frames) block) and close(rate) for an output of
+    frames frames in export_format ('wav FLOAT' or 'flac PCM_16/24'). soundfile is used
+    when it is installed (WAV outputs past 4 GB become RF64), else WAV files are written
+    directly.
+    """
+    codec, subtype = export_format.split()
+    try:
+        import soundfile
+    except ImportError:
+        if codec != 'wav':
+            raise UnsupportedAudioError(f"{codec} output needs the soundfile package")
+        return FloatWavWriter(path, channels, rate)
+
+    if codec == 'flac':
+        file_format = 'FLAC'
+    else:
+        file_format = 'RF64' if frames * channels * 4 > 0xFFFFFFFF - 64 else 'WAV'
+    sound_file = soundfile.SoundFile(path, 'w', rate, channels, subtype, format=file_format)
+
+    class SoundFileWriter:
+        def write(self, block):
+            sound_file.write(block.T)
+
+        def close(self, rate):
+            sound_file.close()
+
+    return SoundFileWriter()
+
+def stitch_segments(segment_files, segments, output_file, crossfade_frames, export_format='wav FLOAT',
+                    input_rate=None, block_frames=65536, cancel_event=None):
+    """
+    Joins the separated segments of one stem into output_file, a block at a time.
+
+    Neighbouring segments overlap; in the middle of each overlap they are crossfaded
+    linearly over crossfade_frames, and the frames closer to a segment's edge (where the
+    model had less context) are dropped. The output is written to output_file + '.part'
+    and renamed when complete.
+
+    Args:
+        segment_files: The separated stem of each segment, in order.
+        segments: The (start, end) input frames of each segment (see plan_segments).
+        output_file: The joined stem.
+        crossfade_frames: Length of each crossfade, at most the overlap of the segments.
+        export_format: 'wav FLOAT' or 'flac PCM_16/24'.
+        input_rate: Sample rate of segments; when the separated files have another rate,
+            positions are scaled to it.
+        block_frames: Frames processed at a time.
+        cancel_event: A threading.Event; when set, JobCancelled is raised.
+    """
+    first = AudioBlockReader(segment_files[0])
+    channels, rate = first.channels, first.rate
+    first.close()
+    scale = rate / input_rate if input_rate else 1.0
+    starts = [round(start * scale) for start, _ in segments]
+    total = round(segments[-1][1] * scale)
+    crossfade = round(crossfade_frames * scale)
+
+    # Output pieces: the seam between segments i-1 and i sits in the middle of their overlap
+    pieces = []  # (begin, end, segment index, fading into the next segment)
+    begin = 0
+    for i in range(1, len(segments)):
+        overlap_end = round(segments[i - 1][1] * scale)
+        seam = (starts[i] + overlap_end) // 2
+        fade_begin, fade_end = seam - crossfade // 2, seam - crossfade // 2 + crossfade
+        pieces.append((begin, fade_begin, i - 1, False))
+        pieces.append((fade_begin, fade_end, i - 1, True))
+        begin = fade_end
+    pieces.append((begin, total, len(segments) - 1, False))
+
+    import numpy as np
+
+    part_path = output_file + '.part'
+    writer = open_audio_writer(part_path, channels, rate, total, export_format)
+    readers = {}
+    try:
+        for begin, end, i, fading in pieces:
+            for index in list(readers):
+                if index < i:
+                    readers.pop(index).close()
+            for index in (i, i + 1) if fading else (i,):
+                if index not in readers:
+                    readers[index] = AudioBlockReader(segment_files[index])
+            for block_start in range(begin, end, block_frames):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise JobCancelled()
+                count = min(block_frames, end - block_start)
+                block = readers[i].read(block_start - starts[i], count)
+                if fading:
+                    fade_in = (np.arange(block_start - begin, block_start - begin + count) + 0.5) / (end - begin)
+                    block = block * (1 - fade_in) + readers[i + 1].read(block_start - starts[i + 1], count) * fade_in
+                writer.write(block)
+        writer.close(rate)
+    except BaseException:
+        if isinstance(writer, FloatWavWriter):
+            writer.file.close()  # Not close(rate), which would write the header again
+        else:
+            writer.close(rate)
+        if os.path.exists(part_path):  # FloatWavWriter.close removes it when it can't finish
+            os.remove(part_path)
+        raise
+    finally:
+        for reader in readers.values():
+            reader.close()
+    os.replace(part_path, output_file)
+
+class BatchJournal:
+    """
+    Durable record of multi-model batches, kept in a SQLite file in the output folder.
+
+    Every planned (track, model) job of a batch is written before anything runs, with
+    the settings it runs with. Jobs move from 'planned' to 'running' to 'done' (with the
+    outputs and their sizes) or 'failed', each change committed at once, so a batch that
+    dies (a crash, power loss, the window closed) can be resumed from what the journal
+    and the outputs on disk say.
+    """
+
+    FILE_NAME = '.batch-journal.sqlite'
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, self.FILE_NAME)
+        self.lock = threading.Lock()
+        # Plain rollback journal rather than WAL: output folders may be on network shares
+        self.connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self.connection.execute("PRAGMA synchronous=FULL")
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS batches (
+                id INTEGER PRIMARY KEY, created REAL, mode TEXT, models TEXT, input_stems TEXT,
+                input_path TEXT, options TEXT, state TEXT)""")
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                batch_id INTEGER, track TEXT, model TEXT, step INTEGER, params TEXT, state TEXT,
+                outputs TEXT, updated REAL, PRIMARY KEY (batch_id, track, model))""")
+
+    def start_batch(self, mode, models, input_stems, options, jobs):
+        """
+        Records a new batch and its planned jobs.
+
+        Args:
+            jobs: (track, model, step, params) tuples.
+
+        Returns:
+            The batch id.
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO batches (created, mode, models, input_stems, input_path, options, state) VALUES (?, ?, ?, ?, ?, ?, 'running')",
+                (time.time(), mode, json.dumps(list(models)), json.dumps(input_stems), options.get('input_path', ''), json.dumps(options)))
+            batch_id = cursor.lastrowid
+            self.connection.executemany(
+                "INSERT INTO jobs (batch_id, track, model, step, params, state, outputs, updated) VALUES (?, ?, ?, ?, ?, 'planned', '[]', ?)",
+                [(batch_id, track, model, step, json.dumps(params), time.time()) for track, model, step, params in jobs])
+        return batch_id
+
+    def last_unfinished(self):
+        """Returns the newest batch that didn't finish successfully as a dict, or None."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT id, mode, models, input_stems, options, state FROM batches WHERE state != 'done' ORDER BY id DESC LIMIT 1").fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'mode': row[1], 'models': json.loads(row[2]), 'input_stems': json.loads(row[3]),
+                'options': json.loads(row[4]), 'state': row[5]}
+
+    def jobs(self, batch_id):
+        """Returns {(track, model): {'step', 'state', 'outputs'}} for a batch."""
+        with self.lock:
+            rows = self.connection.execute("SELECT track, model, step, state, outputs FROM jobs WHERE batch_id = ?", (batch_id,)).fetchall()
+        return {(track, model): {'step': step, 'state': state, 'outputs': json.loads(outputs)}
+                for track, model, step, state, outputs in rows}
+
+    def set_state(self, batch_id, model, tracks, state, outputs=None):
+        """
+        Moves the jobs of model for tracks to state.
+
+        Args:
+            outputs: Track -> its output paths, recorded with their sizes (for 'done').
+        """
+        outputs = outputs or {}
+        rows = []
+        for track in tracks:
+            files = [[path, os.path.getsize(path)] for path in outputs.get(track, []) if os.path.exists(path)]
+            rows.append((state, json.dumps(files), time.time(), batch_id, track, model))
+        with self.lock, self.connection:
+            self.connection.executemany("UPDATE jobs SET state = ?, outputs = ?, updated = ? WHERE batch_id = ? AND track = ? AND model = ?", rows)
+
+    def finish_batch(self, batch_id, ok):
+        with self.lock, self.connection:
+            self.connection.execute("UPDATE batches SET state = ? WHERE id = ?", ('done' if ok else 'failed', batch_id))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+class ResultCache:
+    """
+    Persistent, content-addressed cache of separation outputs.
+
+    An entry holds the files inference.py wrote for one track and is keyed by a hash of
+    the track's audio bytes and everything else that changes the result: model, checkpoint,
+    the effective config file and the output flags of the command. Entries live in
+    root/<key[:2]>/<key>/ and the least recently used ones are evicted once the cache
+    grows over max_bytes.
+    """
+
+    FORMAT_VERSION = 1
+    # Command line arguments whose values are paths rather than settings
+    PATH_ARGS = ('--store_dir', '--input_path', '--config_path', '--start_check_point')
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = None  # key -> [size, last_used], scanned on first use
+        self.digests = {}  # (path, size, mtime_ns) -> sha256, so unchanged inputs are hashed once
+
+    def key_for(self, model_name, track_path, cmd, post_settings=None):
+        """
+        Returns the cache key of separating track_path with the inference.py command cmd.
+
+        Args:
+            model_name: The models.json name of the model.
+            track_path: The audio file being separated.
+            cmd: The command built by SeparationCore._build_separation_command.
+            post_settings: Settings applied after inference.py (e.g. peak normalisation), if any.
+        """
+        config_path = cmd[cmd.index("--config_path") + 1]
+        checkpoint_path = cmd[cmd.index("--start_check_point") + 1]
+        checkpoint_stat = os.stat(checkpoint_path)
+
+        settings = []
+        args = iter(cmd[2:])  # Skip the interpreter and script name
+        for arg in args:
+            if arg in self.PATH_ARGS:
+                next(args, None)
+            else:
+                settings.append(arg)
+
+        identity = {
+            'version': self.FORMAT_VERSION,
+            'input': self._digest(track_path),
+            'model': model_name,
+            'checkpoint': [os.path.basename(checkpoint_path), checkpoint_stat.st_size, checkpoint_stat.st_mtime_ns],
+            # The config file as inference.py will read it, so chunk_size, num_overlap and batch_size are covered
+            'config': self._digest(config_path),
+            'settings': settings,
+        }
+        if post_settings:
+            identity['post'] = post_settings
+        return hashlib.sha256(json.dumps(identity, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def materialize(self, key, output_dir, stem):
+        """
+        Puts the cached outputs of key into output_dir.
+
+        Args:
+            key: The cache key from key_for.
+            output_dir: Where inference.py would have written the outputs.
+            stem: The track's file name without extension. Outputs are stored without
+                it, as the same audio may come back under another name.
+
+        Returns:
+            The paths written, or None on a cache miss.
+        """
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+                suffixes = json.load(f)['files']
+            os.makedirs(output_dir, exist_ok=True)
+            paths = []
+            for suffix in suffixes:
+                destination = os.path.join(output_dir, stem + suffix)
+                link_or_copy(os.path.join(entry_dir, 'out' + suffix), destination)
+                paths.append(destination)
+        except (OSError, ValueError, KeyError):
+            return None  # Missing or half-evicted entry
+
+        now = time.time()
+        os.utime(entry_dir, (now, now))  # The directory's mtime is the LRU timestamp
+        with self.lock:
+            if self.entries is not None and key in self.entries:
+                self.entries[key][1] = now
+        return paths
+
+    def store(self, key, stem, paths, meta=None):
+        """Adds the output files of one track (named stem + suffix) to the cache under key."""
+        entry_dir = self._entry_dir(key)
+        if os.path.isdir(entry_dir) or not paths:
+            return
+        os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix='.incoming-', dir=self.root)
+        try:
+            size = 0
+            suffixes = [os.path.basename(path)[len(stem):] for path in paths]
+            for path, suffix in zip(paths, suffixes):
+                link_or_copy(path, os.path.join(staging_dir, 'out' + suffix))
+                size += os.path.getsize(path)
+            with open(os.path.join(staging_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump(dict(meta or {}, files=suffixes, size=size), f)
+            os.rename(staging_dir, entry_dir)  # Atomic, so readers never see a partial entry
+        except OSError as e:
+            logging.warning(f"Could not add result to the cache: {e}")
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            return
+
+        with self.lock:
+            self._load_entries()
+            self.entries[key] = [size, time.time()]
+        self.evict()
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        with self.lock:
+            self._load_entries()
+            total = sum(size for size, _ in self.entries.values())
+            if total <= self.max_bytes:
+                return
+            for key in sorted(self.entries, key=lambda k: self.entries[k][1]):
+                if total <= self.max_bytes:
+                    break
+                total -= self.entries.pop(key)[0]
+                shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+                logging.debug(f"Evicted cached result {key}")
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def _digest(self, path):
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        digest = self.digests.get(memo_key)
+        if digest is None:
+            digest = self.digests[memo_key] = file_sha256(path)
+        return digest
+
+    def _load_entries(self):
+        # Called with self.lock held
+        if self.entries is not None:
+            return
+        self.entries = {}
+        os.makedirs(self.root, exist_ok=True)
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if prefix.startswith('.incoming-') and time.time() - os.stat(prefix_dir).st_mtime > 3600:
+                shutil.rmtree(prefix_dir, ignore_errors=True)  # Abandoned by a crashed store()
+                continue
+            if len(prefix) != 2 or not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry_dir = os.path.join(prefix_dir, key)
+                try:
+                    with open(os.path.join(entry_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+                        size = json.load(f)['size']
+                    self.entries[key] = [size, os.stat(entry_dir).st_mtime]
+                except (OSError, ValueError, KeyError):
+                    shutil.rmtree(entry_dir, ignore_errors=True)  # Left over by a crash
+
+def post_process_file(source, destination, export_format='wav FLOAT', peak_db=None, block_frames=262144):
+    """
+    Encodes a float WAV output into its final format, a block at a time.
+
+    Args:
+        source: The float WAV file inference.py wrote.
+        destination: The final file; written as destination + '.part' and renamed once
+            complete, so the output folder never holds a half-written file.
+        export_format: 'wav FLOAT' or 'flac PCM_16/24'.
+        peak_db: If given, the output is scaled so its highest peak is at this level
+            (dBFS); silent files are left alone.
+        block_frames: Frames processed at a time.
+    """
+    reader = AudioBlockReader(source)
+    try:
+        gain = 1.0
+        if peak_db is not None:
+            peak = 0.0
+            for start in range(0, reader.frames, block_frames):
+                peak = max(peak, float(abs(reader.read(start, block_frames)).max(initial=0.0)))
+            if peak > 0:
+                gain = 10 ** (peak_db / 20) / peak
+
+        part_path = destination + '.part'
+        writer = open_audio_writer(part_path, reader.channels, reader.rate, reader.frames, export_format)
+        try:
+            for start in range(0, reader.frames, block_frames):
+                block = reader.read(start, min(block_frames, reader.frames - start))
+                writer.write(block * gain if gain != 1.0 else block)
+        finally:
+            writer.close(reader.rate)
+    except BaseException:
+        if os.path.exists(destination + '.part'):
+            os.remove(destination + '.part')
+        raise
+    finally:
+        reader.close()
+    os.replace(part_path, destination)
+
+class PostProcessor:
+    """
+    Turns the float WAV outputs of an inference.py run into the final files while the run
+    goes on.
+
+    inference.py writes into a scratch folder; a watcher thread hands every output
+    whose header shows it is finished (see verify_audio_file) to a thread pool, which
+    encodes it (post_process_file) into output_dir. Encoding and normalising one track
+    thus overlaps with separating the next.
+    """
+
+    def __init__(self, scratch_dir, output_dir, export_format, peak_db=None, workers=2, poll_seconds=0.5):
+        self.scratch_dir = scratch_dir
+        self.output_dir = output_dir
+        self.export_format = export_format
+        self.peak_db = peak_db
+        self.poll_seconds = poll_seconds
+        self.extension = '.flac' if export_format.startswith('flac') else '.wav'
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='post')
+        self.futures = {}  # Output name -> Future
+        self.stop_event = threading.Event()
+        os.makedirs(output_dir, exist_ok=True)
+        self.watcher = threading.Thread(target=self._watch, daemon=True)
+        self.watcher.start()
+
+    def _watch(self):
+        while not self.stop_event.wait(self.poll_seconds):
+            self._submit_finished()
+
+    def _submit_finished(self):
+        for name in sorted(os.listdir(self.scratch_dir)):
+            path = os.path.join(self.scratch_dir, name)
+            if name in self.futures or not name.lower().endswith('.wav') or not verify_audio_file(path):
+                continue
+            destination = os.path.join(self.output_dir, os.path.splitext(name)[0] + self.extension)
+            self.futures[name] = self.pool.submit(post_process_file, path, destination, self.export_format, self.peak_db)
+
+    def finish(self, ok=True):
+        """
+        Stops watching and, if the run succeeded, post-processes what is left and waits for
+        everything to be in place.
+
+        Returns:
+            The error messages of the files that failed (empty when all went well).
+        """
+        self.stop_event.set()
+        self.watcher.join()
+        if ok:
+            self._submit_finished()
+        errors = []
+        for name, future in self.futures.items():
+            try:
+                future.result()
+            except (UnsupportedAudioError, ValueError, OSError) as e:
+                errors.append(f"{name}: {e}")
+        self.pool.shutdown()
+        return errors
+
+class ModelCatalog:
+    """
+    models.json indexed once for the model lists: names sorted per category, the
+    display order of all models, and a substring index for the filter box.
+
+    The filter index holds every suffix of every word of a model's name and category,
+    sorted, so "the name or category contains X" is a prefix lookup (bisect) instead of
+    a scan of all models. Results per filter word are memoised, so typing a longer
+    filter only intersects sets.
+    """
+
+    def __init__(self, models=None):
+        self.models = models or {}
+        self.categories = sorted({info.get('SORT', '') for info in self.models.values()})
+        self.by_category = {category: [] for category in self.categories}
+        for name in sorted(self.models, key=str.lower):
+            self.by_category[self.models[name].get('SORT', '')].append(name)
+        # Display order of the Multi-Model list: by category, then name
+        self.ordered = [name for category in self.categories for name in self.by_category[category]]
+        self.rank = {name: i for i, name in enumerate(self.ordered)}
+
+        suffixes = set()
+        for name, info in self.models.items():
+            for word in f"{name} {info.get('SORT', '')}".lower().split():
+                suffixes.update((word[i:], name) for i in range(len(word)))
+        self._suffixes = sorted(suffixes)
+        self._word_matches = {}
+
+    def __len__(self):
+        return len(self.models)
+
+    def _match_word(self, word):
+        names = self._word_matches.get(word)
+        if names is None:
+            names = set()
+            i = bisect.bisect_left(self._suffixes, (word,))
+            while i < len(self._suffixes) and self._suffixes[i][0].startswith(word):
+                names.add(self._suffixes[i][1])
+                i += 1
+            names = self._word_matches[word] = frozenset(names)
+        return names
+
+    def search(self, text):
+        """
+        Returns the models (in display order) whose name or category contains every
+        whitespace-separated word of text, ignoring case. An empty text matches all.
+        """
+        words = text.lower().split()
+        if not words:
+            return list(self.ordered)
+        names = set(self._match_word(words[0]))
+        for word in words[1:]:
+            names &= self._match_word(word)
+        return sorted(names, key=self.rank.__getitem__)
+
+    def diff(self, models):
+        """Returns the names added, removed and changed in models compared to this catalog."""
+        return {
+            'added': sorted(set(models) - set(self.models), key=str.lower),
+            'removed': sorted(set(self.models) - set(models), key=str.lower),
+            'changed': sorted((name for name in models if name in self.models and models[name] != self.models[name]), key=str.lower),
+        }
+
+def update_listbox(listbox, rows, header_prefix='--- '):
+    """
+    Makes a Listbox show rows, changing only the part that differs from what it shows now
+    (rows it keeps at the start and end are left alone). Rows starting with header_prefix
+    are category headers and drawn in blue.
+    """
+    current = listbox.get(0, 'end')
+    start = 0
+    while start < len(current) and start < len(rows) and current[start] == rows[start]:
+        start += 1
+    end_current, end_rows = len(current), len(rows)
+    while end_current > start and end_rows > start and current[end_current - 1] == rows[end_rows - 1]:
+        end_current -= 1
+        end_rows -= 1
+    if end_current > start:
+        listbox.delete(start, end_current - 1)
+    if end_rows > start:
+        listbox.insert(start, *rows[start:end_rows])
+        for i in range(start, end_rows):
+            if rows[i].startswith(header_prefix):
+                listbox.itemconfig(i, {'fg': 'blue'})
+
+class SeparationCore:
+    """
+    The separation logic without any window: models, downloads, YAML tweaks, command
+    building and the single, multi-model and ensemble flows.
+
+    Front ends fill self.options (see DEFAULT_OPTIONS) before starting a flow and pass
+    callbacks for status messages, errors and progress. The Tk GUI hands them back to
+    its own thread; the command line just logs them.
+    """
+
+    DEFAULT_OPTIONS = {
+        'input_path': '',
+        'output_folder': '',
+        'model_folder_sort': False,
+        'extract_instrumental': True,
+        'export_format': 'wav FLOAT',
+        'use_default_params': True,
+        'use_tta': False,
+        'overlap': 2,
+        'chunk_size': 352800,
+        'use_warm_worker': True,
+        'use_result_cache': True,
+        'parallel_jobs': 1,  # Independent mode: model runs at the same time, each on its own CPUs
+        'use_tuned_params': True,  # Apply auto-tuned settings saved for this machine
+        'normalize_peak': False,  # Scale every output so its peak is at normalize_peak_db in config.json
+    }
+
+    # Auto-tune grid, tried in this order; larger batches are skipped once a batch size fails
+    TUNING_CHUNK_SIZES = (352800, 485100)
+    TUNING_OVERLAPS = (2, 4)
+    TUNING_BATCH_SIZES = (1, 2, 4)
+
+    # Thread pool sizes of the libraries inference.py uses; set to the size of a job's CPU slice
+    THREAD_ENV_VARS = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'NUMEXPR_NUM_THREADS',
+                       'VECLIB_MAXIMUM_THREADS')
+
+    def __init__(self, config_file='config.json', models_file='models.json', on_status=None, on_error=None, on_progress=None):
+        self.config_file = config_file
+        self.models_file = models_file
+        self.on_status = on_status
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.echo = sys.stdout  # Where the children's console output is mirrored
+
+        # Load config (creates an empty one if it doesn't exist)
+        self.load_config()
+        self.load_models()
+
+        self.options = dict(self.DEFAULT_OPTIONS)
+        self.results = []  # One entry per inference run, for summaries
+
+        # Configs with customised chunk size/overlap, one file per variant
+        self.derived_configs = DerivedConfigStore(self.config.get('derived_config_dir', 'derived_configs'),
+                                                  self.config.get('derived_config_max_files', 200))
+        self.tuning = TuningStore(self.config.get('tuning_file', 'tuning.json'))
+
+        # Warm inference worker, started on the first separation that uses it
+        self.worker = None
+        self.worker_unsupported = False
+        self.worker_lock = threading.Lock()  # The worker runs one job at a time
+
+        # Cache of finished separations, opened on first use
+        self.result_cache = None
+        self.cache_stats = {'hits': 0, 'misses': 0}
+
+        # Per-track run metrics, appended to metrics_file and summarised per batch
+        self.metrics_file = self.config.get('metrics_file', 'metrics.jsonl')
+        self.batch_metrics = []
+        self.metrics_lock = threading.Lock()
+
+        # Runs start only while their estimated peak memory fits memory_budget_mb (default:
+        # tuning_memory_mb, else 75% of the RAM; 0 turns this off). Unless it is set, runs are
+        # only estimated while they can overlap (see _memory_checked)
+        self.memory = MemoryEstimator(self.metrics_file)
+        budget_mb = self.config.get('memory_budget_mb', self._default_memory_budget_mb())
+        self.admission = MemoryAdmission(budget_mb) if budget_mb else None
+        self.estimate_every_run = bool(self.config.get('memory_budget_mb'))
+        self.concurrent_runs = False  # Set while runs sharing self.admission may overlap
+
+        # Cancellation of the running flow; cancel() may be called from any thread
+        self.cancel_event = threading.Event()
+        self.active_processes = set()
+        self.process_lock = threading.Lock()
+        self.stats_lock = threading.Lock()  # Concurrent runs update cache_stats
+
+        # Inputs are staged as links in a scratch folder, never inside the user's folders
+        self.scratch = ScratchSpace(self.config.get('scratch_dir') or os.path.join(tempfile.gettempdir(), 'musicsepgui-scratch'))
+
+        # Model files: ckpts/ within checkpoint_quota_gb, in front of an optional read-only shared store
+        quota_gb = self.config.get('checkpoint_quota_gb')
+        self.checkpoints = CheckpointStore('ckpts', quota_gb * 1024 ** 3 if quota_gb else None,
+                                           os.environ.get('MUSICSEPGUI_SHARED_CKPTS') or self.config.get('checkpoint_shared_dir'))
+
+        # Checkpoint downloads (config.json may name a local mirror to try first)
+        self.downloader = DownloadManager('ckpts', mirror=os.environ.get('MUSICSEPGUI_MIRROR') or self.config.get('download_mirror'),
+                                          max_workers=self.config.get('download_workers', 2),
+                                          on_status=self._set_status, cancel_event=self.cancel_event,
+                                          store=self.checkpoints)
+
+    def check_and_modify_inference_py(self):
+        inference_py_path = "inference.py"
+        if not os.path.exists(inference_py_path):
+            logging.error("inference.py not found.")
+            return
+
+        with open(inference_py_path, "r", encoding='utf-8') as f:
+            code = f.read()
+
+        modified = False
+
+        # --- PATCH 1: Intercept --input_path before the parser crashes ---
+        # The standard parser doesn't know --input_path, so we steal it from sys.argv 
+        # before the parser sees it.
+        if "custom_input_path = None" not in code:
+            print("Patching inference.py: Injecting argument interceptor...")
+            
+            # We look for the start of the proc_folder function
+            target_str = "def proc_folder(dict_args):"
+            inject_str = """def proc_folder(dict_args):
+    # --- GUI PATCH START: Intercept input_path ---
+    custom_input_path = None
+    if "--input_path" in sys.argv:
+        try:
+            idx = sys.argv.index("--input_path")
+            if idx + 1 < len(sys.argv):
+                custom_input_path = sys.argv[idx + 1]
+                del sys.argv[idx:idx + 2]
+        except: pass
+    # --- GUI PATCH END ---
+"""
+            code = code.replace(target_str, inject_str)
+
+            # Re-inject the path after parsing
+            target_str_2 = "args = parse_args_inference(dict_args)"
+            inject_str_2 = """args = parse_args_inference(dict_args)
+    # --- GUI PATCH START: Restore input_path ---
+    if custom_input_path:
+        args.input_path = custom_input_path
+        if not args.input_folder:
+            args.input_folder = custom_input_path if os.path.isdir(custom_input_path) else os.path.dirname(custom_input_path)
+    # --- GUI PATCH END ---"""
+            code = code.replace(target_str_2, inject_str_2)
+            modified = True
+
+        # --- PATCH 1b: Folder inputs must not fall back to their parent folder ---
+        # Older versions of PATCH 1 always used dirname(), so a folder passed as --input_path
+        # made inference.py glob the parent folder instead.
+        old_fallback = "args.input_folder = os.path.dirname(custom_input_path)"
+        if old_fallback in code:
+            print("Patching inference.py: Fixing folder input fallback...")
+            code = code.replace(old_fallback, "args.input_folder = custom_input_path if os.path.isdir(custom_input_path) else os.path.dirname(custom_input_path)")
+            modified = True
+
+        # --- PATCH 2: Handle Single File Logic in run_folder ---
+        # Standard code only globs a folder. We add a check for the specific file.
+        if "if getattr(args, 'input_path', None)" not in code:
+            print("Patching inference.py: Injecting single file logic...")
+            target_str = "mixture_paths = sorted(glob.glob(os.path.join(args.input_folder, '*.*')))"
+            inject_str = """if getattr(args, 'input_path', None) and os.path.isfile(args.input_path):
+        mixture_paths = [args.input_path]
+    else:
+        mixture_paths = sorted(glob.glob(os.path.join(args.input_folder, '*.*')))"""
+            code = code.replace(target_str, inject_str)
+            modified = True
+
+        # --- PATCH 3: Flat Output Directory Structure ---
+        # Standard code creates subfolders (output/TrackName/vocals.wav).
+        # We want output/TrackName_vocals.wav
+        if "output_dir = os.path.join(args.store_dir, file_name)" in code:
+            print("Patching inference.py: Flattening output directory structure...")
+            # Remove the subfolder creation
+            code = code.replace("output_dir = os.path.join(args.store_dir, file_name)", 
+                                "# output_dir = os.path.join(args.store_dir, file_name) # GUI PATCH")
+            
+            # Fix the output path construction
+            # Original looks like: output_path = os.path.join(output_dir, f"{instr}.{codec}")
+            # We change regex broadly to catch variants
+            code = code.replace('output_path = os.path.join(output_dir, f"{instr}.{codec}")', 
+                                'output_path = os.path.join(args.store_dir, f"{file_name}_{instr}.{codec}")')
+            
+            # Also fix the spectrogram output path if it exists
+            code = code.replace('output_img_path = os.path.join(output_dir, f"{instr}.jpg")',
+                                'output_img_path = os.path.join(args.store_dir, f"{file_name}_{instr}.jpg")')
+            
+            modified = True
+
+        # --- SAVE CHANGES ---
+        if modified:
+            try:
+                with open(inference_py_path, "w", encoding='utf-8') as f:
+                    f.write(code)
+                print("inference.py successfully patched.")
+                # Update timestamp to prevent re-patching loops if you use that logic
+                self.config['last_inference_py_edit'] = os.path.getmtime(inference_py_path)
+                self.save_config()
+            except Exception as e:
+                logging.error(f"Failed to write patched inference.py: {e}")
+                self._show_error(f"Failed to patch inference.py:\n{e}")
+
+    def modify_inference_py(self, inference_py_path, inference_code):
+        # Replace with the "old" code pattern
+        inference_code = inference_code.replace(
+            "output_dir = os.path.join(args.store_dir, file_name)\n        os.makedirs(output_dir, exist_ok=True)",
+            ""  # Remove the lines that create subfolders
+        )
+        inference_code = inference_code.replace(
+            "output_path = os.path.join(output_dir, f\"{instr}.{codec}\")",
+            "output_path = os.path.join(args.store_dir, f\"{file_name}_{instr}.{codec}\")"  # Modify output path
+        )
+        with open(inference_py_path, "w") as f:
+            f.write(inference_code)
+
+        # Record the modification time in config.json (only timestamp update)
+        self.update_last_inference_py_edit()
+        print("Modified inference.py to use the old output path structure.")
+
+    def update_last_inference_py_edit(self):
+        # Update only the timestamp part of the config
+        self.config['last_inference_py_edit'] = os.path.getmtime("inference.py")
+        self.save_timestamp()
+
+    def save_timestamp(self):
+        # Save only the timestamp without GUI data
+        temp_config = {'last_inference_py_edit': self.config.get('last_inference_py_edit', None)}
+        with open(self.config_file, 'w') as f:
+            json.dump(temp_config, f, indent=4)
+
+    def load_config(self):
+        try:
+            with open(self.config_file, 'r') as f:
+                self.config = json.load(f)
+        except FileNotFoundError:
+            self.config = {}
+
+    def load_models(self):
+        try:
+            with open(self.models_file, 'r') as f:
+                self.model_info = json.load(f)
+        except FileNotFoundError:
+            self.model_info = {}
+        self.catalog = ModelCatalog(self.model_info)
+
+    def save_config(self):
+        with open(self.config_file, 'w') as f:
+            json.dump(self.config, f, indent=4)
+
+    def update_models(self, models_url=None):
+        """
+        Refreshes models.json from models_url (default: models_url in config.json, else
+        MODELS_URL), which may also be a local path.
+
+        HTTP sources are asked only for changes since the last refresh (ETag /
+        If-Modified-Since); models.json is only rewritten when the list really changed.
+
+        Returns:
+            {'added': [...], 'removed': [...], 'changed': [...]} model names, all empty
+            when nothing changed.
+        """
+        models_url = models_url or self.config.get('models_url', MODELS_URL)
+        validators = self.config.get('models_validators', {})
+        headers = {'User-Agent': 'MusicSepGUI'}
+        if os.path.exists(self.models_file) and validators.get('url') == models_url:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        if '://' not in models_url:
+            with open(models_url, 'rb') as f:
+                data = f.read()
+            response_headers = {}
+        else:
+            try:
+                with urllib.request.urlopen(urllib.request.Request(models_url, headers=headers), timeout=60) as response:
+                    data = response.read()
+                    response_headers = response.headers
+            except urllib.error.HTTPError as e:
+                if e.code != 304:
+                    raise
+                logging.info("models.json is up to date")
+                return {'added': [], 'removed': [], 'changed': []}
+
+        models = json.loads(data)
+        changes = self.catalog.diff(models)
+        if any(changes.values()) or not os.path.exists(self.models_file):
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.models_file)), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self.models_file)
+            self.model_info = models
+            self.catalog = ModelCatalog(models)
+
+        self.config['models_validators'] = {'url': models_url, 'etag': response_headers.get('ETag'),
+                                            'last_modified': response_headers.get('Last-Modified')}
+        self.save_config()
+        logging.info(f"Models: {len(changes['added'])} added, {len(changes['removed'])} removed, {len(changes['changed'])} changed")
+        return changes
+
+    def download_file(self, url, filename, sha256=None, size=None):
+        try:
+            return self.downloader.fetch(url, filename, sha256, size)
+        except (DownloadError, OSError) as e:
+            self._set_status(f"Error downloading file '{filename}': {e}")
+            return None
+
+    def modify_yaml(self, original_config_path, selected_model=None):
+        """
+        Returns the config inference.py should use: original_config_path with the job's
+        chunk size and overlap, or the model's auto-tuned settings for this machine, applied.
+
+        Returns:
+            The path of the config, original_config_path itself if nothing changes, or
+            None if the derived config could not be written.
+        """
+        tuned = None
+        if selected_model is not None and self.options.get('use_tuned_params', True):
+            tuned = self.tuning.get(selected_model)
+        if self.options['use_default_params']:
+            if tuned is None:
+                return original_config_path
+            params = (tuned['chunk_size'], tuned['num_overlap'], tuned['batch_size'])
+        else:
+            # The user's chunk size and overlap win; the tuned batch size still fits the machine
+            params = (self.options['chunk_size'], self.options['overlap'], tuned and tuned['batch_size'])
+        try:
+            return self.derived_configs.get(original_config_path, *params)
+        except Exception as e:
+            logging.exception(f"Error modifying YAML: {e}")
+            self._show_error(f"Error modifying YAML file: {e}")
+            return None
+
+    def separate(self, selected_model):
+        """
+        Separates options['input_path'] (a file or a folder) with one model.
+
+        Returns:
+            True if the separation succeeded, False otherwise.
+        """
+        if selected_model not in self.model_info:
+            self._show_error(f"Invalid model selected: {selected_model}")
+            return False
+
+        logging.info(f"Starting separation with model: {selected_model}")
+        input_path = self.options['input_path']
+        output_dir = self._get_output_directory(selected_model)
+
+        held = self._hold_models([selected_model])  # Fetching the checkpoint mustn't evict the config
+        try:
+            if not self._download_model_files(selected_model):
+                return False  # _download_model_files handles error messages
+
+            # No need for temp folders in a straight separation
+            cmd = self._build_separation_command(selected_model, output_dir, input_path)
+
+            logging.info(f"Separation command: {cmd}")  # Log the full command
+
+            ok = self._run_separation(cmd, selected_model, self._new_batch_progress(1))
+        finally:
+            self.checkpoints.release(held)
+        self._report_cache()
+        self._report_metrics(output_dir)
+        return ok
+
+    def process_multi_model(self, ordered_models, processing_mode, input_stems=None, resume=None):
+        """
+        Runs several models over options['input_path'].
+
+        Every (track, model) job is recorded in the output folder's batch journal, so a
+        batch that dies can be picked up again with resume_batch.
+
+        Args:
+            ordered_models: Model names, in processing order.
+            processing_mode: "Sequential" (each model separates the previous model's
+                output) or "Independent" (every model separates the original input).
+            input_stems: Sequential only. One entry per model: the stems of the previous
+                model's output it separates (e.g. ["vocals"]), or None for all of them.
+            resume: Id of the journal batch being resumed; jobs whose outputs are
+                complete are skipped.
+
+        Returns:
+            True if every separation succeeded, False otherwise.
+        """
+        input_path = self.options['input_path']
+        output_folder = self.options['output_folder']
+
+        for selected_model in ordered_models:
+            if selected_model not in self.model_info:
+                self._show_error(f"Invalid model selected: {selected_model}")
+                return False
+
+        tracks = list_audio_files(input_path)
+        if not tracks:
+            self._show_error("No valid audio files found in the input folder.")
+            return False
+
+        journal, batch_id = self._open_batch(output_folder, ordered_models, processing_mode, input_stems, tracks, resume)
+        jobs = journal.jobs(batch_id) if journal is not None and resume is not None else {}
+        held = self._hold_models(ordered_models)
+        try:
+            if processing_mode == "Sequential":
+                ok = self._run_sequential(ordered_models, input_stems, tracks, output_folder, journal, batch_id, jobs, resume is not None)
+            else:
+                pending = {selected_model: list(tracks) for selected_model in ordered_models}
+                if resume is not None:
+                    for selected_model in ordered_models:
+                        outputs = self._job_outputs(os.path.join(output_folder, selected_model), tracks, processing_mode)
+                        done = self._verified_jobs(journal, batch_id, jobs, selected_model, outputs,
+                                                   {track: [track] for track in tracks})
+                        pending[selected_model] = [track for track in tracks if track not in done]
+                        logging.info(f"Resuming {selected_model}: {len(done)} track(s) done, {len(pending[selected_model])} to go")
+
+                # Later models download while the first ones are separating
+                self._prefetch_model_files([selected_model for selected_model in ordered_models if pending[selected_model]])
+
+                if self.options.get('parallel_jobs', 1) > 1 and len(cpu_slots(2)) > 1:
+                    ok = self._run_independent_parallel(ordered_models, input_path, output_folder, pending, journal, batch_id)
+                else:
+                    # Independent mode: Process input folder directly with each model
+                    ok = True
+                    progress = self._new_batch_progress(len(ordered_models))
+                    for selected_model in ordered_models:
+                        todo = pending[selected_model]
+                        if not todo:
+                            progress.finish_run()
+                            continue
+                        if not self._download_model_files(selected_model):
+                            # Recorded as failed below, not left looking interrupted
+                            self._journal_state(journal, batch_id, selected_model, todo, 'failed')
+                            ok = False
+                            break
+
+                        current_output_folder = os.path.join(output_folder, selected_model)
+                        os.makedirs(current_output_folder, exist_ok=True)
+
+                        run_input = input_path if len(todo) == len(tracks) else self.scratch.stage(todo)
+                        try:
+                            cmd = self._build_separation_command(selected_model, current_output_folder, run_input)
+                            self._journal_state(journal, batch_id, selected_model, todo, 'running')
+                            run_ok = self._run_separation(cmd, selected_model, progress)
+                        finally:
+                            self.scratch.release(run_input)
+                        self._journal_finish(journal, batch_id, selected_model, todo, run_ok, current_output_folder, processing_mode, tracks)
+                        ok = run_ok and ok
+            if journal is not None:
+                journal.finish_batch(batch_id, ok)
+        finally:
+            self.checkpoints.release(held)
+            if journal is not None:
+                journal.close()
+
+        self._report_cache()
+        self._report_metrics(output_folder)
+        return ok
+
+    def _run_sequential(self, ordered_models, input_stems, tracks, output_folder, journal, batch_id, jobs, resuming):
+        """
+        Sequential mode: each model runs once over the inputs of every track (its
+        predecessor's outputs, or the tracks themselves for the first model), so the
+        model is loaded once per batch rather than once per track.
+
+        When resuming, a track runs again from the first step whose outputs are not
+        complete; its later steps run again too, as their inputs change.
+
+        Returns:
+            True if every separation succeeded, False otherwise.
+        """
+        self._prefetch_model_files(ordered_models)
+        progress = self._new_batch_progress(len(ordered_models))
+        step_inputs = {track: [track] for track in tracks}  # Track -> the files the next model separates
+        rerun = set()  # Tracks that have to run every step from here on
+        ok = True
+        try:
+            for i, selected_model in enumerate(ordered_models):
+                current_output_folder = os.path.join(output_folder, selected_model)
+                os.makedirs(current_output_folder, exist_ok=True)
+
+                if i > 0:
+                    stems = input_stems[i] if input_stems else None
+                    step_inputs = self._next_step_inputs(step_inputs, os.path.join(output_folder, ordered_models[i - 1]),
+                                                         ordered_models[i - 1], stems)
+                todo = {track: inputs for track, inputs in step_inputs.items() if inputs}
+                if resuming:
+                    self._salvage_batch_dirs(current_output_folder, todo)
+                    outputs = self._job_outputs(current_output_folder, list(todo), "Sequential")
+                    done = self._verified_jobs(journal, batch_id, jobs, selected_model, outputs, todo) - rerun
+                    todo = {track: inputs for track, inputs in todo.items() if track not in done}
+                    rerun.update(todo)
+                    logging.info(f"Resuming {selected_model}: {len(done)} track(s) done, {len(todo)} to go")
+                if not todo:
+                    if not resuming:
+                        logging.warning(f"Nothing left for {selected_model} to separate")
+                    progress.finish_run()
+                    continue
+
+                if not self._download_model_files(selected_model):
+                    self._journal_state(journal, batch_id, selected_model, list(todo), 'failed')
+                    return False
+                self._journal_state(journal, batch_id, selected_model, list(todo), 'running')
+                run_ok = self._run_model_over_tracks(selected_model, current_output_folder, todo, progress)
+                self._journal_finish(journal, batch_id, selected_model, list(todo), run_ok, current_output_folder, "Sequential")
+                ok = run_ok and ok
+        finally:
+            self.scratch.cleanup()
+        return ok
+
+    # Settings recorded with every journal job
+    JOB_PARAM_KEYS = ('extract_instrumental', 'export_format', 'use_default_params', 'use_tta', 'overlap', 'chunk_size',
+                      'use_tuned_params', 'normalize_peak')
+
+    def _open_batch(self, output_folder, ordered_models, processing_mode, input_stems, tracks, resume=None):
+        """
+        Opens the batch journal of output_folder and, unless resuming, records a new batch
+        with a planned job per (track, model).
+
+        Returns:
+            (journal, batch id), or (None, None) when the journal can't be written (the
+            batch then runs without one).
+        """
+        try:
+            os.makedirs(output_folder, exist_ok=True)
+            journal = BatchJournal(output_folder)
+            if resume is not None:
+                return journal, resume
+            params = {key: self.options.get(key) for key in self.JOB_PARAM_KEYS}
+            jobs = [(track, selected_model, i, dict(params, input_stems=input_stems[i] if input_stems and processing_mode == "Sequential" else None))
+                    for i, selected_model in enumerate(ordered_models) for track in tracks]
+            return journal, journal.start_batch(processing_mode, ordered_models, input_stems, self.options, jobs)
+        except (sqlite3.Error, OSError) as e:
+            logging.warning(f"Batch journal disabled: {e}")
+            return None, None
+
+    @staticmethod
+    def _journal_state(journal, batch_id, selected_model, tracks, state):
+        if journal is not None:
+            journal.set_state(batch_id, selected_model, tracks, state)
+
+    def _journal_finish(self, journal, batch_id, selected_model, tracks, run_ok, model_output_folder, processing_mode, all_tracks=None):
+        """Records the outcome of a run: 'done' with their outputs for tracks whose outputs check out, else 'failed'."""
+        if journal is None:
+            return
+        outputs = self._job_outputs(model_output_folder, tracks, processing_mode, all_tracks)
+        done = [track for track in tracks if run_ok and outputs[track] and all(map(verify_audio_file, outputs[track]))]
+        journal.set_state(batch_id, selected_model, done, 'done', outputs)
+        journal.set_state(batch_id, selected_model, [track for track in tracks if track not in done], 'failed', outputs)
+
+    def _job_outputs(self, model_output_folder, tracks, processing_mode, all_tracks=None):
+        """
+        Returns track -> the output files of its job in a model's output folder:
+        everything in the track's subfolder (Sequential) or the files named after the
+        track (Independent; all_tracks are the batch's tracks, for telling apart names
+        that start alike).
+        """
+        outputs = {track: [] for track in tracks}
+        if not os.path.isdir(model_output_folder):
+            return outputs
+        if processing_mode == "Sequential":
+            for track in tracks:
+                track_folder = os.path.join(model_output_folder, os.path.splitext(os.path.basename(track))[0])
+                if os.path.isdir(track_folder):
+                    outputs[track] = [os.path.join(track_folder, name) for name in sorted(os.listdir(track_folder))
+                                      if not name.startswith('.') and os.path.isfile(os.path.join(track_folder, name))]
+        else:
+            stems = {os.path.splitext(os.path.basename(track))[0]: track for track in all_tracks or tracks}
+            for name in sorted(os.listdir(model_output_folder)):
+                path = os.path.join(model_output_folder, name)
+                owner = self._output_owner(name, stems)
+                if owner is not None and stems[owner] in outputs and os.path.isfile(path):
+                    outputs[stems[owner]].append(path)
+        return outputs
+
+    def _verified_jobs(self, journal, batch_id, jobs, selected_model, outputs, inputs):
+        """
+        Returns the tracks whose job for selected_model is complete, for resuming.
+
+        A job the journal has as done must still have its recorded outputs, with the same
+        sizes and finished headers. Other jobs (running when the batch died, or failed)
+        count as done when every input of the track has outputs with finished headers,
+        for every stem the model wrote for the other inputs, so a track cut off between
+        two inputs or two stems runs again. Newly verified jobs are marked done in the
+        journal.
+
+        Args:
+            outputs: Track -> its output files (see _job_outputs).
+            inputs: Track -> the files the model separated for it.
+        """
+        owned = {}  # Track -> {input name: the stems written for it}
+        for track, paths in outputs.items():
+            prefixes = [os.path.splitext(os.path.basename(path))[0] for path in inputs.get(track, [])]
+            owned[track] = {prefix: set() for prefix in prefixes}
+            for path in paths:
+                name = os.path.splitext(os.path.basename(path))[0]
+                owner = self._output_owner(name, prefixes)
+                if owner is not None:
+                    owned[track][owner].add(name[len(owner) + 1:])
+        expected = set().union(*(stems for track_stems in owned.values() for stems in track_stems.values()))
+
+        done = set()
+        newly_done = []
+        for track, paths in outputs.items():
+            job = jobs.get((track, selected_model))
+            if job is None:
+                continue
+            if job['state'] == 'done' and job['outputs']:
+                complete = all(verify_audio_file(path, size) for path, size in job['outputs'])
+            else:
+                complete = (bool(owned[track]) and all(stems >= expected for stems in owned[track].values())
+                            and all(map(verify_audio_file, paths)))
+                if complete:
+                    newly_done.append(track)
+            if complete:
+                done.add(track)
+        if journal is not None and newly_done:
+            journal.set_state(batch_id, selected_model, newly_done, 'done', outputs)
+        return done
+
+    def _salvage_batch_dirs(self, model_output_folder, step_inputs):
+        """
+        Files the outputs that a killed Sequential run left in its .batch- folder into
+        their track folders, so a resumed batch keeps the tracks that run finished.
+        """
+        inputs = [(track, path) for track, paths in step_inputs.items() for path in paths]
+        for name in os.listdir(model_output_folder):
+            parts = name.split('-')
+            if name.startswith('.batch-') and len(parts) > 2 and parts[1].isdigit() and not pid_alive(int(parts[1])):
+                batch_dir = os.path.join(model_output_folder, name)
+                logging.info(f"Recovering the outputs left in {batch_dir}")
+                self._distribute_outputs(batch_dir, inputs, model_output_folder)
+                shutil.rmtree(batch_dir, ignore_errors=True)
+
+    def resume_batch(self, output_folder):
+        """
+        Resumes the last unfinished multi-model batch of output_folder from its journal,
+        with the models, mode and settings it was started with. Jobs whose outputs are
+        complete are kept; the missing or incomplete ones run again.
+
+        Returns:
+            True if every remaining separation succeeded, False otherwise.
+        """
+        if not os.path.exists(os.path.join(output_folder, BatchJournal.FILE_NAME)):
+            self._show_error(f"There is no batch to resume in {output_folder}.")
+            return False
+        journal = BatchJournal(output_folder)
+        try:
+            batch = journal.last_unfinished()
+        finally:
+            journal.close()
+        if batch is None:
+            self._show_error(f"Every batch in {output_folder} has already finished.")
+            return False
+
+        self.options = dict(self.options, **batch['options'])
+        self.options['output_folder'] = output_folder
+        # 'running' if it was interrupted, 'failed' if it ended with failed jobs (e.g. a download)
+        action = "Retrying the failed" if batch['state'] == 'failed' else "Resuming the"
+        self._set_status(f"{action} {batch['mode']} batch of {', '.join(batch['models'])}...")
+        return self.process_multi_model(batch['models'], batch['mode'], batch['input_stems'], resume=batch['id'])
+
+    def process_ensemble(self, ensemble_type, input_files, weights, output_file):
+        """
+        Combines input_files into output_file, block by block with the built-in engine
+        (ensemble_audio), or with ensemble.py when the inputs need it or config.json sets
+        "ensemble_engine" to "ensemble.py".
+
+        Returns:
+            True if the ensemble succeeded, False otherwise.
+        """
+        if self.config.get('ensemble_engine', 'builtin') == 'builtin':
+            progress = self._new_batch_progress(1)
+            progress.start_run('ensemble', 1)
+            self._set_status("Running ensemble...")
+            start_time = time.time()
+            try:
+                ensemble_audio(input_files, weights, ensemble_type, output_file,
+                               cancel_event=self.cancel_event, on_progress=progress.update)
+                ok = True
+                progress.finish_run()
+                self._set_status("Ensemble process completed.")
+            except UnsupportedAudioError as e:
+                logging.info(f"Using ensemble.py: {e}")
+                ok = None
+            except (ValueError, OSError) as e:
+                ok = False
+                self._set_status(f"Ensemble process failed: {e}")
+                self._show_error(f"Ensemble process failed:\n{e}")
+            if ok is not None:
+                self.results.append({'model': 'ensemble', 'input_path': list(input_files), 'output_dir': os.path.dirname(output_file),
+                                     'ok': ok, 'elapsed': round(time.time() - start_time, 3)})
+                return ok
+
+        if not os.path.exists("ensemble.py"):
+            self._show_error("Could not find ensemble.py. Ensure it's in the correct location")
+            return False
+
+        cmd = ensemble_py_command(ensemble_type, input_files, weights, output_file)
+
+        self._set_status("Running ensemble...")
+        start_time = time.time()
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            ok = True
+            self._set_status("Ensemble process completed.")
+        except subprocess.CalledProcessError as e:
+            ok = False
+            self._set_status(f"Ensemble process failed: {e.stderr}")
+            self._show_error(f"Ensemble process failed:\n{e.stderr}")
+
+        self.results.append({'model': 'ensemble', 'input_path': list(input_files), 'output_dir': os.path.dirname(output_file),
+                             'ok': ok, 'elapsed': round(time.time() - start_time, 3)})
+        return ok
+
+    def process_batch_ensemble(self, ensemble_type, model_folders, weights, output_folder, stems=None, jobs=None, force=False):
+        """
+        Ensembles every track the model output folders have in common, on a process pool.
+
+        Outputs go to output_folder/<track>_<stem>.wav. A manifest in output_folder records
+        the inputs and settings each output was made from, so outputs that are already up
+        to date are skipped unless force is set.
+
+        Args:
+            ensemble_type: One of ENSEMBLE_TYPES.
+            model_folders: One output folder per model.
+            weights: One weight per folder.
+            output_folder: Where the ensembles go.
+            stems: Stems to ensemble (e.g. ["vocals"]), or None for all of them.
+            jobs: Pool size (default: ensemble_jobs in config.json, else the CPU count).
+            force: Redo outputs that are up to date.
+
+        Returns:
+            True if every track succeeded (or was up to date), False otherwise.
+        """
+        if len(weights) != len(model_folders):
+            self._show_error("Give one weight per model folder.")
+            return False
+        matches = match_ensemble_inputs(model_folders, stems)
+        if not matches:
+            self._show_error("The model folders have no tracks in common.")
+            return False
+
+        os.makedirs(output_folder, exist_ok=True)
+        manifest_path = os.path.join(output_folder, '.ensemble-manifest.json')
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            manifest = {}
+
+        tasks = {}
+        for (track, stem), input_files in matches.items():
+            output_name = f"{track}_{stem}.wav"
+            signature = {
+                'type': ensemble_type,
+                'weights': list(weights),
+                'inputs': [[os.path.abspath(path), os.path.getsize(path), os.stat(path).st_mtime_ns] for path in input_files],
+            }
+            if not force and manifest.get(output_name) == signature and os.path.exists(os.path.join(output_folder, output_name)):
+                continue
+            tasks[output_name] = (input_files, signature)
+        skipped = len(matches) - len(tasks)
+        if skipped:
+            logging.info(f"Batch ensemble: {skipped} track(s) already up to date")
+
+        progress = self._new_batch_progress(max(1, len(tasks)))
+        failed = []
+        start_time = time.time()
+        jobs = max(1, min(jobs or self.config.get('ensemble_jobs') or os.cpu_count() or 1, len(tasks) or 1))
+        if self.admission is not None:
+            # As many processes as fit the memory budget
+            task_mb = MemoryEstimator.ensemble_mb(len(model_folders))
+            if jobs * task_mb > self.admission.budget_mb:
+                jobs = max(1, int(self.admission.budget_mb // task_mb))
+                logging.info(f"Batch ensemble: {jobs} process(es) fit the {self.admission.budget_mb:.0f} MB memory budget")
+        if tasks:
+            self._set_status(f"Ensembling {len(tasks)} track(s) on {jobs} process(es)...")
+            pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+            try:
+                futures = {pool.submit(_ensemble_task, ensemble_type, input_files, list(weights), os.path.join(output_folder, output_name)):
+                           output_name for output_name, (input_files, _) in tasks.items()}
+                for future in concurrent.futures.as_completed(futures):
+                    self._check_cancelled()
+                    output_name = futures[future]
+                    error = future.result()
+                    if error is None:
+                        manifest[output_name] = tasks[output_name][1]
+                    else:
+                        failed.append(output_name)
+                        manifest.pop(output_name, None)
+                        logging.error(f"Ensemble of {output_name} failed: {error}")
+                    progress.start_run(output_name, 1)
+                    progress.finish_run()
+                    self._set_status(f"Ensembled {progress.runs_done}/{len(tasks)} track(s)")
+            finally:
+                # On cancel, queued tracks are dropped and running ones finish
+                pool.shutdown(wait=True, cancel_futures=True)
+                fd, temp_path = tempfile.mkstemp(dir=output_folder, prefix='.ensemble-manifest-', suffix='.json')
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, indent=4)
+                os.replace(temp_path, manifest_path)
+
+        self.results.append({'model': 'ensemble', 'input_path': list(model_folders), 'output_dir': output_folder,
+                             'ok': not failed, 'elapsed': round(time.time() - start_time, 3),
+                             'tracks': len(tasks), 'skipped': skipped, 'failed': failed})
+        if failed:
+            self._set_status(f"Batch ensemble: {len(failed)} of {len(tasks)} track(s) failed")
+            self._show_error("These ensembles failed (see the log):\n" + "\n".join(failed[:20]))
+            return False
+        self._set_status(f"Batch ensemble completed: {len(tasks)} track(s) ensembled, {skipped} up to date.")
+        return True
+
+    def autotune(self, selected_model, sample_path, clip_seconds=20, memory_budget_mb=None,
+                 chunk_sizes=None, overlaps=None, batch_sizes=None):
+        """
+        Finds the fastest chunk size, overlap and batch size of selected_model on this machine.
+
+        Every combination of the tuning grid separates a clip of sample_path in a fresh
+        inference.py process; the fastest run whose peak memory stayed within the budget is
+        saved to the tuning file and applied to later runs by modify_yaml. Lower overlaps
+        are faster but blend chunks less, so pass overlaps to keep a minimum quality.
+
+        Args:
+            selected_model: The models.json name of the model.
+            sample_path: A typical track. WAV files are cut to clip_seconds; other
+                formats are used whole, so a short sample keeps the tuning quick.
+            clip_seconds: Length of the sample clip.
+            memory_budget_mb: Peak memory a run may use (default: tuning_memory_mb in
+                config.json, else 75% of the RAM). Only enforced where /proc exists.
+            chunk_sizes, overlaps, batch_sizes: Override the TUNING_* grid.
+
+        Returns:
+            The saved settings, or None if no trial succeeded.
+        """
+        if selected_model not in self.model_info:
+            self._show_error(f"Invalid model selected: {selected_model}")
+            return None
+        if not self._download_model_files(selected_model):
+            return None
+
+        if memory_budget_mb is None:
+            memory_budget_mb = self._default_memory_budget_mb()
+        budget = memory_budget_mb * 1024 ** 2 if memory_budget_mb else None
+
+        info = self.model_info[selected_model]
+        base_config = self.checkpoints.path(info['config_name'])
+        work_dir = self.scratch.new_dir('autotune-')
+        try:
+            clip_path = os.path.join(work_dir, 'sample.wav')
+            duration = write_sample_clip(sample_path, clip_path, clip_seconds)
+            if duration is None:
+                clip_path = sample_path
+                logging.info(f"{sample_path} is not a PCM WAV file; tuning on the whole file")
+
+            # Read the checkpoint once so the first trial doesn't pay for a cold disk cache
+            with open(self.checkpoints.path(info['checkpoint_name']), 'rb') as f:
+                while f.read(16 * 1024 * 1024):
+                    pass
+
+            grid = [(chunk_size, overlap) for chunk_size in chunk_sizes or self.TUNING_CHUNK_SIZES
+                    for overlap in overlaps or self.TUNING_OVERLAPS]
+            batch_sizes = sorted(batch_sizes or self.TUNING_BATCH_SIZES)
+            total = len(grid) * len(batch_sizes)
+            progress = BatchProgress(total, self.on_progress)
+            trials = []
+            for chunk_size, overlap in grid:
+                for batch_size in batch_sizes:
+                    self._check_cancelled()
+                    label = f"auto-tune {selected_model}: chunk {chunk_size}, overlap {overlap}, batch {batch_size}"
+                    self._set_status(f"Trial {len(trials) + 1}/{total}: {label}")
+                    progress.start_run(label, 1)
+                    config_path = self.derived_configs.get(base_config, chunk_size, overlap, batch_size)
+                    trial_dir = os.path.join(work_dir, f"trial-{len(trials)}")
+                    cmd = self._build_separation_command(selected_model, trial_dir, clip_path)
+                    cmd[cmd.index("--config_path") + 1] = config_path
+                    ok, seconds, peak = self._run_trial(cmd, budget, progress)
+                    shutil.rmtree(trial_dir, ignore_errors=True)
+                    progress.finish_run()
+                    trials.append({'chunk_size': chunk_size, 'num_overlap': overlap, 'batch_size': batch_size, 'ok': ok,
+                                   'seconds': round(seconds, 3),
+                                   'peak_mb': None if peak is None else round(peak / 1024 ** 2)})
+                    if not ok:
+                        break  # A larger batch only needs more memory
+        finally:
+            self.scratch.release(work_dir)
+
+        passed = [trial for trial in trials if trial['ok']]
+        if not passed:
+            self._set_status(f"Auto-tune {selected_model}: every trial failed or went over the memory budget.")
+            return None
+        best = min(passed, key=lambda trial: trial['seconds'])
+        settings = {
+            'chunk_size': best['chunk_size'],
+            'num_overlap': best['num_overlap'],
+            'batch_size': best['batch_size'],
+            'seconds': best['seconds'],
+            'peak_mb': best['peak_mb'],
+            'clip_seconds': None if duration is None else round(duration, 3),
+            'memory_budget_mb': None if budget is None else round(memory_budget_mb),
+            'tuned': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'trials': trials,
+        }
+        self.tuning.put(selected_model, settings)
+        self._set_status(f"Auto-tune {selected_model}: chunk {best['chunk_size']}, overlap {best['num_overlap']}, "
+                         f"batch {best['batch_size']} ({best['seconds']:.1f} s per clip)")
+        return settings
+
+    def _default_memory_budget_mb(self):
+        """Returns tuning_memory_mb from config.json, else 75% of the RAM (None if unknown)."""
+        budget_mb = self.config.get('tuning_memory_mb')
+        if budget_mb is None and physical_memory_bytes():
+            budget_mb = physical_memory_bytes() * 0.75 / 1024 ** 2
+        return budget_mb
+
+    def _run_trial(self, cmd, budget=None, progress=None):
+        """
+        Runs one auto-tune trial, stopping it once its memory goes over budget.
+
+        Returns:
+            (ok, seconds, peak memory in bytes or None)
+        """
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        with self.process_lock:
+            self.active_processes.add(process)
+        peak = [None]
+        over_budget = threading.Event()
+
+        def watch_memory():
+            while process.poll() is None:
+                peak[0] = process_peak_memory(process.pid) or peak[0]
+                if budget is not None and peak[0] is not None and peak[0] > budget:
+                    over_budget.set()
+                    stop_process(process)
+                    return
+                time.sleep(0.1)
+
+        watcher = threading.Thread(target=watch_memory, daemon=True)
+        watcher.start()
+        output_tail = collections.deque(maxlen=20)
+        try:
+            for line in iter_output_lines(process.stdout):
+                output_tail.append(line)
+                if progress is not None:
+                    progress.feed(line)
+            returncode = process.wait()
+        finally:
+            with self.process_lock:
+                self.active_processes.discard(process)
+        seconds = time.perf_counter() - start
+        watcher.join()
+        self._check_cancelled()
+
+        if over_budget.is_set():
+            logging.info(f"Trial stopped at {peak[0] / 1024 ** 2:.0f} MB, over the memory budget")
+            return False, seconds, peak[0]
+        if returncode != 0:
+            logging.info(f"Trial failed (return code {returncode}): " + " | ".join(output_tail))
+            return False, seconds, peak[0]
+        return True, seconds, peak[0]
+
+    def cancel(self):
+        """Stops the running flow, terminating whatever child process is working on it."""
+        self.cancel_event.set()
+        with self.process_lock:
+            processes = list(self.active_processes)
+        for process in processes:
+            threading.Thread(target=stop_process, args=(process,), daemon=True).start()
+
+    def shutdown(self):
+        """Stops the worker and background downloads and removes temporary files."""
+        self.cancel_event.set()  # Running downloads stop at their next chunk
+        self.downloader.shutdown()
+        if self.worker is not None:
+            self.worker.stop()
+        self.scratch.cleanup()
+
+    def _set_status(self, text):
+        if self.on_status:
+            self.on_status(text)
+
+    def _show_error(self, message):
+        if self.on_error:
+            self.on_error(message)
+        else:
+            logging.error(message)
+
+    def _check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def _new_batch_progress(self, total_runs, progress_class=BatchProgress):
+        self.cache_stats = {'hits': 0, 'misses': 0}  # Reported per batch
+        self.batch_metrics = []
+        return progress_class(total_runs, self.on_progress)
+
+    def _get_result_cache(self):
+        if not self.options.get('use_result_cache', True):
+            return None
+        if self.result_cache is None:
+            self.result_cache = ResultCache(self.config.get('result_cache_dir', 'result_cache'),
+                                            self.config.get('result_cache_mb', 20480) * 1024 ** 2)
+        return self.result_cache
+
+    def _report_cache(self):
+        hits, misses = self.cache_stats['hits'], self.cache_stats['misses']
+        if hits or misses:
+            self._set_status(f"Result cache: {hits} hit(s), {misses} miss(es)")
+
+    def _record_metrics(self, records):
+        self.memory.add(records)
+        with self.metrics_lock:
+            self.batch_metrics.extend(records)
+            if not self.metrics_file:
+                return
+            try:
+                with open(self.metrics_file, 'a', encoding='utf-8') as f:
+                    for record in records:
+                        f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                logging.warning(f"Could not write the metrics to {self.metrics_file}: {e}")
+
+    def _report_metrics(self, output_folder):
+        """Shows the batch's metrics summary and writes it next to the outputs."""
+        with self.metrics_lock:
+            records = list(self.batch_metrics)
+        if not records:
+            return None
+        summary = summarize_metrics(records, self.cache_stats['hits'])
+        summary['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+        text = f"Batch: {summary['tracks']} track(s), {summary['audio_seconds']:.0f} s of audio in {summary['wall_seconds']:.0f} s"
+        for model_name, stats in summary['models'].items():
+            if stats['rtf']['p50'] is not None:
+                text += f"; {model_name} RTF p50 {stats['rtf']['p50']:.2f}, p95 {stats['rtf']['p95']:.2f}"
+        self._set_status(text)
+        try:
+            path = os.path.join(output_folder, f"metrics-{time.strftime('%Y%m%d-%H%M%S')}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, indent=4)
+        except OSError as e:
+            logging.warning(f"Could not write the metrics summary: {e}")
+        return summary
+
+    def _model_file_requests(self, selected_model):
+        # sha256/size are optional in models.json
+        info = self.model_info[selected_model]
+        return [
+            (info['config_url'], info['config_name'], info.get('config_sha256'), info.get('config_size')),
+            (info['checkpoint_url'], info['checkpoint_name'], info.get('checkpoint_sha256'), info.get('checkpoint_size')),
+        ]
+
+    def pin_models(self, models, pinned=True):
+        """Pins (or unpins) the config and checkpoint of models so the quota never evicts them."""
+        filenames = [filename for selected_model in models if selected_model in self.model_info
+                     for _, filename, _, _ in self._model_file_requests(selected_model)]
+        if pinned:
+            self.checkpoints.pin(filenames)
+        else:
+            self.checkpoints.unpin(filenames)
+
+    def _hold_models(self, models):
+        """
+        Keeps the files of models from being evicted while a batch runs, so fetching its
+        later models can't evict its earlier ones. Returns the filenames to release afterwards.
+        """
+        filenames = [filename for selected_model in models if selected_model in self.model_info
+                     for _, filename, _, _ in self._model_file_requests(selected_model)]
+        self.checkpoints.hold(filenames)
+        return filenames
+
+    def _prefetch_model_files(self, ordered_models):
+        """
+        Starts downloading the files of every model in a batch that aren't in ckpts/ yet.
+
+        Downloads run in the background in processing order, so the first model is ready
+        as soon as possible and _download_model_files only waits for files still missing.
+        """
+        for selected_model in ordered_models:
+            for url, filename, sha256, size in self._model_file_requests(selected_model):
+                if not os.path.exists(self.checkpoints.path(filename)):
+                    self.downloader.submit(url, filename, sha256, size)
+
+    def _download_model_files(self, selected_model):
+        # The config and checkpoint are fetched side by side (or were already queued by _prefetch_model_files)
+        config_path, checkpoint_path = self.downloader.fetch_many(self._model_file_requests(selected_model))
+        self._check_cancelled()
+
+        errors = [result for result in (config_path, checkpoint_path) if isinstance(result, Exception)]
+        if errors:
+            self._set_status(f"Error downloading model files: {errors[0]}")
+            self._show_error("Failed to download necessary files.")
+            logging.error(f"Failed to download config or checkpoint files: {errors}")
+            return False
+
+        if self.modify_yaml(config_path, selected_model) is None:
+            logging.error("Failed to modify YAML file.")  # Add more specific logging
+            return False
+
+        return True
+
+    def _get_output_directory(self, selected_model):
+        output_dir = self.options['output_folder']
+        if self.options['model_folder_sort']:
+            output_dir = os.path.join(output_dir, selected_model)
+            os.makedirs(output_dir, exist_ok=True)
+        return output_dir
+
+    def _build_separation_command(self, selected_model, output_dir, input_path): # Modified function to handle input_path
+        info = self.model_info[selected_model]
+
+        # Already derived (and any error reported) by _download_model_files
+        config_path = self.checkpoints.path(info['config_name'])
+        config_path = self.modify_yaml(config_path, selected_model) or config_path
+
+        checkpoint_path = self.checkpoints.path(info['checkpoint_name'])
+
+        cmd = [
+            sys.executable,
+            "inference.py",
+            "--model_type", info['model_type'],
+            "--config_path", config_path,
+            "--start_check_point", checkpoint_path,
+            "--store_dir", output_dir,
+            "--input_path", input_path,  # <--- ALWAYS use --input_path and pass input_path
+        ]
+
+        # Remove the old if/elif/else block completely
+        # No longer need to check if it's a dir or file here. inference.py handles it.
+
+        # Add other options (rest of the function remains the same)
+        if self.options['extract_instrumental']:
+            cmd.append("--extract_instrumental")
+
+        export_format = self.options['export_format']
+        if export_format.startswith('flac'):
+            cmd.append("--flac_file")
+            cmd.append(f"--pcm_type={export_format.split()[1]}")
+        elif export_format == "wav FLOAT":
+            cmd.append("--wav_file")
+
+        if self.options['use_tta']:
+            cmd.append("--use_tta")
+
+        logging.debug(f"Built command: {cmd}")
+        return cmd
+
+    def _run_independent_parallel(self, ordered_models, input_path, output_folder, pending=None, journal=None, batch_id=None):
+        """
+        Independent mode with options['parallel_jobs'] runs at the same time.
+
+        Each run is an inference.py process pinned to its own slice of the CPUs, with the
+        thread pools of OpenMP/MKL/... sized to match. When there are fewer models than
+        slots, each model's tracks are split so every slot has work. Outputs land in
+        output_folder/<model>/ exactly as in the serial loop.
+
+        Args:
+            pending: Model -> the tracks it still has to separate (default: all of them).
+            journal, batch_id: The batch journal the runs are recorded in, if any.
+
+        Returns:
+            True if every separation succeeded, False otherwise.
+        """
+        slots = cpu_slots(self.options['parallel_jobs'])
+        tracks = list_audio_files(input_path)
+        if not tracks:
+            self._show_error("No valid audio files found in the input folder.")
+            return False
+        pending = pending or {selected_model: tracks for selected_model in ordered_models}
+        models = [selected_model for selected_model in ordered_models if pending[selected_model]]
+        if not models:
+            return True
+
+        # Work units in model order: (model, tracks or None for the whole input)
+        units = []
+        for selected_model in models:
+            todo = pending[selected_model]
+            chunks = min(len(todo), -(-len(slots) // len(models)))
+            if chunks == 1:
+                units.append((selected_model, None if len(todo) == len(tracks) else todo))
+            else:
+                units.extend((selected_model, todo[i::chunks]) for i in range(chunks))
+        logging.info(f"Running {len(units)} job(s) on {len(slots)} CPU slot(s): {[len(slot) for slot in slots]} CPUs each")
+
+        progress = self._new_batch_progress(len(units), ParallelProgress)
+        free_slots = queue.Queue()
+        for slot in slots:
+            free_slots.put(slot)
+
+        def run_unit(selected_model, unit_tracks):
+            self._check_cancelled()
+            # Waits for this model's downloads without blocking the other jobs, then prepares it
+            current_output_folder = os.path.join(output_folder, selected_model)
+            if not self._download_model_files(selected_model):
+                self._journal_state(journal, batch_id, selected_model, unit_tracks or tracks, 'failed')
+                return False
+            os.makedirs(current_output_folder, exist_ok=True)
+            unit_input = input_path if unit_tracks is None else self.scratch.stage(unit_tracks)
+            cmd = self._build_separation_command(selected_model, current_output_folder, unit_input)
+
+            slot = free_slots.get()
+            run_ok = False
+            try:
+                self._journal_state(journal, batch_id, selected_model, unit_tracks or tracks, 'running')
+                run_ok = self._run_separation(cmd, selected_model, progress.run_progress(), cpu_slot=slot)
+                return run_ok
+            finally:
+                free_slots.put(slot)
+                self.scratch.release(unit_input)
+                self._journal_finish(journal, batch_id, selected_model, unit_tracks or tracks, run_ok, current_output_folder, "Independent", tracks)
+
+        ok = True
+        self.concurrent_runs = len(slots) > 1
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(slots), thread_name_prefix='independent') as pool:
+                futures = [pool.submit(run_unit, *unit) for unit in units]
+                try:
+                    for future in futures:
+                        ok = future.result() and ok
+                except BaseException as e:
+                    for future in futures:
+                        future.cancel()
+                    if not isinstance(e, Exception):
+                        self.cancel()  # Ctrl+C: stop the running jobs rather than waiting for them
+                    raise
+        finally:
+            self.concurrent_runs = False
+            self.scratch.cleanup()
+        return ok
+
+    def _next_step_inputs(self, step_inputs, prev_output_folder, prev_model, stems):
+        """
+        Works out what the next Sequential step separates for every track.
+
+        Args:
+            step_inputs: Track -> the files the previous model separated.
+            prev_output_folder: The previous model's output folder (one subfolder per track).
+            prev_model: The previous model's name, for messages.
+            stems: The stems of the previous outputs to pass on, or None for all of them.
+
+        Returns:
+            Track -> the files the next model separates (empty when there are none).
+        """
+        next_inputs = {}
+        for track, inputs in step_inputs.items():
+            track_name = os.path.splitext(os.path.basename(track))[0]
+            prev_model_output = os.path.join(prev_output_folder, track_name)
+            if not inputs or not os.path.exists(prev_model_output):
+                logging.warning(f"Output folder from previous model not found: {prev_model_output}")
+                next_inputs[track] = []
+                continue
+
+            prefixes = [os.path.splitext(os.path.basename(path))[0] for path in inputs]
+            next_inputs[track] = self._select_stems(prev_model_output, prefixes, stems)
+            if not next_inputs[track]:
+                logging.warning(f"No {'/'.join(stems or ['audio'])} output from {prev_model} for {track_name}")
+        return next_inputs
+
+    def _run_model_over_tracks(self, selected_model, model_output_folder, step_inputs, progress):
+        """
+        Separates the inputs of all tracks with one inference.py run and files the outputs
+        into model_output_folder/<track name>/, like separate runs per track would.
+
+        inference.py names outputs after their input, so inputs whose names clash (e.g. the
+        same track as .wav and .flac) are spread over as few extra runs as possible.
+
+        Returns:
+            True if every run succeeded, False otherwise.
+        """
+        groups = []  # Each: {input name (lower case): (track, path)}
+        for track, paths in step_inputs.items():
+            for path in paths:
+                name = os.path.splitext(os.path.basename(path))[0].lower()
+                group = next((group for group in groups if name not in group), None)
+                if group is None:
+                    group = {}
+                    groups.append(group)
+                group[name] = (track, path)
+
+        self._remove_stale_batch_dirs(model_output_folder)
+        ok = True
+        for group in groups:
+            # Outputs go to a folder next to their final place, so filing them is a rename
+            batch_dir = tempfile.mkdtemp(prefix=f'.batch-{os.getpid()}-', dir=model_output_folder)
+            staged_input = self.scratch.stage([path for _, path in group.values()])
+            try:
+                cmd = self._build_separation_command(selected_model, batch_dir, staged_input)
+                ok = self._run_separation(cmd, selected_model, progress) and ok
+                self._distribute_outputs(batch_dir, group.values(), model_output_folder)
+            finally:
+                self.scratch.release(staged_input)
+                shutil.rmtree(batch_dir, ignore_errors=True)
+        return ok
+
+    def _distribute_outputs(self, batch_dir, inputs, model_output_folder):
+        """Moves each output of a batch run into the folder of the track its input belongs to."""
+        owners = {os.path.splitext(os.path.basename(path))[0]: track for track, path in inputs}
+        for name in os.listdir(batch_dir):
+            owner = self._output_owner(name, owners)
+            if owner is None:
+                logging.warning(f"Could not tell which track {name} belongs to")
+                continue
+            track_output_folder = os.path.join(model_output_folder, os.path.splitext(os.path.basename(owners[owner]))[0])
+            os.makedirs(track_output_folder, exist_ok=True)
+            os.replace(os.path.join(batch_dir, name), os.path.join(track_output_folder, name))
+
+    @staticmethod
+    def _remove_stale_batch_dirs(folder):
+        # Left behind when a process was killed in the middle of a batch
+        for name in os.listdir(folder):
+            parts = name.split('-')
+            if name.startswith('.batch-') and len(parts) > 2 and parts[1].isdigit() and not pid_alive(int(parts[1])):
+                shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+
+    @staticmethod
+    def _select_stems(folder, prefixes, stems):
+        """
+        Picks the outputs of the previous step that the next step separates.
+
+        Args:
+            folder: The previous model's output folder for one track.
+            prefixes: Names (without extension) of the files the previous model separated;
+                its outputs are named '<prefix>_<stem>.<ext>'.
+            stems: The stems to keep (case-insensitive), or None for every audio file.
+
+        Returns:
+            The paths of the selected files.
+        """
+        files = list_audio_files(folder)
+        if stems is None:
+            return files
+        wanted = {f"{prefix}_{stem}".lower() for prefix in prefixes for stem in stems}
+        return [path for path in files if os.path.splitext(os.path.basename(path))[0].lower() in wanted]
+
+    def _run_separation(self, cmd, model_name, progress, cpu_slot=None):
+        """
+        Runs the separation process using the given command.
+
+        Args:
+            cmd: The command to execute for separation.
+            model_name: The name of the model being used.
+            progress: The BatchProgress of the batch this run belongs to.
+            cpu_slot: CPU ids to pin the run to (it then runs as its own process).
+
+        Returns:
+            True if the separation succeeded, False otherwise.
+        """
+        self._check_cancelled()
+        input_path = cmd[cmd.index("--input_path") + 1]
+        output_dir = cmd[cmd.index("--store_dir") + 1]
+        start_time = time.time()
+        tracks = list_audio_files(input_path)
+        cmd = self._fit_memory_budget(cmd, model_name, tracks)
+
+        # Tracks already separated with the same settings are taken from the cache
+        cache = self._get_result_cache()
+        keys = {}
+        missing = tracks
+        if cache is not None and tracks:
+            try:
+                keys = {track: cache.key_for(model_name, track, cmd, self._post_settings()) for track in tracks}
+            except OSError as e:
+                logging.warning(f"Result cache disabled for this run: {e}")
+            else:
+                missing = [track for track in tracks
+                           if cache.materialize(keys[track], output_dir, os.path.splitext(os.path.basename(track))[0]) is None]
+                with self.stats_lock:
+                    self.cache_stats['hits'] += len(tracks) - len(missing)
+                    self.cache_stats['misses'] += len(missing)
+
+        # Very long tracks are separated in segments so memory doesn't grow with their length
+        ok = True
+        segmented = []
+        for track in self._long_inputs(missing):
+            result = self._run_segmented(cmd, model_name, progress, track, keys.get(track), cpu_slot)
+            if result is None:
+                continue  # Not splittable here, separated whole below
+            segmented.append(track)
+            if not result:
+                ok = False
+                break
+        remaining = [track for track in missing if track not in segmented]
+
+        # Then the rest in one run, unless a segmented track already failed
+        if ok:
+            if len(remaining) == len(tracks):
+                ok = self._run_inference(cmd, model_name, progress, len(tracks), keys, cpu_slot=cpu_slot)
+            elif not remaining:
+                if not segmented:
+                    logging.info(f"{model_name}: all {len(tracks)} track(s) taken from the result cache")
+                    progress.start_run(model_name, len(tracks))
+            else:
+                # Only separate the misses
+                staged_input = self.scratch.stage(remaining)
+                run_cmd = list(cmd)
+                run_cmd[run_cmd.index("--input_path") + 1] = staged_input
+                try:
+                    ok = self._run_inference(run_cmd, model_name, progress, len(remaining), keys, remaining, cpu_slot)
+                finally:
+                    self.scratch.release(staged_input)
+
+        self.results.append({'model': model_name, 'input_path': input_path, 'output_dir': output_dir,
+                             'ok': ok, 'elapsed': round(time.time() - start_time, 3),
+                             'cache_hits': len(tracks) - len(missing) if keys else 0,
+                             'segmented': len(segmented)})
+        if not ok:
+            return False
+        progress.finish_run()
+        self._set_status(f"Separation of {model_name} completed successfully!")
+        logging.info(f"Separation of {model_name} completed successfully.")
+        return True
+
+    # Model types whose chunk_size may be lowered to fit the memory budget; others only get a smaller batch
+    CHUNK_FALLBACK_TYPES = ('bs_roformer', 'mel_band_roformer')
+
+    def _memory_estimate(self, cmd, model_name, tracks):
+        """
+        Estimates the peak memory of running cmd over tracks (see MemoryEstimator). Tracks
+        that will be separated in segments count with the segment length.
+
+        Returns:
+            (calibrated MB, prior MB, run params, seconds of the longest track), or None if
+            the run's config can't be read.
+        """
+        try:
+            config = self.derived_configs.load(cmd[cmd.index("--config_path") + 1])
+        except Exception as e:  # yaml missing or the config unreadable
+            logging.debug(f"No memory estimate for {model_name}: {e}")
+            return None
+        seconds = max((audio_duration(track) or 0 for track in tracks), default=0)
+        threshold = self.config.get('long_input_seconds', 1800)
+        if threshold and seconds > threshold:
+            seconds = self.config.get('segment_seconds', 600) + self.config.get('segment_overlap_seconds', 10)
+        params = MemoryEstimator.run_params(config, cmd[cmd.index("--model_type") + 1], "--use_tta" in cmd)
+        estimate_mb, prior_mb = self.memory.estimate(model_name, params, seconds)
+        return estimate_mb, prior_mb, params, seconds
+
+    def _fit_memory_budget(self, cmd, model_name, tracks):
+        """
+        Returns cmd, or a copy running with a smaller batch size (then, for
+        CHUNK_FALLBACK_TYPES, a smaller chunk size) if the run's estimated peak memory is
+        over the memory budget even on its own. Runs that fit the budget keep their
+        settings; they only wait for room next to other runs (_reserve_memory).
+        """
+        if not self._memory_checked():
+            return cmd
+        memory = self._memory_estimate(cmd, model_name, tracks)
+        if memory is None or memory[0] <= self.admission.budget_mb:
+            return cmd
+        estimate_mb, _, params, seconds = memory
+        config_path = cmd[cmd.index("--config_path") + 1]
+
+        candidates = []
+        batch_size = params['batch_size']
+        while batch_size > 1:
+            batch_size = max(1, batch_size // 2)
+            candidates.append((params['chunk_size'], batch_size))
+        if params['model_type'] in self.CHUNK_FALLBACK_TYPES:
+            # Roformers take any chunk size that is a whole number of STFT hops
+            hop = (self.derived_configs.load(config_path).get('audio') or {}).get('hop_length', 441)
+            chunk_size = params['chunk_size']
+            for _ in range(2):
+                chunk_size = chunk_size // 2 // hop * hop
+                candidates.append((chunk_size, 1))
+        if not candidates:
+            logging.warning(f"{model_name} needs about {estimate_mb:.0f} MB, over the {self.admission.budget_mb:.0f} MB memory budget")
+            return cmd
+
+        for chunk_size, batch_size in candidates:
+            fitted_mb, _ = self.memory.estimate(model_name, dict(params, chunk_size=chunk_size, batch_size=batch_size), seconds)
+            if fitted_mb <= self.admission.budget_mb:
+                break
+        else:
+            logging.warning(f"{model_name} is still over the {self.admission.budget_mb:.0f} MB memory budget "
+                            f"at its smallest settings (about {fitted_mb:.0f} MB)")
+        try:
+            fitted_config = self.derived_configs.get(config_path, chunk_size, None, batch_size)
+        except Exception as e:
+            logging.warning(f"Could not write a smaller config for {model_name}: {e}")
+            return cmd
+        self._set_status(f"{model_name}: about {estimate_mb:.0f} MB needed, over the {self.admission.budget_mb:.0f} MB "
+                         f"memory budget; using chunk size {chunk_size} and batch size {batch_size} (about {fitted_mb:.0f} MB)")
+        cmd = list(cmd)
+        cmd[cmd.index("--config_path") + 1] = fitted_config
+        return cmd
+
+    def _memory_checked(self):
+        """
+        Whether runs are estimated against the memory budget: always when memory_budget_mb
+        is set in config.json, else only while runs can overlap (Independent mode with
+        several jobs, watch -j), so a lone run doesn't read its model config for nothing.
+        """
+        return self.admission is not None and (self.estimate_every_run or self.concurrent_runs)
+
+    def _reserve_memory(self, metrics, cmd, model_name):
+        """
+        Estimates the peak memory of a run (recorded with its metrics) and waits until it
+        fits the memory budget next to the runs already going. Nothing is estimated unless
+        _memory_checked().
+
+        Returns:
+            The MB reserved (give them back with admission.release), or None.
+        """
+        if not self._memory_checked():
+            return None
+        memory = self._memory_estimate(cmd, model_name, metrics.tracks)
+        if memory is None:
+            return None
+        metrics.estimate_mb, metrics.prior_mb, metrics.params = memory[:3]
+
+        def on_wait():
+            self._set_status(f"{model_name}: waiting until its {memory[0]:.0f} MB fit the memory budget...")
+        self.admission.acquire(memory[0], self.cancel_event, on_wait)
+        return memory[0]
+
+    def _long_inputs(self, tracks):
+        """Returns the tracks longer than long_input_seconds in config.json (0 turns segmenting off)."""
+        threshold = self.config.get('long_input_seconds', 1800)
+        if not threshold:
+            return []
+        return [track for track in tracks if (audio_duration(track) or 0) > threshold]
+
+    def _run_segmented(self, cmd, model_name, progress, track, key=None, cpu_slot=None):
+        """
+        Separates one long track in overlapping segments and stitches each stem back together.
+
+        The segments (segment_seconds long, overlapping by segment_overlap_seconds, from
+        config.json) go through the same command in one run, so the model is loaded once
+        and memory use is set by the segment length. The stems are crossfaded in the
+        middle of each overlap and written to the output folder as a whole-file run would.
+
+        Returns:
+            True or False like _run_separation, or None if the track can't be split here
+            (numpy missing or a format AudioBlockReader can't read).
+        """
+        output_dir = cmd[cmd.index("--store_dir") + 1]
+        stem = os.path.splitext(os.path.basename(track))[0]
+        try:
+            reader = AudioBlockReader(track)
+        except (UnsupportedAudioError, OSError) as e:
+            logging.warning(f"Separating {os.path.basename(track)} whole, it can't be split into segments: {e}")
+            return None
+
+        overlap_seconds = self.config.get('segment_overlap_seconds', 10)
+        segment_frames = round(self.config.get('segment_seconds', 600) * reader.rate)
+        overlap_frames = min(round(overlap_seconds * reader.rate), segment_frames // 2)
+        segments = plan_segments(reader.frames, segment_frames, overlap_frames)
+        work_dir = self.scratch.new_dir('segments-')
+        try:
+            self._set_status(f"Splitting {os.path.basename(track)} into {len(segments)} segments...")
+            try:
+                split_audio(reader, segments, os.path.join(work_dir, 'in'), stem, cancel_event=self.cancel_event)
+            finally:
+                reader.close()
+
+            # Segments are separated as float WAV; the joined stems get the chosen format
+            run_cmd = [arg for arg in cmd if arg not in ("--flac_file", "--wav_file") and not arg.startswith("--pcm_type")]
+            run_cmd[run_cmd.index("--input_path") + 1] = os.path.join(work_dir, 'in')
+            run_cmd[run_cmd.index("--store_dir") + 1] = os.path.join(work_dir, 'out')
+            run_cmd.append("--wav_file")
+            os.makedirs(os.path.join(work_dir, 'out'), exist_ok=True)
+            if not self._run_inference(run_cmd, model_name, progress, len(segments), cpu_slot=cpu_slot, post_process=False):
+                return False
+
+            # '<stem>.seg0003_vocals.wav' -> stem 'vocals', segment 3
+            stems = collections.defaultdict(dict)
+            for name in os.listdir(os.path.join(work_dir, 'out')):
+                match = re.fullmatch(re.escape(stem) + r'\.seg(\d{4})_(.+)\.wav', name)
+                if match:
+                    stems[match.group(2)][int(match.group(1))] = os.path.join(work_dir, 'out', name)
+            incomplete = [instr for instr, files in stems.items() if len(files) != len(segments)]
+            if not stems or incomplete:
+                self._show_error(f"Separation of {os.path.basename(track)} is missing segments of: {', '.join(incomplete) or 'every stem'}")
+                return False
+
+            export_format = self.options['export_format']
+            extension = 'flac' if export_format.startswith('flac') else 'wav'
+            before = self._snapshot_outputs(output_dir, [track]) if key else None
+            os.makedirs(output_dir, exist_ok=True)
+            post_settings = self._post_settings()
+            for instr, files in sorted(stems.items()):
+                self._set_status(f"Joining the {instr} segments of {os.path.basename(track)}...")
+                output_file = os.path.join(output_dir, f"{stem}_{instr}.{extension}")
+                # Normalising needs the peak of the whole stem, so it is joined in scratch space first
+                joined_file = os.path.join(work_dir, f"{stem}_{instr}.wav") if post_settings else output_file
+                stitch_segments([files[i] for i in range(len(segments))], segments, joined_file, overlap_frames // 2,
+                                'wav FLOAT' if post_settings else export_format, reader.rate, cancel_event=self.cancel_event)
+                if post_settings:
+                    post_process_file(joined_file, output_file, export_format, post_settings['normalize_peak_db'])
+            if key:
+                self._store_outputs(model_name, output_dir, [track], {track: key}, before)
+            return True
+        except (UnsupportedAudioError, ValueError, OSError) as e:
+            self._show_error(f"Could not join the segments of {os.path.basename(track)}: {e}")
+            return False
+        finally:
+            self.scratch.release(work_dir)
+
+    def _post_settings(self):
+        """Returns the settings the post-processing stage applies, or None when it only encodes."""
+        if self.options.get('normalize_peak'):
+            return {'normalize_peak_db': self.config.get('normalize_peak_db', -1.0)}
+        return None
+
+    def _start_post_processing(self, cmd):
+        """
+        Starts the post-processing stage for a run that needs it (FLAC output or peak
+        normalisation): inference.py then writes float WAV files to scratch space, and a
+        PostProcessor encodes them into the real output folder as they are finished.
+
+        Returns:
+            (PostProcessor, the command to run), or (None, cmd) when the run writes its
+            outputs itself.
+        """
+        post_settings = self._post_settings()
+        if not ("--flac_file" in cmd or post_settings):
+            return None, cmd
+        try:
+            import numpy  # noqa: F401 (AudioBlockReader needs it)
+            if "--flac_file" in cmd:
+                import soundfile  # noqa: F401 (open_audio_writer needs it for FLAC)
+        except ImportError as e:
+            if post_settings:
+                logging.warning(f"Peak normalisation needs {e.name}; writing the outputs unchanged")
+            return None, cmd
+
+        scratch_dir = self.scratch.new_dir('post-')
+        run_cmd = [arg for arg in cmd if arg not in ("--flac_file", "--wav_file") and not arg.startswith("--pcm_type")]
+        run_cmd[run_cmd.index("--store_dir") + 1] = scratch_dir
+        run_cmd.append("--wav_file")
+        output_dir = cmd[cmd.index("--store_dir") + 1]
+        post = PostProcessor(scratch_dir, output_dir, self.options['export_format'],
+                             post_settings and post_settings['normalize_peak_db'],
+                             self.config.get('post_process_workers') or min(4, os.cpu_count() or 1))
+        return post, run_cmd
+
+    def _finish_post_processing(self, post, ok):
+        """Waits for the post-processing stage of a run. Returns False if an output could not be written."""
+        try:
+            errors = post.finish(ok)
+        finally:
+            self.scratch.release(post.scratch_dir)
+        if errors:
+            self._show_error("Could not write these outputs:\n" + "\n".join(errors[:20]))
+            return False
+        return ok
+
+    def _run_inference(self, cmd, model_name, progress, track_count, keys=None, tracks=None, cpu_slot=None, post_process=True):
+        """
+        Runs one inference.py command (in the worker or as a child process) and adds the
+        outputs of tracks to the result cache when it succeeds.
+
+        Args:
+            cmd: The command to execute for separation.
+            model_name: The name of the model being used.
+            progress: The BatchProgress of the batch this run belongs to.
+            track_count: How many tracks the command separates.
+            keys: Track path -> result cache key, if the cache is in use.
+            tracks: The tracks the command separates (default: all tracks in keys).
+            cpu_slot: CPU ids to pin the inference.py process to, if any.
+            post_process: Whether FLAC encoding and normalisation may run as a separate
+                stage (see _start_post_processing).
+
+        Returns:
+            True if the separation succeeded, False otherwise.
+        """
+        output_dir = cmd[cmd.index("--store_dir") + 1]
+        tracks = list(keys) if tracks is None and keys else tracks or []
+        if keys:
+            before = self._snapshot_outputs(output_dir, tracks)
+        progress.start_run(model_name, track_count)
+        metrics = RunMetrics(progress, model_name, tracks or list_audio_files(cmd[cmd.index("--input_path") + 1]))
+
+        reserved_mb = self._reserve_memory(metrics, cmd, model_name)
+        post, run_cmd = None, cmd
+        ok = None
+        try:
+            if post_process:
+                post, run_cmd = self._start_post_processing(cmd)
+            # The worker runs one job at a time, so pinned (concurrent) runs, and runs that find
+            # it busy with another, get their own process
+            if (self.options['use_warm_worker'] and not self.worker_unsupported and cpu_slot is None
+                    and self.worker_lock.acquire(blocking=False)):
+                try:
+                    ok = self._run_in_worker(run_cmd, model_name, metrics)
+                    if ok is not None and self.worker is not None and self.worker.process is not None:
+                        metrics.peak_rss = process_peak_memory(self.worker.process.pid)  # Includes the other loaded models
+                        metrics.in_worker = True
+                finally:
+                    self.worker_lock.release()
+            if ok is None:
+                ok = self._run_inference_process(run_cmd, model_name, metrics, cpu_slot)
+        finally:
+            if reserved_mb is not None:
+                self.admission.release(reserved_mb)
+            if post is not None:
+                ok = self._finish_post_processing(post, bool(ok))
+        self._record_metrics(metrics.records(output_dir, ok))
+
+        if ok and keys:
+            self._store_outputs(model_name, output_dir, tracks, keys, before)
+        return ok
+
+    @staticmethod
+    def _output_owner(name, stems):
+        """Returns the track stem an output file (named '<stem>_<instrument>.<ext>') belongs to."""
+        owners = [stem for stem in stems if name.startswith(stem + '_')]
+        return max(owners, key=len) if owners else None
+
+    def _snapshot_outputs(self, output_dir, tracks):
+        """
+        Records the outputs already present for tracks, so new ones can be told apart after a
+        run. Outputs still hardlinked to a cache entry are removed first: inference.py
+        rewrites files in place, which would otherwise change the cached copy too.
+        """
+        stems = [os.path.splitext(os.path.basename(track))[0] for track in tracks]
+        snapshot = {}
+        if not os.path.isdir(output_dir):
+            return snapshot
+        for name in os.listdir(output_dir):
+            path = os.path.join(output_dir, name)
+            if not os.path.isfile(path) or self._output_owner(name, stems) is None:
+                continue
+            stat = os.stat(path)
+            if stat.st_nlink > 1:
+                os.remove(path)
+            else:
+                snapshot[name] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def _store_outputs(self, model_name, output_dir, tracks, keys, before):
+        stems = {os.path.splitext(os.path.basename(track))[0]: track for track in tracks}
+        outputs = collections.defaultdict(list)
+        for name in os.listdir(output_dir):
+            path = os.path.join(output_dir, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            owner = self._output_owner(name, stems)
+            if owner is not None and before.get(name) != (stat.st_size, stat.st_mtime_ns):
+                outputs[owner].append(path)
+
+        for stem, paths in outputs.items():
+            track = stems[stem]
+            self.result_cache.store(keys[track], stem, sorted(paths), {'model': model_name, 'track': os.path.basename(track)})
+
+    def _run_inference_process(self, cmd, model_name, progress=None, cpu_slot=None):
+        """
+        Runs inference.py as a child process, streaming its output. Returns True on success.
+
+        With cpu_slot, the child is pinned to those CPUs and its thread pools sized to match.
+        """
+        env = None
+        if cpu_slot:
+            env = dict(os.environ, **{name: str(len(cpu_slot)) for name in self.THREAD_ENV_VARS})
+        try:
+            # stderr is merged into stdout so tqdm's progress comes through the same pipe
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env)
+        except FileNotFoundError:
+            self._set_status("Could not find inference.py script.")
+            logging.error("Could not find inference.py script.")
+            self._show_error("Could not find the inference.py script. Ensure it's in the correct location.")
+            return False
+
+        if cpu_slot and hasattr(os, 'sched_setaffinity'):
+            # Set right after the start, long before torch creates its threads (they inherit it)
+            try:
+                os.sched_setaffinity(process.pid, cpu_slot)
+            except OSError as e:
+                logging.warning(f"Could not pin {model_name} to CPUs {cpu_slot}: {e}")
+
+        with self.process_lock:
+            self.active_processes.add(process)
+        if isinstance(progress, RunMetrics):
+            progress.watch(process)
+        output_tail = collections.deque(maxlen=20)
+        try:
+            for line in iter_output_lines(process.stdout, echo=self.echo):
+                output_tail.append(line)
+                if progress is not None:
+                    progress.feed(line)
+            returncode = process.wait()
+        finally:
+            with self.process_lock:
+                self.active_processes.discard(process)
+        if isinstance(progress, RunMetrics):
+            progress.exit_code = returncode
+
+        self._check_cancelled()
+        if returncode != 0:
+            error_message = f"An error occurred during separation of {model_name} (return code {returncode}):\n" + "\n".join(output_tail)
+            self._set_status(f"An error occurred during separation of {model_name} (return code {returncode})")
+            logging.error(error_message)  # Log the error
+            self._show_error(error_message)  # Display error message
+            return False
+        return True
+
+    def _run_in_worker(self, cmd, model_name, progress):
+        """
+        Runs the separation in the warm inference worker.
+
+        Args:
+            cmd: The command built by _build_separation_command.
+            model_name: The name of the model being used.
+            progress: The BatchProgress of the batch this run belongs to.
+
+        Returns:
+            True or False like _run_separation, or None if the caller should fall back
+            to running inference.py directly.
+        """
+        if self.worker is None:
+            self.worker = WorkerClient(self.config.get('worker_cache_mb', 4096), self.config.get('worker_max_models', 3))
+
+        try:
+            job_id = self.worker.submit(cmd[2:])  # Strip the interpreter and script name
+            result = self.worker.wait(job_id, on_event=lambda event: self._on_worker_event(event, model_name, progress),
+                                      cancel_event=self.cancel_event)
+        except OSError as e:
+            logging.error(f"Could not talk to the inference worker: {e}")
+            self.worker.stop()
+            return None
+
+        self._check_cancelled()
+        if result.get('ok'):
+            logging.info(f"{model_name} ran in the warm worker ({result.get('elapsed', 0):.1f}s).")
+            return True
+
+        if result.get('stage') == 'setup':
+            # This inference.py doesn't expose what the worker needs, don't try again this session
+            logging.warning(f"Inference worker unavailable, falling back to inference.py: {result.get('error')}")
+            self.worker_unsupported = True
+            self.worker.stop()
+            return None
+
+        error_message = f"An error occurred during separation of {model_name}:\n{result.get('error')}"
+        self._set_status(f"An error occurred during separation of {model_name}")
+        logging.error(error_message)
+        self._show_error(error_message)
+        return False
+
+    def _on_worker_event(self, event, model_name, progress):
+        if event.get('event') == 'progress':
+            progress.update(event['percent'])
+        elif event.get('event') == 'loaded':
+            source = "already loaded" if event.get('cached') else f"loaded in {event.get('load_time', 0):.1f}s"
+            logging.info(f"{model_name}: model {source}")
+
+class MusicSeparationGUI:
+    def __init__(self, master):
+        self.master = master
+        master.title("Music Source Separation")
+
+        # Background job state. Jobs run on their own thread and hand GUI updates
+        # back to the Tk thread through ui_queue.
+        self.ui_queue = queue.Queue()
+        self.job_thread = None
+
+        self.core = SeparationCore(on_status=self._set_status, on_error=self._show_error, on_progress=self._on_batch_progress)
+
+        # Modify inference.py if needed
+        self.core.check_and_modify_inference_py()
+
+        # Create the main frame
+        self.main_frame = ttk.Frame(master, padding="10")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        master.columnconfigure(0, weight=1)
+        master.rowconfigure(0, weight=1)
+
+        # Create sections
+        self.create_io_section()
+        self.create_model_section()
+        self.create_options_section()
+        self.create_action_section()
+
+        # Multi-model and ensemble windows (built the first time they're opened)
+        self.multi_model_window = None
+        self.ensemble_window = None
+        self.spool_window = None
+
+        master.after(100, self._process_ui_queue)
+
+    @property
+    def config(self):
+        return self.core.config
+
+    @property
+    def model_info(self):
+        return self.core.model_info
+
+    def create_io_section(self):
+        io_frame = ttk.LabelFrame(self.main_frame, text="Input/Output", padding="10")
+        io_frame.grid(column=0, row=0, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        io_frame.columnconfigure(1, weight=1)
+
+        # Input path (now can be file or folder)
+        ttk.Label(io_frame, text="Input Path:").grid(column=0, row=0, sticky=tk.W)
+        self.input_path = tk.StringVar(value=self.config.get('input_path', '')) # Changed variable name
+        ttk.Entry(io_frame, width=50, textvariable=self.input_path).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5) # Changed variable name
+        ttk.Button(io_frame, text="Browse", command=self.browse_input_path).grid(column=2, row=0) # Changed browse function
+
+        # Output folder
+        ttk.Label(io_frame, text="Output Folder:").grid(column=0, row=1, sticky=tk.W)
+        self.output_folder = tk.StringVar(value=self.config.get('output_folder', ''))
+        ttk.Entry(io_frame, width=50, textvariable=self.output_folder).grid(column=1, row=1, sticky=(tk.W, tk.E), padx=5)
+        ttk.Button(io_frame, text="Browse", command=self.browse_output).grid(column=2, row=1)
+
+        # Model Folder Sort checkbox
+        self.model_folder_sort = tk.BooleanVar(value=self.config.get('model_folder_sort', False))
+        ttk.Checkbutton(io_frame, text="Organize Output Per Model", variable=self.model_folder_sort).grid(column=0, row=2, sticky=tk.W, columnspan=2)
+
+    def create_model_section(self):
+        model_frame = ttk.LabelFrame(self.main_frame, text="Model Selection", padding="10")
+        model_frame.grid(column=0, row=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        model_frame.columnconfigure(1, weight=1)  # Allow column 1 to expand
+        model_frame.rowconfigure(1, weight=1)
+
+        # Model Type Selection
+        ttk.Label(model_frame, text="Model Type:").grid(column=0, row=0, sticky=tk.W)
+        self.model_type = tk.StringVar(value=self.config.get('model_type', 'VOCALS'))
+
+        self.model_type_options = self.core.catalog.categories
+        self.model_type_combo = ttk.Combobox(model_frame, textvariable=self.model_type,
+                                             values=self.model_type_options, width=30)
+        self.model_type_combo.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
+        self.model_type_combo.bind("<<ComboboxSelected>>", self.update_model_list)
+
+        # Specific Model Selection
+        ttk.Label(model_frame, text="Specific Model:").grid(column=0, row=1, sticky=tk.NW)
+        self.model = tk.StringVar(value=self.config.get('model', ''))
+        self.model_list = tk.Listbox(model_frame, selectmode=tk.SINGLE, height=5)
+        self.model_list.grid(column=1, row=1, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
+        model_scrollbar = ttk.Scrollbar(model_frame, orient="vertical", command=self.model_list.yview)
+        model_scrollbar.grid(column=2, row=1, sticky=(tk.N, tk.S))
+        self.model_list.configure(yscrollcommand=model_scrollbar.set)
+
+        # Create a frame for the buttons to prevent them from expanding
+        buttons_frame = ttk.Frame(model_frame)
+        buttons_frame.grid(column=1, row=2, pady=(5, 0))
+
+        # Center the buttons within the buttons_frame
+        buttons_frame.columnconfigure(0, weight=1)
+        buttons_frame.columnconfigure(1, weight=1)
+        buttons_frame.columnconfigure(2, weight=1)
+
+        # Multi-Model Selection Button
+        self.multi_model_button = ttk.Button(buttons_frame, text="Multi-Model", command=self.open_multi_model_window)
+        self.multi_model_button.grid(column=0, row=0, padx=(0, 5))
+
+        # Ensemble Mode Button
+        ttk.Button(buttons_frame, text="Ensemble", command=self.open_ensemble_window).grid(column=1, row=0)
+
+        # Shared job queue for spool workers on other machines
+        ttk.Button(buttons_frame, text="Spool...", command=self.open_spool_window).grid(column=2, row=0, padx=(5, 0))
+
+        # Update Models button
+        ttk.Button(model_frame, text="Update Models", command=self.update_models_from_github).grid(column=1, row=3, pady=(5, 0))
+
+        self.update_model_list()
+
+    def create_options_section(self):
+        options_frame = ttk.LabelFrame(self.main_frame, text="Processing Options", padding="10")
+        options_frame.grid(column=0, row=2, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        options_frame.columnconfigure(1, weight=1)
+
+        # Extract instrumental
+        self.extract_instrumental = tk.BooleanVar(value=self.config.get('extract_instrumental', True))
+        ttk.Checkbutton(options_frame, text="Extract other stem", variable=self.extract_instrumental).grid(column=0, row=0, sticky=tk.W, columnspan=2)
+
+        # Export format
+        ttk.Label(options_frame, text="Export Format:").grid(column=0, row=1, sticky=tk.W)
+        self.export_format = tk.StringVar(value=self.config.get('export_format', 'wav FLOAT'))
+        ttk.Combobox(options_frame, textvariable=self.export_format, values=['wav FLOAT', 'flac PCM_16', 'flac PCM_24']).grid(column=1, row=1, sticky=(tk.W, tk.E))
+
+        # Advanced Options Frame
+        advanced_frame = ttk.LabelFrame(options_frame, text="Advanced Options", padding="10")
+        advanced_frame.grid(column=0, row=2, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=(10, 0)) # Add padding at the top
+
+        # Use default parameters checkbox
+        self.use_default_params = tk.BooleanVar(value=True)  # Initially checked
+        ttk.Checkbutton(advanced_frame, text="Use Default Parameters", variable=self.use_default_params, command=self.toggle_advanced_options).grid(column=0, row=0, sticky=tk.W, columnspan=3)
+
+        # Use TTA
+        self.use_tta = tk.BooleanVar(value=self.config.get('use_tta', False))
+        self.tta_checkbutton = ttk.Checkbutton(advanced_frame, text="Use TTA", variable=self.use_tta, state=tk.DISABLED)  # Initially disabled
+        self.tta_checkbutton.grid(column=0, row=1, sticky=tk.W, columnspan=3)
+
+        # Overlap
+        ttk.Label(advanced_frame, text="Overlap:").grid(column=0, row=2, sticky=tk.W)
+        self.overlap = tk.IntVar(value=self.config.get('overlap', 2))
+
+        # Use a Frame to hold the Entry and Scale
+        overlap_frame = ttk.Frame(advanced_frame)
+        overlap_frame.grid(column=1, row=2, sticky=(tk.W, tk.E))
+
+        self.overlap_entry = ttk.Entry(overlap_frame, width=5, textvariable=self.overlap, state=tk.DISABLED)
+        self.overlap_entry.pack(side=tk.LEFT, padx=(0, 5))
+
+        self.overlap_scale = ttk.Scale(overlap_frame, from_=1, to=40, variable=self.overlap, orient=tk.HORIZONTAL, state=tk.DISABLED, command=self.update_overlap_entry)
+        self.overlap_scale.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
+        # Bind <Return> on Entry to update the Scale
+        self.overlap_entry.bind("<Return>", self.update_overlap_scale)
+
+        # Chunk size
+        ttk.Label(advanced_frame, text="Chunk Size:").grid(column=0, row=3, sticky=tk.W)
+        self.chunk_size = tk.IntVar(value=self.config.get('chunk_size', 352800))
+        values = [352800, 485100]
+        self.chunk_size_combo = ttk.Combobox(advanced_frame, textvariable=self.chunk_size, values=values, state=tk.DISABLED)
+        self.chunk_size_combo.grid(column=1, row=3, sticky=(tk.W, tk.E))
+        self.chunk_size_combo.current(values.index(self.chunk_size.get()) if self.chunk_size.get() in values else 0) # Set current value based on self.chunk_size
+
+        # Timed trials of the selected model pick the fastest settings for this machine
+        self.use_tuned_params = tk.BooleanVar(value=self.config.get('use_tuned_params', True))
+        ttk.Checkbutton(advanced_frame, text="Use auto-tuned settings", variable=self.use_tuned_params).grid(column=0, row=4, sticky=tk.W, columnspan=2, pady=(5, 0))
+        ttk.Button(advanced_frame, text="Auto-tune", command=self.autotune).grid(column=2, row=4, sticky=tk.E, pady=(5, 0))
+
+        # Keep models loaded in a background worker between runs
+        self.use_warm_worker = tk.BooleanVar(value=self.config.get('use_warm_worker', True))
+        ttk.Checkbutton(options_frame, text="Keep models loaded between runs", variable=self.use_warm_worker).grid(column=0, row=3, sticky=tk.W, columnspan=2, pady=(5, 0))
+
+        # Reuse earlier results for tracks already separated with the same settings
+        self.use_result_cache = tk.BooleanVar(value=self.config.get('use_result_cache', True))
+        ttk.Checkbutton(options_frame, text="Reuse cached results", variable=self.use_result_cache).grid(column=0, row=4, sticky=tk.W, columnspan=2)
+
+        # Independent multi-model runs at the same time, each on its own share of the CPUs
+        ttk.Label(options_frame, text="Parallel jobs:").grid(column=0, row=5, sticky=tk.W)
+        self.parallel_jobs = tk.IntVar(value=self.config.get('parallel_jobs', 1))
+        ttk.Spinbox(options_frame, from_=1, to=os.cpu_count() or 1, width=5, textvariable=self.parallel_jobs).grid(column=1, row=5, sticky=tk.W)
+
+        # Scale the outputs to the same peak level (normalize_peak_db in config.json)
+        self.normalize_peak = tk.BooleanVar(value=self.config.get('normalize_peak', False))
+        ttk.Checkbutton(options_frame, text="Normalize output peaks", variable=self.normalize_peak).grid(column=0, row=6, sticky=tk.W, columnspan=2)
+
+    def update_overlap_entry(self, *args):
+        """Updates the overlap entry when the slider is moved."""
+        try:
+            value = int(self.overlap_scale.get())
+            self.overlap.set(value)
+        except ValueError:
+            pass
+
+    def update_overlap_scale(self, event=None):
+        """Updates the slider when the overlap entry is changed."""
+        try:
+            value = self.overlap.get()
+            if 1 <= value <= 40:
+                self.overlap_scale.set(value)
+        except (ValueError, tk.TclError):
+            pass
+
+    def toggle_advanced_options(self):
+        state = tk.NORMAL if not self.use_default_params.get() else tk.DISABLED
+        self.tta_checkbutton.config(state=state)
+        self.overlap_entry.config(state=state)
+        self.overlap_scale.config(state=state)  # Enable/disable the slider too
+        self.chunk_size_combo.config(state=state)
+
+    def create_action_section(self):
+        action_frame = ttk.Frame(self.main_frame, padding="10")
+        action_frame.grid(column=0, row=3, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        action_frame.columnconfigure(0, weight=1)
+
+        # Separate and Cancel buttons
+        run_buttons_frame = ttk.Frame(action_frame)
+        run_buttons_frame.grid(column=0, row=0, pady=(0, 5))
+        self.separate_button = ttk.Button(run_buttons_frame, text="Separate", command=self.separate)
+        self.separate_button.grid(column=0, row=0, padx=(0, 5))
+        self.cancel_button = ttk.Button(run_buttons_frame, text="Cancel", command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.grid(column=1, row=0)
+
+        # Status label
+        self.status = tk.StringVar(value="Ready")
+        ttk.Label(action_frame, textvariable=self.status).grid(column=0, row=1)
+
+        # Progress bars (whole batch, then the current track)
+        self.progress_var = tk.DoubleVar(value=0.0)
+        self.progress_bar = ttk.Progressbar(action_frame, orient="horizontal", mode="determinate", variable=self.progress_var, maximum=100)
+        self.progress_bar.grid(column=0, row=2, pady=(5, 0))
+        self.track_progress_var = tk.DoubleVar(value=0.0)
+        self.track_progress_bar = ttk.Progressbar(action_frame, orient="horizontal", mode="determinate", variable=self.track_progress_var, maximum=100)
+        self.track_progress_bar.grid(column=0, row=3, pady=(2, 0))
+
+        # Credit label with hyperlink
+        credit_label = ttk.Label(action_frame, text="GUI made by Sifted Sand Records",
+                                  cursor="hand2", font=("TkDefaultFont", 8, "underline"), foreground="blue")
+        credit_label.grid(column=0, row=4, pady=(5, 0))
+        credit_label.bind("<Button-1>", self.open_credit_link)
+
+    def open_credit_link(self, event=None):
+        import webbrowser  # Only needed when the link is clicked
+        webbrowser.open_new("https://lnk.bio/siftedsand")
+
+    def save_config(self):
+        self.config['input_path'] = self.input_path.get() # Changed to input_path
+        self.config['output_folder'] = self.output_folder.get()
+        self.config['model_type'] = self.model_type.get()
+        self.config['model'] = self.model.get()
+        self.config['model_folder_sort'] = self.model_folder_sort.get()
+        self.config['extract_instrumental'] = self.extract_instrumental.get()
+        self.config['export_format'] = self.export_format.get()
+        self.config['use_tta'] = self.use_tta.get()
+        self.config['overlap'] = self.overlap.get()
+        self.config['chunk_size'] = self.chunk_size.get()
+        self.config['use_warm_worker'] = self.use_warm_worker.get()
+        self.config['use_result_cache'] = self.use_result_cache.get()
+        self.config['use_tuned_params'] = self.use_tuned_params.get()
+        self.config['normalize_peak'] = self.normalize_peak.get()
+        self.config['parallel_jobs'] = self._get_parallel_jobs()
+        self.config['last_inference_py_edit'] = self.config.get('last_inference_py_edit') # Save the timestamp
+
+        self.core.save_config()
+
+    def update_model_list(self, event=None):
+        selected_type = self.model_type.get()
+        self.model_list.delete(0, tk.END)
+
+        # The catalog keeps each category's models sorted
+        filtered_models = self.core.catalog.by_category.get(selected_type, [])
+        if filtered_models:
+            self.model_list.insert(tk.END, *filtered_models)
+
+        # Select the first model by default if available
+        if self.model_list.size() > 0:
+            self.model_list.selection_set(0)
+            self.model_list.see(0)
+
+    def browse_input_path(self): # Changed function name
+        file_or_folder = filedialog.askopenfilename(filetypes=[("Audio files", "*.wav;*.flac;*.mp3;*.aiff;*.aif"), ("Folders", "*")]) # Allow file or folder selection
+        if file_or_folder:
+            if os.path.isfile(file_or_folder) or os.path.isdir(file_or_folder): # Check if selected path is valid
+                self.input_path.set(file_or_folder) # Changed to input_path
+                self.save_config()
+            else:
+                messagebox.showerror("Error", "Invalid input path selected.")
+                return
+
+    def browse_output(self):
+        folder = filedialog.askdirectory()
+        if folder:
+            if not os.path.isdir(folder):
+                messagebox.showerror("Error", "Invalid output folder selected.")
+                return
+            self.output_folder.set(folder)
+            self.save_config()
+
+    def separate(self):
+        selected_model = self.model_list.get(tk.ANCHOR)
+        if not selected_model or selected_model not in self.model_info:
+            messagebox.showerror("Error", "Please select a valid model.")
+            return
+
+        self._start_job(self.core.separate, (selected_model,))
+
+    def autotune(self):
+        selected_model = self.model_list.get(tk.ANCHOR)
+        if not selected_model or selected_model not in self.model_info:
+            messagebox.showerror("Error", "Please select a valid model.")
+            return
+        sample_path = filedialog.askopenfilename(title="Select a Sample Track",
+                                                 filetypes=(("Audio Files", " ".join("*" + ext for ext in AUDIO_EXTENSIONS)), ("All Files", "*.*")))
+        if sample_path:
+            self._start_job(self.core.autotune, (selected_model, sample_path))
+
+    def _collect_options(self):
+        """Snapshots the Tk variables so background jobs never have to touch Tk."""
+        return {
+            'input_path': self.input_path.get(),
+            'output_folder': self.output_folder.get(),
+            'model_folder_sort': self.model_folder_sort.get(),
+            'extract_instrumental': self.extract_instrumental.get(),
+            'export_format': self.export_format.get(),
+            'use_default_params': self.use_default_params.get(),
+            'use_tta': self.use_tta.get(),
+            'overlap': self.overlap.get(),
+            'chunk_size': self.chunk_size.get(),
+            'use_warm_worker': self.use_warm_worker.get(),
+            'use_result_cache': self.use_result_cache.get(),
+            'parallel_jobs': self._get_parallel_jobs(),
+            'use_tuned_params': self.use_tuned_params.get(),
+            'normalize_peak': self.normalize_peak.get(),
+        }
+
+    def _get_parallel_jobs(self):
+        try:
+            return max(1, self.parallel_jobs.get())
+        except tk.TclError:  # Not a number
+            return 1
+
+    def _start_job(self, target, args=(), on_done=None):
+        """
+        Runs target(*args) on a background thread so the window stays responsive.
+
+        Args:
+            target: Usually a SeparationCore flow such as self.core.separate.
+            args: Arguments for target.
+            on_done: Called on the Tk thread once the job has finished, whatever the outcome.
+
+        Returns:
+            False if another job is still running, True otherwise.
+        """
+        if self.job_thread is not None and self.job_thread.is_alive():
+            messagebox.showwarning("Busy", "A separation is already running.")
+            return False
+
+        self.core.options = self._collect_options()
+        self.core.cancel_event.clear()
+        self._set_running(True)
+        self.job_thread = threading.Thread(target=self._job_main, args=(target, args, on_done), daemon=True)
+        self.job_thread.start()
+        return True
+
+    def _job_main(self, target, args, on_done):
+        try:
+            self.core.results = []
+            target(*args)
+        except JobCancelled:
+            self._set_status("Separation cancelled.")
+            logging.info("Job cancelled by the user.")
+        except Exception as e:
+            logging.exception(f"An unexpected error occurred during separation: {e}")  # Log the full traceback
+            self._set_status(f"An unexpected error occurred: {e}")
+            self._show_error(f"An unexpected error occurred during separation: {e}")
+        finally:
+            self._ui(self._set_running, False)
+            self._ui(self.save_config)
+            if on_done is not None:
+                self._ui(on_done)
+
+    def _set_running(self, running):
+        self.separate_button.config(state=tk.DISABLED if running else tk.NORMAL)
+        self.multi_model_button.config(state=tk.DISABLED if running else tk.NORMAL)
+        self.cancel_button.config(state=tk.NORMAL if running else tk.DISABLED)
+
+    def cancel_job(self):
+        """Stops the running batch, terminating whatever child process is working on it."""
+        if self.job_thread is None or not self.job_thread.is_alive():
+            return
+        self.status.set("Cancelling...")
+        self.core.cancel()
+
+    def _ui(self, func, *args):
+        """Runs func(*args) on the Tk thread, right away if we're already on it."""
+        if threading.current_thread() is threading.main_thread():
+            func(*args)
+        else:
+            self.ui_queue.put((func, args))
+
+    def _process_ui_queue(self):
+        while True:
+            try:
+                func, args = self.ui_queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                func(*args)
+            except Exception:
+                logging.exception("Error while updating the GUI")
+        self.master.after(100, self._process_ui_queue)
+
+    def _set_status(self, text):
+        self._ui(self.status.set, text)
+
+    def _show_error(self, message):
+        self._ui(messagebox.showerror, "Error", message)
+
+    def _on_batch_progress(self, progress):
+        if progress.running:
+            self._set_status(f"Separating ({progress.label}) - track {progress.track_index + 1}/{progress.track_count}: {progress.track_percent}%")
+        self._ui(self.track_progress_var.set, progress.track_percent)
+        self._ui(self.progress_var.set, progress.batch_percent)
+
+    def update_models_from_github(self):
+        self.status.set("Updating models...")
+        result = {}
+
+        def run():
+            try:
+                result['changes'] = self.core.update_models()
+            except (OSError, ValueError) as e:
+                self.core._set_status(f"Error updating models: {e}")
+
+        def done():
+            changes = result.get('changes')
+            if changes is None:
+                return
+            if any(changes.values()):
+                self.model_type_options = self.core.catalog.categories
+                self.model_type_combo.configure(values=self.model_type_options)
+                self.update_model_list()
+                if self.multi_model_window is not None and self.multi_model_window.master.winfo_exists():
+                    self.multi_model_window.update_model_list()
+                self.status.set(f"Models updated: {len(changes['added'])} added, {len(changes['removed'])} removed, "
+                                f"{len(changes['changed'])} changed.")
+            else:
+                self.status.set("Models are up to date.")
+
+        self._start_job(run, on_done=done)
+
+    def open_multi_model_window(self):
+        if self.multi_model_window is None or not self.multi_model_window.master.winfo_exists():
+            self.multi_model_window = MultiModelWindow(self)
+        else:
+            self.multi_model_window.master.lift()  # Bring window to the front
+
+        # Update the list of models in the multi-model window
+        self.multi_model_window.update_model_list()
+
+    def open_ensemble_window(self):
+        if self.ensemble_window is None or not self.ensemble_window.master.winfo_exists():
+            self.ensemble_window = EnsembleWindow(self)
+        else:
+            # Closing only hides the window, so reopening it is instant and keeps the inputs
+            self.ensemble_window.master.deiconify()
+            self.ensemble_window.master.lift()
+
+    def open_spool_window(self):
+        if self.spool_window is None or not self.spool_window.master.winfo_exists():
+            self.spool_window = SpoolWindow(self)
+        else:
+            self.spool_window.master.lift()
+
+    def queue_jobs(self, jobs):
+        """
+        Queues CLI-style jobs (see run_job) in the spool folder for spool workers.
+
+        Returns:
+            False if no spool folder is chosen or the jobs could not be queued.
+        """
+        spool_dir = self.config.get('spool_dir')
+        if not spool_dir:
+            spool_dir = filedialog.askdirectory(title="Select Spool Folder")
+            if not spool_dir:
+                return False
+            self.config['spool_dir'] = spool_dir
+            self.save_config()
+        try:
+            count = submit_to_spool(spool_dir, jobs)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not queue the jobs: {e}")
+            return False
+        if count == 0:
+            messagebox.showerror("Error", "No audio files found in the input path.")
+            return False
+        self._set_status(f"Queued {count} job(s) in {spool_dir}")
+        self.open_spool_window()
+        return True
+
+    def job_from_settings(self, **job):
+        """Builds a spool job from the main window's input, output and options."""
+        options = self._collect_options()
+        job.update(input_path=options.pop('input_path'), output_folder=options.pop('output_folder'), options=options)
+        return job
+
+class SpoolWindow:
+    REFRESH_MS = 2000
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.master = tk.Toplevel(parent.master)
+        self.master.title("Spool Queue")
+
+        self.main_frame = ttk.Frame(self.master, padding="10")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.master.columnconfigure(0, weight=1)
+        self.master.rowconfigure(0, weight=1)
+        self.main_frame.columnconfigure(1, weight=1)
+
+        # Spool folder shared with the workers (`AutoGUI.py spool-worker <folder>`)
+        ttk.Label(self.main_frame, text="Spool Folder:").grid(column=0, row=0, sticky=tk.W)
+        self.spool_dir = tk.StringVar(value=parent.config.get('spool_dir', ''))
+        ttk.Entry(self.main_frame, textvariable=self.spool_dir, width=50).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
+        ttk.Button(self.main_frame, text="Browse", command=self.browse_spool_dir).grid(column=2, row=0)
+
+        self.progress = ttk.Progressbar(self.main_frame, orient="horizontal", mode="determinate", maximum=100)
+        self.progress.grid(column=0, row=1, columnspan=3, sticky=(tk.W, tk.E), pady=(10, 5))
+        self.status_text = tk.StringVar()
+        ttk.Label(self.main_frame, textvariable=self.status_text, justify=tk.LEFT).grid(column=0, row=2, columnspan=3, sticky=tk.W)
+
+        buttons_frame = ttk.Frame(self.main_frame)
+        buttons_frame.grid(column=0, row=3, columnspan=3, pady=(10, 0))
+        ttk.Button(buttons_frame, text="Queue Selected Model", command=self.queue_selected_model).grid(column=0, row=0, padx=(0, 5))
+        ttk.Button(buttons_frame, text="Close", command=self.close_window).grid(column=1, row=0)
+
+        self.master.protocol("WM_DELETE_WINDOW", self.close_window)
+        self.refresh()
+
+    def browse_spool_dir(self):
+        spool_dir = filedialog.askdirectory(parent=self.master, title="Select Spool Folder")
+        if spool_dir:
+            self.spool_dir.set(spool_dir)
+            self.parent.config['spool_dir'] = spool_dir
+            self.refresh()
+
+    def queue_selected_model(self):
+        selected_model = self.parent.model_list.get(tk.ANCHOR)
+        if not selected_model or selected_model not in self.parent.model_info:
+            messagebox.showerror("Error", "Please select a valid model in the main window.", parent=self.master)
+            return
+        self.parent.config['spool_dir'] = self.spool_dir.get()
+        self.parent.queue_jobs([self.parent.job_from_settings(mode='single', model=selected_model)])
+        self.refresh()
+
+    def refresh(self):
+        if not self.master.winfo_exists():
+            return
+        spool_dir = self.spool_dir.get()
+        if spool_dir and os.path.isdir(spool_dir):
+            try:
+                status = SpoolQueue(spool_dir).status()
+                self.progress['value'] = status['percent']
+                self.status_text.set(format_spool_status(status))
+            except OSError as e:
+                self.status_text.set(f"Could not read the spool: {e}")
+        else:
+            self.status_text.set("Choose the folder the spool workers watch.")
+        self.master.after(self.REFRESH_MS, self.refresh)
+
+    def close_window(self):
+        self.parent.spool_window = None
+        if self.master.winfo_exists():
+            self.master.destroy()
+
+class MultiModelWindow:
+    def __init__(self, parent):
+        self.parent = parent
+        self.master = tk.Toplevel(parent.master)
+        self.master.title("Multi-Model Selection")
+
+        # Frame
+        self.main_frame = ttk.Frame(self.master, padding="10")
+        self.main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.master.columnconfigure(0, weight=1)
+        self.master.rowconfigure(0, weight=1)
+        self.master.resizable(True, True)  # Allow resizing in both directions
+
+        # Filter Entry
+        ttk.Label(self.main_frame, text="Filter:").grid(column=0, row=0, sticky=tk.W)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", self.schedule_model_list_update)
+        self.filter_after_id = None
+        ttk.Entry(self.main_frame, textvariable=self.filter_var).grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
+
+        # Model Listbox
+        self.model_list = tk.Listbox(self.main_frame, selectmode=tk.EXTENDED, exportselection=False, height=10)
+        self.model_list.grid(column=0, row=1, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5)
+        model_scrollbar = ttk.Scrollbar(self.main_frame, orient="vertical", command=self.model_list.yview)
+        model_scrollbar.grid(column=3, row=1, sticky=(tk.N, tk.S))
+        self.model_list.configure(yscrollcommand=model_scrollbar.set)
+        self.main_frame.columnconfigure(0, weight=1)  # Column 0 expands horizontally
+        self.main_frame.columnconfigure(1, weight=1)  # Column 1 expands horizontally
+        self.main_frame.columnconfigure(2, weight=0) # Column 2 doesn't expand
+        self.main_frame.columnconfigure(4, weight=1)  # Column 4 expands horizontally
+        self.main_frame.rowconfigure(1, weight=1)    # Row 1 expands vertically
+        self.model_list.config(width=0) # Listbox width will now adjust to fit content
+
+        # Model Order Listbox
+        ttk.Label(self.main_frame, text="Model Order:").grid(column=4, row=0, sticky=tk.W)
+        self.order_list = tk.Listbox(self.main_frame, height=10, exportselection=False)
+        self.order_list.grid(column=4, row=1, padx=5, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.order_list.bind("<<ListboxSelect>>", self.on_order_select)
+
+        # Sequential mode: which stems of the previous model each model separates
+        self.input_stems = {}  # Model name -> list of stems, missing means all of them
+        self.stems_model = None  # The model whose stems the entry below edits
+        stems_frame = ttk.Frame(self.main_frame)
+        stems_frame.grid(column=4, row=4, sticky=(tk.W, tk.E), padx=5)
+        stems_frame.columnconfigure(1, weight=1)
+        ttk.Label(stems_frame, text="Input stems:").grid(column=0, row=0, sticky=tk.W)
+        self.stems_var = tk.StringVar()
+        self.stems_entry = ttk.Entry(stems_frame, textvariable=self.stems_var, state=tk.DISABLED)
+        self.stems_entry.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=(5, 0))
+        self.stems_var.trace_add("write", self.on_stems_changed)
+
+        # Add Model Button
+        ttk.Button(self.main_frame, text="Add ->", command=self.add_to_order).grid(column=1, row=2, pady=5)
+
+        # Remove Model Button
+        ttk.Button(self.main_frame, text="<- Remove", command=self.remove_from_order).grid(column=2, row=2, pady=5)
+
+        # Move Up Button
+        ttk.Button(self.main_frame, text="Move Up", command=lambda: self.move_in_order(-1)).grid(column=4, row=2, sticky=tk.W, pady=5)
+
+        # Move Down Button
+        ttk.Button(self.main_frame, text="Move Down", command=lambda: self.move_in_order(1)).grid(column=4, row=2, sticky=tk.E, pady=5)
+
+        # Processing Mode
+        ttk.Label(self.main_frame, text="Mode:").grid(column=0, row=3, sticky=tk.W, pady=(5, 0))
+        self.processing_mode = tk.StringVar(value="Sequential")  # Default mode
+        tk.Radiobutton(self.main_frame, text="Sequential", variable=self.processing_mode, value="Sequential").grid(column=1, row=3, sticky=tk.W, pady=(5, 0))
+        tk.Radiobutton(self.main_frame, text="Independent", variable=self.processing_mode, value="Independent").grid(column=2, row=3, sticky=tk.W, pady=(5, 0))
+
+        # Process Button
+        ttk.Button(self.main_frame, text="Process", command=self.process_multi_model).grid(column=4, row=3, pady=5)
+
+        # Close Button
+        ttk.Button(self.main_frame, text="Close", command=self.close_window).grid(column=0, row=4, pady=5)
+
+        # Chain Buttons
+        ttk.Button(self.main_frame, text="Save Chain", command=self.save_chain).grid(column=1, row=4, pady=5)
+        ttk.Button(self.main_frame, text="Load Chain", command=self.load_chain).grid(column=2, row=4, pady=5)
+        ttk.Button(self.main_frame, text="Queue to Spool", command=self.queue_to_spool).grid(column=4, row=5, sticky=tk.E, padx=5, pady=5)
+        # Picks up the last unfinished batch in the output folder
+        ttk.Button(self.main_frame, text="Resume Batch", command=self.resume_batch).grid(column=0, row=5, sticky=tk.W, pady=5)
+
+        self.master.geometry("800x400") # Initial size, but user can resize
+
+        self.update_model_list()
+
+    # Milliseconds the filter waits for typing to pause before updating the list
+    FILTER_DELAY_MS = 150
+
+    def schedule_model_list_update(self, *args):
+        if self.filter_after_id is not None:
+            self.master.after_cancel(self.filter_after_id)
+        self.filter_after_id = self.master.after(self.FILTER_DELAY_MS, self.update_model_list)
+
+    def update_model_list(self, *args):
+        self.filter_after_id = None
+        catalog = self.parent.core.catalog
+
+        rows = []
+        current_category = None
+        for model_name in catalog.search(self.filter_var.get()):
+            model_category = catalog.models[model_name].get('SORT', '')
+            if model_category != current_category:
+                if model_category:
+                    rows.append(f"--- {model_category} ---")
+                current_category = model_category
+            rows.append(model_name)
+
+        update_listbox(self.model_list, rows)
+
+    def add_to_order(self):
+        selected_indices = self.model_list.curselection()
+        for i in selected_indices:
+            model = self.model_list.get(i)
+            if not model.startswith("---") and model not in self.order_list.get(0, tk.END):
+                self.order_list.insert(tk.END, model)
+
+    def remove_from_order(self):
+        selected_indices = self.order_list.curselection()
+        for i in reversed(selected_indices):  # Reverse to avoid index issues
+            self.input_stems.pop(self.order_list.get(i), None)
+            self.order_list.delete(i)
+        self.on_order_select()
+
+    def move_in_order(self, direction):
+        selected_indices = self.order_list.curselection()
+        for i in selected_indices:
+            if 0 <= i + direction < self.order_list.size():
+                model = self.order_list.get(i)
+                self.order_list.delete(i)
+                self.order_list.insert(i + direction, model)
+                self.order_list.selection_set(i + direction)
+
+    def on_order_select(self, event=None):
+        """Shows the input stems of the selected model in the order list."""
+        selected_indices = self.order_list.curselection()
+        self.stems_model = None  # Don't let the update below overwrite another model's stems
+        if len(selected_indices) == 1:
+            model = self.order_list.get(selected_indices[0])
+            self.stems_var.set(", ".join(self.input_stems.get(model, [])))
+            self.stems_entry.config(state=tk.NORMAL)
+            self.stems_model = model
+        else:
+            self.stems_var.set("")
+            self.stems_entry.config(state=tk.DISABLED)
+
+    def on_stems_changed(self, *args):
+        if self.stems_model is None:
+            return
+        stems = [stem.strip() for stem in self.stems_var.get().split(',') if stem.strip()]
+        if stems:
+            self.input_stems[self.stems_model] = stems
+        else:
+            self.input_stems.pop(self.stems_model, None)
+
+    def get_chain(self):
+        ordered_models = list(self.order_list.get(0, tk.END))
+        return ordered_models, [self.input_stems.get(model) for model in ordered_models]
+
+    def save_chain(self):
+        ordered_models, input_stems = self.get_chain()
+        if not ordered_models:
+            messagebox.showerror("Error", "Please add at least one model to the order list.")
+            return
+        path = filedialog.asksaveasfilename(parent=self.master, title="Save Chain", defaultextension=".json",
+                                            filetypes=(("Chain Files", "*.json"), ("All Files", "*.*")))
+        if path:
+            save_chain(path, ordered_models, input_stems, self.processing_mode.get())
+            # Saved chains are run again and again; keep their models out of the quota's reach
+            self.parent.core.pin_models(ordered_models)
+
+    def load_chain(self):
+        path = filedialog.askopenfilename(parent=self.master, title="Load Chain",
+                                          filetypes=(("Chain Files", "*.json"), ("All Files", "*.*")))
+        if not path:
+            return
+        try:
+            ordered_models, input_stems, processing_mode = load_chain(path)
+        except (OSError, ValueError, KeyError) as e:
+            messagebox.showerror("Error", f"Could not load the chain: {e}")
+            return
+
+        unknown = [model for model in ordered_models if model not in self.parent.model_info]
+        if unknown:
+            messagebox.showwarning("Warning", "Unknown models were skipped:\n" + "\n".join(unknown))
+        self.order_list.delete(0, tk.END)
+        self.input_stems = {}
+        for model, stems in zip(ordered_models, input_stems):
+            if model in self.parent.model_info and model not in self.order_list.get(0, tk.END):
+                self.order_list.insert(tk.END, model)
+                if stems:
+                    self.input_stems[model] = stems
+        self.processing_mode.set(processing_mode)
+        self.on_order_select()
+        self.parent.core.pin_models(ordered_models)
+
+
+    def process_multi_model(self):
+        ordered_models = self.order_list.get(0, tk.END)
+        if not ordered_models:
+            messagebox.showerror("Error", "Please add at least one model to the order list.")
+            return
+
+        processing_mode = self.processing_mode.get()
+        if processing_mode not in ("Sequential", "Independent"):
+            messagebox.showerror("Error", f"Invalid processing mode selected: {processing_mode}")
+            return
+
+        ordered_models, input_stems = self.get_chain()
+        self._start_batch(self.parent.core.process_multi_model, (ordered_models, processing_mode, input_stems))
+
+    def resume_batch(self):
+        output_folder = self.parent.output_folder.get()
+        if not output_folder:
+            messagebox.showerror("Error", "Please select the output folder of the batch to resume.")
+            return
+        self._start_batch(self.parent.core.resume_batch, (output_folder,))
+
+    def _start_batch(self, target, args):
+        # The window stays open when the batch fails, so it can be resumed
+        result = {}
+
+        def run():
+            result['ok'] = target(*args)
+
+        def done():
+            if result.get('ok'):
+                self.close_window()
+
+        self.parent._start_job(run, on_done=done)
+
+    def queue_to_spool(self):
+        ordered_models, input_stems = self.get_chain()
+        if not ordered_models:
+            messagebox.showerror("Error", "Please add at least one model to the order list.")
+            return
+        steps = [{'model': model, 'stems': stems} for model, stems in zip(ordered_models, input_stems)]
+        job = self.parent.job_from_settings(mode=self.processing_mode.get().lower(), steps=steps)
+        if self.parent.queue_jobs([job]):
+            self.close_window()
+
+    def close_window(self):
+        self.parent.multi_model_window = None  # Allow the window to be opened again
+        if self.master.winfo_exists():
+            self.master.destroy()
+
+class EnsembleWindow:
+    INITIAL_INPUT_FILES = 2
+    MAX_INPUT_FILES = 10
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.master = tk.Toplevel(parent.master)
+        self.master.title("Ensemble Mode")
+
+        self.ensemble_frame = ttk.Frame(self.master, padding="10")
+        self.ensemble_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.master.columnconfigure(0, weight=1)
+        self.master.rowconfigure(0, weight=1)
+
+        # Ensemble Type
+        ttk.Label(self.ensemble_frame, text="Ensemble Type:").grid(column=0, row=0, sticky=tk.W)
+        self.ensemble_type = tk.StringVar(value="avg_wave")
+        ensemble_types = list(ENSEMBLE_TYPES)
+        self.ensemble_type_combo = ttk.Combobox(self.ensemble_frame, textvariable=self.ensemble_type, values=ensemble_types, width=15)
+        self.ensemble_type_combo.grid(column=1, row=0, sticky=(tk.W, tk.E), padx=5)
+
+        # Input Files Frame
+        self.input_files_frame = ttk.LabelFrame(self.ensemble_frame, text="Input Files (Select the 'other' stem from each model)", padding="10")
+        self.input_files_frame.grid(column=0, row=1, columnspan=2, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+        self.input_files_frame.columnconfigure(1, weight=1)  # Allow the column with file entries to expand
+
+        self.ensemble_frame.columnconfigure(0, weight=1)
+        self.ensemble_frame.rowconfigure(1, weight=1)  # Make row 1 (input_files_frame) expand
+
+        self.input_files = []
+        self.weights = []
+        # Rows are created on demand (up to MAX_INPUT_FILES) instead of all up front
+        for _ in range(self.INITIAL_INPUT_FILES):
+            self.add_input_row()
+        self.add_row_button = ttk.Button(self.ensemble_frame, text="Add File", command=self.add_input_row)
+        self.add_row_button.grid(column=0, row=3, sticky=tk.W, padx=5)
+
+        # Output File
+        ttk.Label(self.ensemble_frame, text="Output File:").grid(column=0, row=2, sticky=tk.W)
+        self.output_file = tk.StringVar(value=os.path.join(self.parent.output_folder.get(), "ensemble_output.wav"))
+        self.output_entry = ttk.Entry(self.ensemble_frame, width=40, textvariable=self.output_file)
+        self.output_entry.grid(column=1, row=2, sticky=(tk.W, tk.E), padx=5)
+
+        # Make the column with the output entry expand
+        self.ensemble_frame.columnconfigure(1, weight=1)
+
+        # Button Frame
+        button_frame = ttk.Frame(self.ensemble_frame)
+        button_frame.grid(column=0, row=4, columnspan=2, sticky=(tk.W, tk.E), pady=5)
+        button_frame.columnconfigure(0, weight=1)
+
+        # Process Button
+        ttk.Button(button_frame, text="Process", command=self.process_ensemble).grid(column=0, row=0, sticky=tk.W, padx=5)
+
+        # Close Button
+        ttk.Button(button_frame, text="Close", command=self.master.withdraw).grid(column=1, row=0, sticky=tk.W, padx=5)
+
+        # Batch Folders: ensemble every track of several model output folders at once
+        batch_frame = ttk.LabelFrame(self.ensemble_frame, text="Batch Folders (one output folder per model)", padding="10")
+        batch_frame.grid(column=0, row=5, columnspan=2, sticky=(tk.W, tk.E), padx=5, pady=5)
+        batch_frame.columnconfigure(1, weight=1)
+
+        self.batch_folders = tk.Listbox(batch_frame, height=4)
+        self.batch_folders.grid(column=0, row=0, columnspan=2, rowspan=2, sticky=(tk.W, tk.E))
+        ttk.Button(batch_frame, text="Add Folder", command=self.add_batch_folder).grid(column=2, row=0, sticky=tk.W, padx=5)
+        ttk.Button(batch_frame, text="Remove", command=self.remove_batch_folder).grid(column=2, row=1, sticky=tk.W, padx=5)
+
+        ttk.Label(batch_frame, text="Weights:").grid(column=0, row=2, sticky=tk.W)
+        self.batch_weights = tk.StringVar()
+        ttk.Entry(batch_frame, textvariable=self.batch_weights).grid(column=1, row=2, sticky=(tk.W, tk.E), padx=5)
+        ttk.Label(batch_frame, text="Stems:").grid(column=0, row=3, sticky=tk.W)
+        self.batch_stems = tk.StringVar()
+        ttk.Entry(batch_frame, textvariable=self.batch_stems).grid(column=1, row=3, sticky=(tk.W, tk.E), padx=5)
+        ttk.Label(batch_frame, text="Output Folder:").grid(column=0, row=4, sticky=tk.W)
+        self.batch_output = tk.StringVar(value=os.path.join(self.parent.output_folder.get(), "ensemble"))
+        ttk.Entry(batch_frame, textvariable=self.batch_output).grid(column=1, row=4, sticky=(tk.W, tk.E), padx=5)
+        self.batch_force = tk.BooleanVar(value=False)
+        ttk.Checkbutton(batch_frame, text="Redo up-to-date tracks", variable=self.batch_force).grid(column=0, row=5, columnspan=2, sticky=tk.W)
+        ttk.Button(batch_frame, text="Run Batch", command=self.process_batch_ensemble).grid(column=2, row=5, sticky=tk.W, padx=5)
+
+        # Hide rather than destroy so reopening the window is instant
+        self.master.protocol("WM_DELETE_WINDOW", self.master.withdraw)
+        self.master.geometry("700x800")
+
+    def add_input_row(self):
+        i = len(self.input_files)
+        if i >= self.MAX_INPUT_FILES:
+            return
+        ttk.Label(self.input_files_frame, text=f"Input File {i + 1}:").grid(column=0, row=i, sticky=tk.W)
+        input_file_var = tk.StringVar()
+        ttk.Entry(self.input_files_frame, width=30, textvariable=input_file_var).grid(column=1, row=i, sticky=(tk.W, tk.E), padx=5)
+        self.input_files.append(input_file_var)
+
+        ttk.Button(self.input_files_frame, text="Browse", command=lambda i=i: self.browse_input_file(i)).grid(column=2, row=i)
+
+        ttk.Label(self.input_files_frame, text=f"Weight:").grid(column=3, row=i, sticky=tk.W)
+        weight_var = tk.DoubleVar(value=1.0)
+        self.weights.append(weight_var)
+
+        # Add an Entry widget for the weight
+        weight_entry = ttk.Entry(self.input_files_frame, width=5, textvariable=weight_var)
+        weight_entry.grid(column=4, row=i, sticky=(tk.W, tk.E))
+
+        # Add the Scale widget (optional - you can keep it or remove it)
+        ttk.Scale(self.input_files_frame, from_=1, to=10, variable=weight_var, orient=tk.HORIZONTAL).grid(column=5, row=i, sticky=(tk.W, tk.E))
+
+    def browse_input_file(self, index):
+        file_path = filedialog.askopenfilename(
+            initialdir=self.parent.output_folder.get(),
+            title="Select Input File",
+            filetypes=(("Audio Files", "*.wav *.flac *.mp3"), ("All Files", "*.*"))
+        )
+        if file_path:
+            self.input_files[index].set(file_path)
+            if index == len(self.input_files) - 1:
+                self.add_input_row()  # Offer the next slot once the last one is used
+            self.master.focus_set()  # Keep focus on the Ensemble window
+
+    def process_ensemble(self):
+        ensemble_type = self.ensemble_type.get()
+        output_file = self.output_file.get()
+        try:
+            # Pair each file with its own weight before dropping the empty rows
+            pairs = [(f.get(), round(w.get(), 2)) for f, w in zip(self.input_files, self.weights) if f.get()]
+        except tk.TclError:
+            messagebox.showerror("Error", "Weights must be numbers.")
+            return
+        input_files = [f for f, _ in pairs]
+        weights = [w for _, w in pairs]
+
+        if len(input_files) < 2:
+            messagebox.showerror("Error", "Please specify at least two input files.")
+            return
+
+        if not output_file:
+            messagebox.showerror("Error", "Please specify an output file.")
+            return
+
+        # Runs on the job thread like separations, so the window stays responsive
+        result = {}
+
+        def run():
+            result['ok'] = self.parent.core.process_ensemble(ensemble_type, input_files, weights, output_file)
+
+        def done():
+            if result.get('ok'):
+                messagebox.showinfo("Ensemble", "Ensemble process completed successfully!")
+
+        self.parent._start_job(run, on_done=done)
+
+    def add_batch_folder(self):
+        folder = filedialog.askdirectory(initialdir=self.parent.output_folder.get(), title="Select Model Output Folder")
+        if folder:
+            self.batch_folders.insert(tk.END, folder)
+        self.master.focus_set()
+
+    def remove_batch_folder(self):
+        for index in reversed(self.batch_folders.curselection()):
+            self.batch_folders.delete(index)
+
+    def process_batch_ensemble(self):
+        ensemble_type = self.ensemble_type.get()
+        folders = list(self.batch_folders.get(0, tk.END))
+        output_folder = self.batch_output.get()
+        stems = [s.strip() for s in self.batch_stems.get().split(',') if s.strip()] or None
+        force = self.batch_force.get()
+
+        if len(folders) < 2:
+            messagebox.showerror("Error", "Please add at least two model output folders.")
+            return
+        try:
+            weights = [float(w) for w in self.batch_weights.get().replace(',', ' ').split()] or [1.0] * len(folders)
+        except ValueError:
+            messagebox.showerror("Error", "Weights must be numbers separated by commas.")
+            return
+        if not output_folder:
+            messagebox.showerror("Error", "Please specify an output folder.")
+            return
+
+        result = {}
+
+        def run():
+            result['ok'] = self.parent.core.process_batch_ensemble(ensemble_type, folders, weights, output_folder, stems=stems, force=force)
+
+        def done():
+            if result.get('ok'):
+                messagebox.showinfo("Ensemble", "Batch ensemble completed successfully!")
+
+        self.parent._start_job(run, on_done=done)
+
+class _ProgressTee:
+    """Passes writes through to a stream and reports the tqdm chunk progress found in them."""
+
+    def __init__(self, stream, on_progress):
+        self.stream = stream
+        self.on_progress = on_progress
+        self.last_percent = None
+
+    def write(self, text):
+        for match in PROGRESS_RE.finditer(text):
+            percent = int(match.group(1))
+            if percent != self.last_percent:
+                self.last_percent = percent
+                self.on_progress(percent)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class InferenceWorker:
+    """
+    Long-lived inference process that keeps the most recently used models in memory.
+
+    Jobs arrive as JSON lines on stdin ({"id": 1, "argv": [...]}), where argv is the
+    inference.py argument list built by _build_separation_command. Events go back as
+    JSON lines on the original stdout; anything inference.py prints is sent to stderr
+    so it can't corrupt the protocol.
+    """
+
+    def __init__(self, cache_mb=4096, max_models=3):
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self.max_models = max(1, max_models)
+        self.models = collections.OrderedDict()  # key -> (model, config, device, nbytes), oldest first
+        self.inference = None
+        self.torch = None
+        self.out = None
+
+    def serve(self):
+        # Keep a private handle on stdout for the protocol and point fd 1 at stderr
+        self.out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', encoding='utf-8')
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+        self._send(event='ready', pid=os.getpid())
+        for line in sys.stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError:
+                logging.error(f"Ignoring malformed worker request: {line}")
+                continue
+            if job.get('op') == 'shutdown':
+                break
+            self._run_job(job)
+
+    def _send(self, **event):
+        self.out.write(json.dumps(event) + "\n")
+        self.out.flush()
+
+    def _run_job(self, job):
+        job_id = job.get('id')
+        start_time = time.time()
+
+        try:
+            self._import_inference()
+            args = self._parse_job_args(job['argv'])
+        except BaseException:
+            self._send(id=job_id, event='done', ok=False, stage='setup', error=traceback.format_exc())
+            return
+
+        try:
+            model, config, device, cached = self._get_model(args)
+            load_time = time.time() - start_time
+            self._send(id=job_id, event='loaded', cached=cached, load_time=load_time)
+
+            stderr = sys.stderr
+            sys.stderr = _ProgressTee(stderr, lambda percent: self._send(id=job_id, event='progress', percent=percent))
+            try:
+                self.inference.run_folder(model, args, config, device, verbose=False)
+            finally:
+                sys.stderr = stderr
+
+            self._send(id=job_id, event='done', ok=True, cached=cached, load_time=load_time, elapsed=time.time() - start_time)
+        except BaseException:
+            self._send(id=job_id, event='done', ok=False, stage='run', error=traceback.format_exc())
+
+    def _import_inference(self):
+        if self.inference is not None:
+            return
+        # inference.py lives in the working directory, next to AutoGUI.py
+        if os.getcwd() not in sys.path:
+            sys.path.insert(0, os.getcwd())
+        import torch
+        import inference
+        self.torch = torch
+        self.inference = inference
+
+    def _parse_job_args(self, argv):
+        # Same interception as the inference.py patch: the parser doesn't know --input_path
+        argv = list(argv)
+        input_path = None
+        if "--input_path" in argv:
+            idx = argv.index("--input_path")
+            input_path = argv[idx + 1]
+            del argv[idx:idx + 2]
+
+        saved_argv = sys.argv
+        sys.argv = ["inference.py"] + argv
+        try:
+            args = self.inference.parse_args_inference(None)
+        finally:
+            sys.argv = saved_argv
+
+        if input_path:
+            args.input_path = input_path
+            if not args.input_folder:
+                args.input_folder = input_path if os.path.isdir(input_path) else os.path.dirname(input_path)
+        return args
+
+    def _get_model(self, args):
+        checkpoint_path = os.path.abspath(args.start_check_point) if args.start_check_point else ''
+        checkpoint_mtime = os.path.getmtime(checkpoint_path) if checkpoint_path else 0
+        with open(args.config_path, 'rb') as f:
+            config_digest = hashlib.sha1(f.read()).hexdigest()
+        key = (args.model_type, config_digest, checkpoint_path, checkpoint_mtime)
+
+        if key in self.models:
+            self.models.move_to_end(key)
+            model, config, device, _ = self.models[key]
+            return model, config, device, True
+
+        # The checkpoint size is a good estimate of what the model will take once loaded
+        self._evict(os.path.getsize(checkpoint_path) if checkpoint_path else 0, reserve_slot=True)
+        model, config, device = self._load_model(args)
+        nbytes = sum(t.numel() * t.element_size() for t in list(model.parameters()) + list(model.buffers()))
+        self.models[key] = (model, config, device, nbytes)
+        logging.info(f"Worker loaded {args.model_type} ({nbytes / 1024 ** 2:.0f} MB, {len(self.models)} model(s) resident)")
+        return model, config, device, False
+
+    def _evict(self, incoming_bytes, reserve_slot=False):
+        max_models = self.max_models - 1 if reserve_slot else self.max_models
+        while self.models:
+            used = sum(entry[3] for entry in self.models.values())
+            if len(self.models) <= max_models and used + incoming_bytes <= self.cache_bytes:
+                break
+            self.models.popitem(last=False)
+
+        gc.collect()
+        if self.torch is not None and self.torch.cuda.is_available():
+            self.torch.cuda.empty_cache()
+
+    def _load_model(self, args):
+        # Mirrors proc_folder() in inference.py
+        torch = self.torch
+        device = "cpu"
+        if not getattr(args, 'force_cpu', False):
+            if torch.cuda.is_available():
+                device_ids = args.device_ids
+                device = f"cuda:{device_ids[0]}" if isinstance(device_ids, list) else f"cuda:{device_ids}"
+            elif torch.backends.mps.is_available():
+                device = "mps"
+
+        torch.backends.cudnn.benchmark = True
+        model, config = self.inference.get_model_from_config(args.model_type, args.config_path)
+
+        if args.start_check_point:
+            checkpoint = torch.load(args.start_check_point, map_location='cpu', weights_only=False)
+            load_start_checkpoint = getattr(self.inference, 'load_start_checkpoint', None)
+            if load_start_checkpoint is not None:
+                load_start_checkpoint(args, model, checkpoint, type_='inference')
+            else:
+                if args.model_type in ['htdemucs', 'apollo']:
+                    checkpoint = checkpoint.get('state', checkpoint)
+                    checkpoint = checkpoint.get('state_dict', checkpoint)
+                model.load_state_dict(checkpoint)
+
+        model = model.to(device)
+        model.eval()
+        return model, config, device
+
+class WorkerClient:
+    """Starts an InferenceWorker in a child process and exchanges jobs with it."""
+
+    def __init__(self, cache_mb=4096, max_models=3):
+        self.cache_mb = cache_mb
+        self.max_models = max_models
+        self.process = None
+        self.events = None
+        self._next_id = 0
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        if self.is_alive():
+            return
+        cmd = [sys.executable, os.path.abspath(__file__), "worker",
+               "--cache-mb", str(self.cache_mb), "--max-models", str(self.max_models)]
+        logging.info(f"Starting inference worker: {cmd}")
+        self.process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8')
+        self.events = queue.Queue()
+        threading.Thread(target=self._read_events, args=(self.process, self.events), daemon=True).start()
+
+    def _read_events(self, process, events):
+        for line in process.stdout:
+            try:
+                events.put(json.loads(line))
+            except ValueError:
+                logging.warning(f"Unexpected worker output: {line.strip()}")
+        events.put(None)  # The worker exited
+
+    def submit(self, argv):
+        self.start()
+        self._next_id += 1
+        self.process.stdin.write(json.dumps({'id': self._next_id, 'argv': list(argv)}) + "\n")
+        self.process.stdin.flush()
+        return self._next_id
+
+    def wait(self, job_id, on_event=None, cancel_event=None):
+        """
+        Waits for a job to finish.
+
+        Args:
+            job_id: The id returned by submit().
+            on_event: Called with every event of the job (loaded, progress, done).
+            cancel_event: A threading.Event; once set, the worker is terminated and the job abandoned.
+
+        Returns:
+            The job's "done" event.
+        """
+        while True:
+            try:
+                event = self.events.get(timeout=0.1)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    self.terminate()
+                    return {'id': job_id, 'event': 'done', 'ok': False, 'stage': 'run', 'error': "Cancelled."}
+                continue
+
+            if event is None:
+                return {'id': job_id, 'event': 'done', 'ok': False, 'stage': 'run',
+                        'error': f"Inference worker exited unexpectedly (code {self.process.wait()})."}
+            if event.get('id') != job_id:
+                continue
+            if on_event:
+                on_event(event)
+            if event.get('event') == 'done':
+                return event
+
+    def terminate(self):
+        """Kills the worker (and the model it's running) without waiting for the current job."""
+        if self.process is not None:
+            stop_process(self.process)
+        self.process = None
+
+    def stop(self):
+        if self.is_alive():
+            try:
+                self.process.stdin.write(json.dumps({'op': 'shutdown'}) + "\n")
+                self.process.stdin.flush()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+        self.process = None
+
+class SpoolQueue:
+    """
+    A job queue in a folder shared by any number of workers, on one or many machines.
+
+    Layout:
+        queued/<id>.json            jobs waiting, claimed oldest first
+        running/<worker>/<id>.json  jobs a worker claimed (moving the file is the claim)
+        workers/<worker>.json       heartbeats; a worker whose heartbeat is older than
+                                    lease_seconds is presumed dead and its jobs re-queued
+        done/<id>.json              finished jobs with their result
+        failed/<id>.json            jobs that failed max_attempts times
+
+    Every change is a rename within the folder, so it only needs a filesystem where rename
+    is atomic (local disks, NFS). Hosts' clocks should agree to well within the lease.
+    """
+
+    STATES = ('queued', 'running', 'done', 'failed')
+
+    def __init__(self, root, lease_seconds=300, max_attempts=3):
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        for name in self.STATES + ('workers', 'tmp'):
+            os.makedirs(os.path.join(root, name), exist_ok=True)
+
+    def submit(self, job):
+        """Queues a job (a run_job dict) and returns its id."""
+        job_id = f"{time.time_ns():020d}-{hashlib.sha1(json.dumps(job, sort_keys=True).encode('utf-8')).hexdigest()[:8]}"
+        self._write(os.path.join(self.root, 'queued', job_id + '.json'), dict(job, id=job_id, attempts=0))
+        return job_id
+
+    def claim(self, worker_id):
+        """
+        Takes the oldest queued job for worker_id.
+
+        Returns:
+            The job dict, or None if the queue is empty.
+        """
+        running_dir = os.path.join(self.root, 'running', worker_id)
+        os.makedirs(running_dir, exist_ok=True)
+        queued_dir = os.path.join(self.root, 'queued')
+        for name in sorted(os.listdir(queued_dir)):
+            if not name.endswith('.json'):
+                continue
+            try:
+                os.rename(os.path.join(queued_dir, name), os.path.join(running_dir, name))
+            except FileNotFoundError:
+                continue  # Another worker was faster
+            with open(os.path.join(running_dir, name), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        return None
+
+    def finish(self, worker_id, job, result):
+        """
+        Files a claimed job under done/, or re-queues it (failed/ after max_attempts).
+
+        If reap() re-queued the job while it ran, a successful result still counts when
+        nobody has claimed the job again yet: the re-queued copy is withdrawn. Otherwise
+        the job is left to its new run and nothing is filed.
+
+        Returns:
+            Whether the result was filed.
+        """
+        running_path = os.path.join(self.root, 'running', worker_id, job['id'] + '.json')
+        finishing_path = os.path.join(self.root, 'tmp', f"{job['id']}.{worker_id}.finishing")
+        try:
+            os.rename(running_path, finishing_path)  # Fails if reap() took the job away
+        except FileNotFoundError:
+            try:
+                if not result.get('ok'):
+                    raise FileNotFoundError
+                os.rename(os.path.join(self.root, 'queued', job['id'] + '.json'), finishing_path)
+            except FileNotFoundError:
+                logging.warning(f"Spool job {job['id']} was re-queued while it ran; leaving it to its next run")
+                return False
+
+        record = dict(job, result=result, worker=worker_id, finished=time.strftime('%Y-%m-%dT%H:%M:%S'))
+        if result.get('ok'):
+            state = 'done'
+        else:
+            record['attempts'] = job.get('attempts', 0) + 1
+            state = 'queued' if record['attempts'] < self.max_attempts else 'failed'
+        self._write(os.path.join(self.root, state, job['id'] + '.json'), record)
+        os.remove(finishing_path)
+        return True
+
+    def release(self, worker_id, job):
+        """Puts a claimed job back in the queue untouched (e.g. the worker was stopped)."""
+        try:
+            os.rename(os.path.join(self.root, 'running', worker_id, job['id'] + '.json'),
+                      os.path.join(self.root, 'queued', job['id'] + '.json'))
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self, worker_id, current_job=None):
+        self._write(os.path.join(self.root, 'workers', worker_id + '.json'),
+                    {'worker': worker_id, 'host': socket.gethostname(), 'pid': os.getpid(), 'job': current_job, 'time': time.time()})
+
+    def retire(self, worker_id):
+        """Removes a worker that is shutting down (after releasing its jobs)."""
+        try:
+            os.remove(os.path.join(self.root, 'workers', worker_id + '.json'))
+        except FileNotFoundError:
+            pass
+        try:
+            os.rmdir(os.path.join(self.root, 'running', worker_id))
+        except OSError:
+            pass  # Not empty or already gone
+
+    def reap(self):
+        """
+        Re-queues the jobs of workers whose lease ran out.
+
+        Returns:
+            The ids of the re-queued jobs.
+        """
+        requeued = []
+        running_root = os.path.join(self.root, 'running')
+        for worker_id in os.listdir(running_root):
+            heartbeat = os.path.join(self.root, 'workers', worker_id + '.json')
+            try:
+                age = time.time() - os.stat(heartbeat).st_mtime
+            except FileNotFoundError:
+                age = float('inf')
+            if age <= self.lease_seconds:
+                continue
+            worker_dir = os.path.join(running_root, worker_id)
+            try:
+                names = os.listdir(worker_dir)
+            except FileNotFoundError:
+                continue  # Retired or reaped meanwhile
+            count = 0
+            for name in names:
+                try:
+                    os.rename(os.path.join(worker_dir, name), os.path.join(self.root, 'queued', name))
+                    requeued.append(name[:-len('.json')])
+                    count += 1
+                except FileNotFoundError:
+                    pass  # Another worker reaped it first
+            logging.warning(f"Worker {worker_id} stopped responding, re-queued {count} job(s)")
+            self.retire(worker_id)
+        return requeued
+
+    def status(self):
+        """
+        Returns:
+            {"counts": {state: n}, "running": {worker: [ids]}, "workers": [heartbeat dicts],
+             "failed": [ids], "percent": share of jobs done or failed}
+        """
+        counts = {}
+        for state in ('queued', 'done', 'failed'):
+            counts[state] = sum(1 for name in os.listdir(os.path.join(self.root, state)) if name.endswith('.json'))
+        running = {}
+        for worker_id in os.listdir(os.path.join(self.root, 'running')):
+            try:
+                ids = [name[:-len('.json')] for name in os.listdir(os.path.join(self.root, 'running', worker_id))]
+            except FileNotFoundError:
+                continue  # The worker retired meanwhile
+            if ids:
+                running[worker_id] = ids
+        counts['running'] = sum(len(ids) for ids in running.values())
+
+        workers = []
+        for name in os.listdir(os.path.join(self.root, 'workers')):
+            try:
+                with open(os.path.join(self.root, 'workers', name), 'r', encoding='utf-8') as f:
+                    info = json.load(f)
+            except (OSError, ValueError):
+                continue
+            info['alive'] = time.time() - info.get('time', 0) <= self.lease_seconds
+            workers.append(info)
+
+        total = sum(counts.values())
+        return {
+            'counts': counts,
+            'running': running,
+            'workers': workers,
+            'failed': sorted(name[:-len('.json')] for name in os.listdir(os.path.join(self.root, 'failed'))),
+            'percent': 100 * (counts['done'] + counts['failed']) / total if total else 0,
+        }
+
+    def _write(self, path, data):
+        # Written elsewhere, then renamed into place, so readers never see half a file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'), suffix='.json')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4)
+        os.replace(temp_path, path)
+
+def expand_spool_jobs(job):
+    """
+    Splits a CLI job into spool jobs: one per (track, model) for single and independent
+    jobs, and one per track (with the whole chain) for sequential ones, whose steps depend
+    on each other. Paths are made absolute so workers elsewhere can find them.
+    """
+    if job.get('chain'):
+        ordered_models, input_stems, chain_mode = load_chain(job['chain'])
+        job = dict(job, steps=[{'model': model, 'stems': stems} for model, stems in zip(ordered_models, input_stems)])
+        job.pop('chain')
+        job.setdefault('mode', chain_mode)
+    mode = job.get('mode', 'single').lower()
+    if mode in ('ensemble', 'ensemble-batch', 'resume'):
+        return [job]
+
+    output_folder = os.path.abspath(job.get('output_folder', ''))
+    tracks = [os.path.abspath(track) for track in list_audio_files(job.get('input_path', ''))]
+    options = dict(job.get('options', {}))
+    jobs = []
+    if mode == 'single':
+        for track in tracks:
+            jobs.append(dict(job, mode='single', input_path=track, output_folder=output_folder))
+    elif mode == 'independent':
+        ordered_models, _ = split_chain_steps(job.get('steps') or job['models'])
+        for selected_model in ordered_models:
+            for track in tracks:
+                # The same place Independent mode writes to
+                jobs.append({'mode': 'single', 'model': selected_model, 'input_path': track,
+                             'output_folder': os.path.join(output_folder, selected_model),
+                             'options': dict(options, model_folder_sort=False)})
+    else:
+        for track in tracks:
+            jobs.append(dict(job, mode='sequential', input_path=track, output_folder=output_folder))
+    return jobs
+
+def submit_to_spool(spool_dir, jobs):
+    """Queues the spool jobs of CLI jobs. Returns the number of jobs queued."""
+    spool = SpoolQueue(spool_dir)
+    count = 0
+    for job in jobs:
+        for spool_job in expand_spool_jobs(job):
+            spool.submit(spool_job)
+            count += 1
+    return count
+
+def run_spool_worker(spool_dir, lease_seconds=300, poll_seconds=5, exit_when_idle=False):
+    """
+    Works through the jobs of a spool folder until interrupted (or, with exit_when_idle,
+    until the queue is empty). Any number of these can share one spool.
+
+    Returns:
+        The process exit code: 0, or 130 if interrupted.
+    """
+    spool = SpoolQueue(spool_dir, lease_seconds)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    core = SeparationCore(on_status=logging.info, on_error=logging.error)
+    core.echo = sys.stderr
+    core.check_and_modify_inference_py()
+
+    current = {'job': None}
+    stop = threading.Event()
+
+    def keep_alive():
+        while not stop.wait(max(1, lease_seconds / 4)):
+            spool.heartbeat(worker_id, current['job'] and current['job']['id'])
+
+    spool.heartbeat(worker_id)
+    threading.Thread(target=keep_alive, daemon=True).start()
+    logging.info(f"Spool worker {worker_id} watching {spool_dir}")
+    exit_code = 0
+    try:
+        while True:
+            spool.reap()
+            spool.heartbeat(worker_id)  # Fresh before claiming, so nobody reaps the new job
+            job = spool.claim(worker_id)
+            if job is None:
+                if exit_when_idle and not spool.status()['counts']['running']:
+                    break
+                time.sleep(poll_seconds)
+                continue
+
+            current['job'] = job
+            logging.info(f"Running spool job {job['id']} ({job.get('model') or job.get('mode')}: {job.get('input_path')})")
+            entry = run_job(core, job)
+            spool.finish(worker_id, job, {key: entry.get(key) for key in ('ok', 'elapsed', 'error', 'runs')})
+            current['job'] = None
+    except (KeyboardInterrupt, JobCancelled):
+        core.cancel()
+        if current['job'] is not None:
+            spool.release(worker_id, current['job'])
+        exit_code = 130
+    finally:
+        stop.set()
+        spool.retire(worker_id)
+        core.shutdown()
+    return exit_code
+
+def format_spool_status(status):
+    counts = status['counts']
+    lines = [f"{status['percent']:.1f}% finished - queued {counts['queued']}, running {counts['running']}, "
+             f"done {counts['done']}, failed {counts['failed']}"]
+    for worker in sorted(status['workers'], key=lambda info: info['worker']):
+        state = "alive" if worker['alive'] else "no heartbeat"
+        lines.append(f"  {worker['worker']} ({state}): {worker.get('job') or 'idle'}")
+    if status['failed']:
+        lines.append(f"  failed: {', '.join(status['failed'])}")
+    return "\n".join(lines)
+
+class ProcessedIndex:
+    """
+    Record of the files a watch daemon has separated, kept in a SQLite file.
+
+    A file is identified by its path, size and modification time, so a restarted daemon
+    skips what it already did (or already failed on) but picks up a file that was
+    replaced since.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, state TEXT, finished REAL,
+                elapsed REAL, error TEXT)""")
+
+    def state(self, path, size, mtime_ns):
+        """Returns 'done' or 'failed' if this version of path was processed, else None."""
+        with self.lock:
+            row = self.connection.execute("SELECT size, mtime_ns, state FROM files WHERE path = ?", (path,)).fetchone()
+        if row is None or (row[0], row[1]) != (size, mtime_ns):
+            return None
+        return row[2]
+
+    def record(self, path, size, mtime_ns, ok, elapsed, error=None):
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                    (path, size, mtime_ns, 'done' if ok else 'failed', time.time(), elapsed, error))
+
+    def close(self):
+        self.connection.close()
+
+class FolderEvents:
+    """
+    Wakes a watch loop as soon as files in its folders are written or moved in, using
+    inotify on Linux. Elsewhere (or when inotify can't be set up) wait() just sleeps and
+    the loop finds new files by polling.
+    """
+
+    # inotify(7) event masks
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+
+    def __init__(self, folders):
+        self.fd = None
+        if not sys.platform.startswith('linux'):
+            return
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+            mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            for folder in folders:
+                if libc.inotify_add_watch(fd, os.fsencode(folder), mask) < 0:
+                    os.close(fd)
+                    raise OSError(ctypes.get_errno(), f"Can't watch {folder}")
+            self.fd = fd
+        except (OSError, AttributeError) as e:
+            logging.warning(f"inotify unavailable, polling the watch folders instead: {e}")
+
+    def wait(self, timeout):
+        """Waits up to timeout seconds for something to change. Returns True if something did."""
+        if self.fd is None:
+            time.sleep(timeout)
+            return False
+        import select
+
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return False
+        try:
+            while os.read(self.fd, 65536):  # Drain; the loop rescans the folders anyway
+                pass
+        except BlockingIOError:
+            pass
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+def job_models(job):
+    """Returns the models a CLI job runs."""
+    if job.get('model'):
+        return [job['model']]
+    if job.get('chain'):
+        return load_chain(job['chain'])[0]
+    return split_chain_steps(job.get('steps') or job.get('models') or [])[0]
+
+class WatchDaemon:
+    """
+    Separates the audio files that appear in watch folders with a job profile (a single
+    model, a chain or a job file), headless.
+
+    The folders are rescanned every poll_seconds, and at once when inotify reports a
+    change. A file is queued once its size and modification time have stayed the same for
+    stable_seconds, so files still being copied in are left alone. Up to `jobs` files are
+    separated at a time, each runner with its own SeparationCore. Finished files go into a
+    ProcessedIndex, so a restart doesn't separate them again, and the queue and throughput
+    counters are written to stats_path (see stats()).
+    """
+
+    THROUGHPUT_WINDOW = 3600  # Seconds of finished jobs the throughput is measured over
+
+    def __init__(self, folders, template, index_path, stats_path=None, jobs=1, stable_seconds=5, poll_seconds=10):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.template = template
+        self.index = ProcessedIndex(index_path)
+        self.stats_path = stats_path
+        self.jobs = max(1, jobs)
+        self.stable_seconds = stable_seconds
+        self.poll_seconds = poll_seconds
+
+        self.candidates = {}  # Path -> (size, mtime_ns, unchanged since), for files not queued or indexed yet
+        self.settled = {}  # Path -> (size, mtime_ns) of files queued or found in the index
+        self.queue = queue.Queue()
+        self.in_flight = set()  # Queued or running paths
+        self.running = 0
+        self.counts = collections.Counter()
+        self.finished = collections.deque()  # (finish time, audio seconds) within THROUGHPUT_WINDOW
+        self.started = time.time()
+        self.cores = []
+        self.admission = None
+        self.worker = None
+        self.worker_lock = None
+        self.lock = threading.Lock()
+        self.stats_lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def scan(self):
+        """Looks at every audio file of the watch folders and queues the ones that are ready."""
+        now = time.time()
+        seen = set()
+        for folder in self.folders:
+            for path in list_audio_files(folder):
+                try:
+                    stat = os.stat(path)
+                except OSError:  # Moved away meanwhile
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                seen.add(path)
+                if self.settled.get(path) == signature:
+                    continue
+                previous = self.candidates.get(path)
+                if previous is None or previous[:2] != signature:
+                    self.candidates[path] = signature + (now,)
+                    continue
+                if stat.st_size == 0 or now - previous[2] < self.stable_seconds:
+                    continue
+                with self.lock:
+                    if path in self.in_flight:  # An older version is still being separated
+                        continue
+                del self.candidates[path]
+                self.settled[path] = signature
+                if self.index.state(path, *signature) is None:
+                    with self.lock:
+                        self.in_flight.add(path)
+                    self.queue.put((path,) + signature)
+        for path in set(self.candidates) - seen:
+            del self.candidates[path]
+        for path in set(self.settled) - seen:
+            del self.settled[path]
+
+    def _next_check(self):
+        """Seconds until a waiting file could be stable."""
+        now = time.time()
+        with self.lock:
+            waits = [since + self.stable_seconds - now for path, (_, _, since) in self.candidates.items()
+                     if path not in self.in_flight]
+        return max(0.1, min(waits + [self.poll_seconds]))
+
+    def _runner(self):
+        core = SeparationCore(on_status=logging.info, on_error=logging.error)
+        core.echo = sys.stderr
+        with self.lock:
+            self.cores.append(core)
+            # One memory budget and one warm worker for all the runners; a runner finding
+            # the worker busy runs inference.py as its own process
+            if self.worker is None:  # First runner; the budget may be off, so not self.admission
+                self.admission = core.admission
+                self.worker = WorkerClient(core.config.get('worker_cache_mb', 4096), core.config.get('worker_max_models', 3))
+                self.worker_lock = core.worker_lock
+            core.admission = self.admission
+            core.concurrent_runs = self.jobs > 1
+            core.worker = self.worker
+            core.worker_lock = self.worker_lock
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    path, size, mtime_ns = self.queue.get(timeout=1)
+                except queue.Empty:
+                    continue
+                with self.lock:
+                    self.running += 1
+                logging.info(f"Watch: separating {path}")
+                start_time = time.time()
+                try:
+                    entry = run_job(core, dict(self.template, input_path=path))
+                except JobCancelled:
+                    break
+                except Exception as e:  # Whatever goes wrong with one file, the runner carries on
+                    logging.exception(f"Watch: separating {path} failed")
+                    entry = {'ok': False, 'elapsed': round(time.time() - start_time, 3), 'error': f"{type(e).__name__}: {e}"}
+                finally:
+                    with self.lock:
+                        self.running -= 1
+                        self.in_flight.discard(path)
+                if self.stop_event.is_set() and not entry['ok']:
+                    break  # Cancelled by stop(); left for the next run
+                try:
+                    self.index.record(path, size, mtime_ns, entry['ok'], entry['elapsed'], entry.get('error'))
+                except sqlite3.Error as e:
+                    logging.error(f"Watch: could not record {path} in the processed-file index: {e}")
+                with self.lock:
+                    self.counts['done' if entry['ok'] else 'failed'] += 1
+                    self.finished.append((time.time(), audio_duration(path) or 0))
+                logging.info(f"Watch: {'finished' if entry['ok'] else 'failed on'} {path} in {entry['elapsed']:.1f} s "
+                             f"(queued {self.queue.qsize()}, running {self.running})")
+                self._write_stats()
+        finally:
+            core.worker = None  # Shared; stopped by run()
+            core.shutdown()
+
+    def stats(self):
+        """
+        Returns the daemon's counters: files waiting to settle, queued and running, files
+        done and failed since it started, and the throughput over the last hour (files and
+        minutes of audio per hour).
+        """
+        now = time.time()
+        with self.lock:
+            while self.finished and now - self.finished[0][0] > self.THROUGHPUT_WINDOW:
+                self.finished.popleft()
+            window = min(self.THROUGHPUT_WINDOW, max(now - self.started, 1))
+            return {
+                'updated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'uptime': round(now - self.started, 1),
+                'folders': self.folders,
+                'waiting': len(self.candidates),
+                'queued': self.queue.qsize(),
+                'running': self.running,
+                'done': self.counts['done'],
+                'failed': self.counts['failed'],
+                'files_per_hour': round(len(self.finished) * 3600 / window, 2),
+                'audio_minutes_per_hour': round(sum(seconds for _, seconds in self.finished) / 60 * 3600 / window, 2),
+            }
+
+    def _write_stats(self):
+        if not self.stats_path:
+            return
+        stats = self.stats()
+        with self.stats_lock:
+            temp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(stats, f, indent=4)
+                os.replace(temp_path, self.stats_path)
+            except OSError as e:
+                logging.warning(f"Watch: could not write {self.stats_path}: {e}")
+
+    def run(self):
+        """Watches until stop() (or Ctrl+C). Queued files that haven't started are left for the next run."""
+        events = FolderEvents(self.folders)
+        runners = [threading.Thread(target=self._runner, daemon=True) for _ in range(self.jobs)]
+        for runner in runners:
+            runner.start()
+        logging.info(f"Watching {', '.join(self.folders)} ({'inotify' if events.fd is not None else 'polling'}, "
+                     f"{self.jobs} at a time)")
+        try:
+            while not self.stop_event.is_set():
+                self.scan()
+                self._write_stats()
+                # Short waits, so stop() (e.g. from a signal handler) is noticed quickly
+                deadline = time.time() + self._next_check()
+                while not self.stop_event.is_set() and time.time() < deadline:
+                    if events.wait(min(1.0, max(0.0, deadline - time.time()))):
+                        break
+        finally:
+            self.stop_event.set()
+            with self.lock:
+                cores = list(self.cores)
+            for core in cores:
+                core.cancel()
+            for runner in runners:
+                runner.join()
+            if self.worker is not None:
+                self.worker.stop()
+            events.close()
+            self._write_stats()
+            self.index.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+def run_watch(args):
+    """Runs the watch command. Returns the process exit code."""
+    if args.profile:
+        template = load_job_file(args.profile)[0]
+    elif args.chain:
+        template = {'chain': args.chain}
+    else:
+        template = {'mode': 'single', 'model': args.model}
+    template.pop('input_path', None)
+    output_folder = os.path.abspath(args.output or template.get('output_folder', ''))
+    if not args.output and not template.get('output_folder'):
+        logging.error("watch: give the output folder with -o (or in the profile)")
+        return 2
+    if any(os.path.abspath(folder) == output_folder for folder in args.folders):
+        logging.error("watch: the output folder can't be a watch folder")
+        return 2
+    template['output_folder'] = output_folder
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Fetch the models once up front rather than in every runner at the same time
+    core = SeparationCore(on_status=logging.info, on_error=logging.error)
+    core.check_and_modify_inference_py()
+    models = job_models(template)
+    unknown = [model for model in models if model not in core.model_info]
+    if unknown or not models:
+        logging.error(f"Unknown models: {', '.join(unknown)}" if unknown else "watch: the profile runs no models")
+        core.shutdown()
+        return 2
+    core.pin_models(models)
+    for model in models:
+        errors = [result for result in core.downloader.fetch_many(core._model_file_requests(model)) if isinstance(result, Exception)]
+        if errors:
+            logging.error(f"Could not download the files of {model}: {errors[0]}")
+            core.shutdown()
+            return 1
+    core.shutdown()
+
+    daemon = WatchDaemon(args.folders, template, args.index or os.path.join(output_folder, '.watch-index.sqlite'),
+                         args.stats or os.path.join(output_folder, '.watch-stats.json'),
+                         args.jobs, args.stable_seconds, args.poll)
+    import signal
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: daemon.stop())
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+def load_job_file(path):
+    """
+    Reads a CLI job file (JSON, or YAML for .yaml/.yml).
+
+    The file holds either a single job, a list of jobs, or {"defaults": {...}, "jobs": [...]},
+    where the defaults are merged into every job. A job looks like:
+
+        {"mode": "sequential", "models": ["A", "B"], "input_path": "in", "output_folder": "out",
+         "options": {"export_format": "flac PCM_24", "overlap": 4}}
+
+    Modes are single (with "model"), sequential, independent (with "models") and ensemble
+    (with "type", "files", "weights" and "output"). Instead of "models", a multi-model job can
+    give "steps" (see split_chain_steps) or a "chain" file saved from the Multi-Model window.
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            import yaml
+            data = yaml.safe_load(f)
+        else:
+            data = json.load(f)
+
+    if isinstance(data, list):
+        return data
+    if 'jobs' not in data:
+        return [data]
+
+    defaults = data.get('defaults', {})
+    jobs = []
+    for job in data['jobs']:
+        merged = dict(defaults, **job)
+        merged['options'] = dict(defaults.get('options', {}), **job.get('options', {}))
+        jobs.append(merged)
+    return jobs
+
+def split_chain_steps(steps):
+    """
+    Turns chain steps into process_multi_model arguments.
+
+    A step is a model name, or {"model": name, "stems": ["vocals"]} where stems (a list or
+    a comma separated string) are the outputs of the previous step it separates.
+
+    Returns:
+        (ordered_models, input_stems)
+    """
+    ordered_models = []
+    input_stems = []
+    for step in steps:
+        if isinstance(step, str):
+            step = {'model': step}
+        stems = step.get('stems')
+        if isinstance(stems, str):
+            stems = [stem.strip() for stem in stems.split(',') if stem.strip()]
+        ordered_models.append(step['model'])
+        input_stems.append(stems or None)
+    return ordered_models, input_stems
+
+def save_chain(path, ordered_models, input_stems, processing_mode):
+    """Saves a multi-model chain so load_chain, the Multi-Model window or `multi --chain` can reuse it."""
+    steps = []
+    for model, stems in zip(ordered_models, input_stems or [None] * len(ordered_models)):
+        steps.append({'model': model, 'stems': stems} if stems else {'model': model})
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'mode': processing_mode, 'steps': steps}, f, indent=4)
+
+def load_chain(path):
+    """
+    Reads a chain written by save_chain.
+
+    Returns:
+        (ordered_models, input_stems, processing_mode)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    ordered_models, input_stems = split_chain_steps(data['steps'])
+    return ordered_models, input_stems, data.get('mode', 'Sequential')
+
+def run_job(core, job):
+    """Runs one CLI job with core and returns its entry for the results summary."""
+    # A chain file supplies the models and, unless the job gives one, the mode
+    mode = (job.get('mode') or ('chain' if job.get('chain') else 'single')).lower()
+    options = dict(core.DEFAULT_OPTIONS, chunk_size=None, overlap=None)
+    options.update(job.get('options', {}))
+    if 'use_default_params' not in job.get('options', {}):
+        # Asking for a chunk size or overlap means the config has to be rewritten
+        options['use_default_params'] = options['chunk_size'] is None and options['overlap'] is None
+    options['input_path'] = job.get('input_path', '')
+    options['output_folder'] = job.get('output_folder', '')
+
+    core.options = options
+    core.results = []
+    start_time = time.time()
+    entry = {'mode': mode, 'input_path': options['input_path'], 'output_folder': options['output_folder']}
+    try:
+        if mode == 'single':
+            entry['model'] = job['model']
+            ok = core.separate(job['model'])
+        elif mode in ('sequential', 'independent', 'chain'):
+            if job.get('chain'):
+                ordered_models, input_stems, processing_mode = load_chain(job['chain'])
+                core.pin_models(ordered_models)
+            else:
+                ordered_models, input_stems = split_chain_steps(job.get('steps') or job['models'])
+            if mode != 'chain':
+                processing_mode = mode.capitalize()
+            entry.update(mode=processing_mode.lower(), models=ordered_models)
+            ok = core.process_multi_model(ordered_models, processing_mode, input_stems)
+        elif mode == 'ensemble':
+            files = list(job['files'])
+            weights = job.get('weights') or [1] * len(files)
+            ok = core.process_ensemble(job.get('type', 'avg_wave'), files, weights, job['output'])
+        elif mode == 'resume':
+            ok = core.resume_batch(job['output_folder'])
+        elif mode == 'ensemble-batch':
+            folders = list(job['folders'])
+            weights = job.get('weights') or [1] * len(folders)
+            entry['output_folder'] = job['output']
+            ok = core.process_batch_ensemble(job.get('type', 'avg_wave'), folders, weights, job['output'],
+                                             stems=job.get('stems'), jobs=job.get('jobs'), force=job.get('force', False))
+        else:
+            raise ValueError(f"Unknown mode: {mode}")
+    except (KeyError, ValueError, OSError) as e:
+        logging.error(f"Job failed: {e}")
+        ok = False
+        entry['error'] = str(e)
+
+    entry.update(ok=bool(ok), elapsed=round(time.time() - start_time, 3), runs=core.results)
+    return entry
+
+def run_jobs(jobs, summary_path=None, echo_children=True):
+    """
+    Runs CLI jobs one after another and writes a JSON results summary.
+
+    Returns:
+        The process exit code: 0 if every job succeeded, 1 if one failed, 130 if interrupted.
+    """
+    core = SeparationCore(on_status=logging.info, on_error=logging.error)
+    core.echo = sys.stderr if echo_children else None  # stdout is reserved for the summary
+    core.check_and_modify_inference_py()
+
+    summary = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'jobs': []}
+    start_time = time.time()
+    exit_code = 0
+    try:
+        for job in jobs:
+            entry = run_job(core, job)
+            summary['jobs'].append(entry)
+            if not entry['ok']:
+                exit_code = 1
+    except (KeyboardInterrupt, JobCancelled):
+        core.cancel()
+        summary['interrupted'] = True
+        exit_code = 130
+    finally:
+        core.shutdown()
+
+    summary['elapsed'] = round(time.time() - start_time, 3)
+    summary['ok'] = exit_code == 0
+    text = json.dumps(summary, indent=4)
+    if summary_path:
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    return exit_code
+
+def job_from_args(args):
+    """Builds a CLI job from the separate / multi / ensemble command line arguments."""
+    if args.command == 'ensemble':
+        return {'mode': 'ensemble', 'type': args.type, 'files': args.files,
+                'weights': args.weights or [1] * len(args.files), 'output': args.output}
+    if args.command == 'resume':
+        return {'mode': 'resume', 'output_folder': args.output_folder}
+    if args.command == 'ensemble-batch':
+        return {'mode': 'ensemble-batch', 'type': args.type, 'folders': args.folders,
+                'weights': args.weights or [1] * len(args.folders), 'output': args.output,
+                'stems': args.stems, 'jobs': args.jobs, 'force': args.force}
+
+    options = {
+        'extract_instrumental': not args.no_instrumental,
+        'export_format': args.export_format,
+        'use_tta': args.tta,
+        'use_warm_worker': not args.no_worker,
+        'use_result_cache': not args.no_cache,
+        'use_tuned_params': not args.no_tuned,
+        'normalize_peak': args.normalize_peak,
+    }
+    if args.chunk_size is not None:
+        options['chunk_size'] = args.chunk_size
+    if args.overlap is not None:
+        options['overlap'] = args.overlap
+
+    job = {'input_path': args.input, 'output_folder': args.output, 'options': options}
+    if args.command == 'separate':
+        options['model_folder_sort'] = args.organize
+        job.update(mode='single', model=args.model)
+    elif args.chain:
+        options['parallel_jobs'] = args.jobs
+        job['chain'] = args.chain
+        if args.mode:
+            job['mode'] = args.mode
+    else:
+        options['parallel_jobs'] = args.jobs
+        job.update(mode=args.mode or 'sequential', models=args.model)
+    return job
+
+def run_autotune(args):
+    """Runs the autotune command and prints the saved settings. Returns the process exit code."""
+    core = SeparationCore(on_status=logging.info, on_error=logging.error)
+    core.echo = None
+    core.check_and_modify_inference_py()
+    try:
+        settings = core.autotune(args.model, args.sample, args.clip_seconds, args.memory_mb,
+                                 args.chunk_sizes, args.overlaps, args.batch_sizes)
+    except (KeyboardInterrupt, JobCancelled):
+        core.cancel()
+        return 130
+    except OSError as e:
+        logging.error(f"Auto-tune failed: {e}")
+        return 1
+    finally:
+        core.shutdown()
+    if settings is None:
+        return 1
+    print(json.dumps(settings, indent=4))
+    return 0
+
+def run_checkpoints(args):
+    """Runs the checkpoints command. Returns the process exit code."""
+    core = SeparationCore()
+    unknown = [model for model in (args.pin or []) + (args.unpin or []) if model not in core.model_info]
+    if unknown:
+        logging.error(f"Unknown models: {', '.join(unknown)}")
+        return 2
+    if args.pin:
+        core.pin_models(args.pin)
+    if args.unpin:
+        core.pin_models(args.unpin, pinned=False)
+    if args.evict and not core.checkpoints.make_room(0):
+        logging.warning("ckpts/ is over the quota with its pinned files alone; nothing was evicted")
+
+    usage = core.checkpoints.usage()
+    if args.json:
+        print(json.dumps(usage, indent=4))
+        return 0
+    total = sum(entry['size'] for entry in usage.values() if not entry.get('shared'))
+    quota = core.checkpoints.quota_bytes
+    print(f"ckpts/: {total / 1024 ** 3:.2f} GB" + (f" of {quota / 1024 ** 3:.2f} GB" if quota else ""))
+    for filename, entry in sorted(usage.items(), key=lambda item: item[1].get('last_used', 0), reverse=True):
+        flags = ("pinned " if entry['pinned'] else "") + ("shared" if entry.get('shared') else "")
+        last_used = time.strftime('%Y-%m-%d %H:%M', time.localtime(entry.get('last_used', 0)))
+        print(f"{entry['size'] / 1024 ** 2:10.1f} MB  {entry['hits']:5d} hits  {last_used}  {filename}  {flags}".rstrip())
+    return 0
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Music Source Separation. Starts the GUI when no command is given.")
+    subparsers = parser.add_subparsers(dest='command')
+
+    def add_separation_options(subparser):
+        subparser.add_argument("-i", "--input", required=True, help="Input audio file or folder")
+        subparser.add_argument("-o", "--output", required=True, help="Output folder")
+        subparser.add_argument("--export-format", default='wav FLOAT', choices=['wav FLOAT', 'flac PCM_16', 'flac PCM_24'])
+        subparser.add_argument("--no-instrumental", action="store_true", help="Don't extract the other stem")
+        subparser.add_argument("--tta", action="store_true", help="Use test time augmentation")
+        subparser.add_argument("--overlap", type=int, help="Override the config's num_overlap")
+        subparser.add_argument("--chunk-size", type=int, help="Override the config's chunk_size")
+        subparser.add_argument("--no-worker", action="store_true", help="Start inference.py for every run instead of keeping models loaded")
+        subparser.add_argument("--no-cache", action="store_true", help="Separate every track even if a cached result exists")
+        subparser.add_argument("--no-tuned", action="store_true", help="Ignore the auto-tuned settings saved for this machine")
+        subparser.add_argument("--normalize-peak", action="store_true", help="Scale every output so its peak is at the config's normalize_peak_db")
+        subparser.add_argument("--summary", help="Write the JSON results summary to this file instead of stdout")
+        subparser.add_argument("--spool", help="Queue the work in this spool folder for spool workers instead of running it")
+
+    separate_parser = subparsers.add_parser('separate', help="Separate a file or folder with one model")
+    separate_parser.add_argument("-m", "--model", required=True, help="Model name from models.json")
+    separate_parser.add_argument("--organize", action="store_true", help="Put the output in a subfolder per model")
+    add_separation_options(separate_parser)
+
+    multi_parser = subparsers.add_parser('multi', help="Run several models, Sequential or Independent")
+    multi_parser.add_argument("-m", "--model", action='append', help="Model name, repeat in processing order")
+    multi_parser.add_argument("--chain", help="Chain file saved from the Multi-Model window (models and their input stems)")
+    multi_parser.add_argument("--mode", choices=['sequential', 'independent'], help="Default: the chain's mode, or sequential")
+    multi_parser.add_argument("-j", "--jobs", type=int, default=1, help="Independent mode: runs at the same time, each pinned to its own CPUs")
+    add_separation_options(multi_parser)
+
+    ensemble_parser = subparsers.add_parser('ensemble', help="Combine separated files with ensemble.py")
+    ensemble_parser.add_argument("--type", default='avg_wave',
+                                 choices=ENSEMBLE_TYPES)
+    ensemble_parser.add_argument("--files", required=True, nargs='+', help="Files to combine")
+    ensemble_parser.add_argument("--weights", nargs='+', type=float, help="One weight per file (default 1)")
+    ensemble_parser.add_argument("-o", "--output", required=True, help="Output file")
+    ensemble_parser.add_argument("--summary", help="Write the JSON results summary to this file instead of stdout")
+
+    ensemble_batch_parser = subparsers.add_parser('ensemble-batch', help="Ensemble every track of several model output folders")
+    ensemble_batch_parser.add_argument("--type", default='avg_wave', choices=ENSEMBLE_TYPES)
+    ensemble_batch_parser.add_argument("--folders", required=True, nargs='+', help="One output folder per model")
+    ensemble_batch_parser.add_argument("--weights", nargs='+', type=float, help="One weight per folder (default 1)")
+    ensemble_batch_parser.add_argument("--stems", nargs='+', help="Only these stems (default: every stem all folders have)")
+    ensemble_batch_parser.add_argument("-o", "--output", required=True, help="Output folder")
+    ensemble_batch_parser.add_argument("-j", "--jobs", type=int, help="Tracks ensembled at the same time (default: CPU count)")
+    ensemble_batch_parser.add_argument("--force", action="store_true", help="Redo tracks whose output is up to date")
+    ensemble_batch_parser.add_argument("--summary", help="Write the JSON results summary to this file instead of stdout")
+
+    resume_parser = subparsers.add_parser('resume', help="Resume the last unfinished multi-model batch of an output folder")
+    resume_parser.add_argument("output_folder")
+    resume_parser.add_argument("--summary", help="Write the JSON results summary to this file instead of stdout")
+
+    run_parser = subparsers.add_parser('run', help="Run the jobs of a JSON/YAML job file")
+    run_parser.add_argument("job_file")
+    run_parser.add_argument("--spool", help="Queue the jobs in this spool folder for spool workers instead of running them")
+    run_parser.add_argument("--summary", help="Write the JSON results summary to this file instead of stdout")
+
+    models_parser = subparsers.add_parser('models', help="List the models from models.json")
+    models_parser.add_argument("--category", help="Only list models of this type (e.g. Vocals)")
+    models_parser.add_argument("--update", action="store_true", help="Refresh models.json and print the added, removed and changed models")
+    models_parser.add_argument("--source", help="URL or local file to refresh from (default: models_url in config.json, else GitHub)")
+
+    checkpoints_parser = subparsers.add_parser('checkpoints', help="Show the usage of ckpts/ and manage pins and the quota")
+    checkpoints_parser.add_argument("--pin", nargs='+', metavar='MODEL', help="Never evict these models' files")
+    checkpoints_parser.add_argument("--unpin", nargs='+', metavar='MODEL')
+    checkpoints_parser.add_argument("--evict", action="store_true", help="Evict files until ckpts/ is within checkpoint_quota_gb")
+    checkpoints_parser.add_argument("--json", action="store_true", help="Print the usage as JSON")
+
+    spool_worker_parser = subparsers.add_parser('spool-worker', help="Run jobs from a shared spool folder")
+    spool_worker_parser.add_argument("spool", help="Spool folder (may be shared by several machines)")
+    spool_worker_parser.add_argument("--lease", type=float, default=300, help="Seconds without a heartbeat before a worker's jobs are re-queued")
+    spool_worker_parser.add_argument("--poll", type=float, default=5, help="Seconds between looks at an empty queue")
+    spool_worker_parser.add_argument("--exit-when-idle", action="store_true", help="Stop once the queue is empty")
+
+    watch_parser = subparsers.add_parser('watch', help="Separate the audio files that appear in folders, headless")
+    watch_parser.add_argument("folders", nargs='+', help="Folders to watch")
+    watch_profile = watch_parser.add_mutually_exclusive_group(required=True)
+    watch_profile.add_argument("-m", "--model", help="Model name from models.json")
+    watch_profile.add_argument("--chain", help="Chain file saved from the Multi-Model window")
+    watch_profile.add_argument("--profile", help="Job file (see `run`) whose first job is run on every file")
+    watch_parser.add_argument("-o", "--output", help="Output folder (default: the profile's output_folder)")
+    watch_parser.add_argument("-j", "--jobs", type=int, default=1, help="Files separated at the same time")
+    watch_parser.add_argument("--stable-seconds", type=float, default=5, help="How long a file must stay unchanged before it is separated")
+    watch_parser.add_argument("--poll", type=float, default=10, help="Seconds between rescans of the folders")
+    watch_parser.add_argument("--index", help="Processed-file index (default: .watch-index.sqlite in the output folder)")
+    watch_parser.add_argument("--stats", help="Where to keep the queue and throughput counters (default: .watch-stats.json in the output folder)")
+
+    spool_status_parser = subparsers.add_parser('spool-status', help="Show the progress of a spool folder")
+    spool_status_parser.add_argument("spool")
+    spool_status_parser.add_argument("--watch", type=float, help="Refresh every this many seconds")
+    spool_status_parser.add_argument("--json", action="store_true", help="Print the status as JSON")
+
+    autotune_parser = subparsers.add_parser('autotune', help="Find the fastest chunk size, overlap and batch size of a model on this machine")
+    autotune_parser.add_argument("-m", "--model", required=True, help="Model name from models.json")
+    autotune_parser.add_argument("--sample", required=True, help="A typical track (WAV files are cut to --clip-seconds)")
+    autotune_parser.add_argument("--clip-seconds", type=float, default=20)
+    autotune_parser.add_argument("--memory-mb", type=float, help="Peak memory a run may use (default: 75%% of the RAM)")
+    autotune_parser.add_argument("--chunk-sizes", type=int, nargs='+', help=f"Default: {' '.join(map(str, SeparationCore.TUNING_CHUNK_SIZES))}")
+    autotune_parser.add_argument("--overlaps", type=int, nargs='+', help=f"Default: {' '.join(map(str, SeparationCore.TUNING_OVERLAPS))}")
+    autotune_parser.add_argument("--batch-sizes", type=int, nargs='+', help=f"Default: {' '.join(map(str, SeparationCore.TUNING_BATCH_SIZES))}")
+
+    startup_parser = subparsers.add_parser('startup-time', help="Measure how long the GUI takes to start")
+    startup_parser.add_argument("--max-seconds", type=float, help="Exit non-zero when the window takes longer than this")
+
+    worker_parser = subparsers.add_parser('worker', help="Run a warm inference worker (started by the GUI)")
+    worker_parser.add_argument("--cache-mb", type=int, default=4096, help="Memory budget for resident models")
+    worker_parser.add_argument("--max-models", type=int, default=3, help="Maximum number of models kept loaded")
+    return parser
+
+def startup_report(import_seconds, window_seconds):
+    return {
+        'import_seconds': round(import_seconds, 3),
+        'window_seconds': None if window_seconds is None else round(window_seconds, 3),
+        'heavy_modules': [name for name in HEAVY_MODULES if name in sys.modules],
+    }
+
+def measure_startup(max_seconds=None):
+    """Start the GUI in a child process and report how long it took to become usable.
+
+    Args:
+        max_seconds: Fail when the window takes longer than this to appear.
+
+    Returns:
+        The process exit code: non-zero when the limit is exceeded or a heavy
+        module (torch, yaml, numpy) was imported during start-up.
+    """
+    env = dict(os.environ, **{STARTUP_PROBE_ENV: '1'})
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, os.path.abspath(__file__)], env=env, capture_output=True, text=True)
+    total_seconds = time.perf_counter() - start
+
+    report = None
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith('{'):
+            report = json.loads(line)
+            break
+    if result.returncode != 0 or report is None:
+        # No display available (TclError) or the GUI failed to build
+        logging.warning(f"GUI did not start: {result.stderr.strip()[-500:]}")
+        report = report or {'import_seconds': None, 'window_seconds': None, 'heavy_modules': []}
+        report['window_seconds'] = None
+
+    report['total_seconds'] = round(total_seconds, 3)
+    print(json.dumps(report, indent=2))
+
+    ok = not report['heavy_modules']
+    if max_seconds is not None and report['window_seconds'] is not None:
+        ok = ok and report['window_seconds'] <= max_seconds
+    return 0 if ok else 1
+
+def run_gui():
+    if tk is None:
+        if os.environ.get(STARTUP_PROBE_ENV):
+            print(json.dumps(startup_report(time.perf_counter() - _START_TIME, None)))
+            return 0
+        print("tkinter is not available; use the command line instead (see --help).", file=sys.stderr)
+        return 1
+
+    import_seconds = time.perf_counter() - _START_TIME
+    try:
+        root = tk.Tk()
+    except tk.TclError:
+        if not os.environ.get(STARTUP_PROBE_ENV):
+            raise
+        # No display: the import cost can still be reported
+        print(json.dumps(startup_report(import_seconds, None)))
+        return 0
+    gui = MusicSeparationGUI(root)
+    root.update()
+    window_seconds = time.perf_counter() - _START_TIME
+    logging.info(f"Window ready in {window_seconds:.2f} s")
+
+    if os.environ.get(STARTUP_PROBE_ENV):
+        # Started by the startup-time command: report and exit without a main loop
+        print(json.dumps(startup_report(import_seconds, window_seconds)))
+        root.destroy()
+        return 0
+
+    def on_closing():
+        gui.cancel_job()
+        gui.core.shutdown()
+        root.destroy()
+
+    root.protocol("WM_DELETE_WINDOW", on_closing)
+    root.mainloop()
+    return 0
+
+def main():
+    args = build_arg_parser().parse_args()
+    if args.command is None:
+        return run_gui()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'worker':
+        InferenceWorker(args.cache_mb, args.max_models).serve()
+        return 0
+
+    if args.command == 'models':
+        core = SeparationCore()
+        if args.update:
+            changes = core.update_models(args.source)
+            for kind, names in changes.items():
+                for name in names:
+                    print(f"{kind}\t{name}")
+            return 0
+        for name in core.catalog.ordered:
+            info = core.model_info[name]
+            if args.category is None or info.get('SORT', '').lower() == args.category.lower():
+                print(f"{info.get('SORT', '')}\t{name}")
+        return 0
+
+    if args.command == 'checkpoints':
+        return run_checkpoints(args)
+
+    if args.command == 'startup-time':
+        return measure_startup(args.max_seconds)
+
+    if args.command == 'autotune':
+        return run_autotune(args)
+
+    if args.command == 'multi' and not (args.model or args.chain):
+        print("multi: give the models with -m or a --chain file", file=sys.stderr)
+        return 2
+
+    if args.command == 'spool-worker':
+        return run_spool_worker(args.spool, args.lease, args.poll, args.exit_when_idle)
+
+    if args.command == 'watch':
+        return run_watch(args)
+
+    if args.command == 'spool-status':
+        spool = SpoolQueue(args.spool)
+        while True:
+            status = spool.status()
+            print(json.dumps(status, indent=4) if args.json else format_spool_status(status), flush=True)
+            if not args.watch:
+                return 0
+            time.sleep(args.watch)
+
+    jobs = load_job_file(args.job_file) if args.command == 'run' else [job_from_args(args)]
+    if getattr(args, 'spool', None):
+        count = submit_to_spool(args.spool, jobs)
+        logging.info(f"Queued {count} job(s) in {args.spool}")
+        return 0
+    return run_jobs(jobs, args.summary)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""
+Measures the wall time AutoGUI's own orchestration adds on top of the models.
+
+Generates a folder of synthetic WAV tracks and runs the single, Sequential, Independent
+and ensemble flows of SeparationCore against stand-ins for inference.py and ensemble.py
+(see stand_in/), which take the same command line and write the same files but do no
+real work. The report, printed as JSON, gives per flow the wall time, the time spent in
+each orchestration phase, the time the stand-ins themselves ran, files/sec and the bytes
+copied by AutoGUI (bytes it only linked or renamed don't count).
+
+    python benchmarks/bench_orchestration.py --tracks 20 --seconds 30 --output bench.json
+    python benchmarks/bench_orchestration.py --compare bench.json --tolerance 0.25
+
+With --compare, the exit code is 1 when a flow's overhead grew by more than the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import wave
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import AutoGUI  # noqa: E402
+
+MODELS = ('Bench Vocals A', 'Bench Vocals B', 'Bench Other C')
+FLOWS = ('single', 'sequential', 'independent', 'independent_parallel', 'ensemble')
+
+# SeparationCore methods timed as phases. Phases nest (inference runs inside the cache
+# phase of _run_separation) and, in parallel flows, overlap, so they don't add up to the wall time.
+PHASES = {
+    'prepare': '_download_model_files',  # Downloads (none here) and the derived config
+    'command': '_build_separation_command',
+    'stage': 'scratch.stage',  # Linking inputs into the scratch folder
+    'separation': '_run_separation',  # Cache lookups, staging and the inference run
+    'inference': '_run_inference_process',  # From spawning the child until it exits
+    'distribute': '_distribute_outputs',  # Filing batch outputs per track (Sequential)
+    'ensemble': 'process_ensemble',
+}
+
+
+def write_tracks(folder, count, seconds, sample_rate):
+    """Writes count stereo 16-bit WAV files of noise. Returns their total size in bytes."""
+    os.makedirs(folder, exist_ok=True)
+    frame_bytes = 4
+    total = 0
+    for index in range(count):
+        path = os.path.join(folder, f"track_{index:03d}.wav")
+        with wave.open(path, 'wb') as track:
+            track.setnchannels(2)
+            track.setsampwidth(2)
+            track.setframerate(sample_rate)
+            remaining = int(seconds * sample_rate)
+            while remaining:
+                frames = min(remaining, sample_rate)
+                track.writeframes(os.urandom(frames * frame_bytes))
+                remaining -= frames
+        total += os.path.getsize(path)
+    return total
+
+
+def make_workspace(root, args):
+    """Lays out what AutoGUI expects in its working folder: the scripts, models.json and ckpts/."""
+    for script in ('inference.py', 'ensemble.py'):
+        shutil.copyfile(os.path.join(BENCH_DIR, 'stand_in', script), os.path.join(root, script))
+
+    os.makedirs(os.path.join(root, 'ckpts'))
+    models = {}
+    for index, name in enumerate(MODELS):
+        config_name = f"bench_{index}.yaml"
+        checkpoint_name = f"bench_{index}.ckpt"
+        instruments = "['other']" if name.endswith('C') else "['vocals', 'other']"
+        with open(os.path.join(root, 'ckpts', config_name), 'w') as f:
+            f.write(f"audio:\n  chunk_size: 352800\n  sample_rate: {args.sample_rate}\n"
+                    f"training:\n  instruments: {instruments}\n"
+                    f"inference:\n  batch_size: 1\n  num_overlap: 2\n")
+        with open(os.path.join(root, 'ckpts', checkpoint_name), 'wb') as f:
+            f.write(os.urandom(args.checkpoint_kb * 1024))
+        models[name] = {
+            'SORT': 'Bench', 'model_type': 'mdx23c',
+            # Never fetched: the files already exist
+            'config_url': f"file:///nonexistent/{config_name}", 'checkpoint_url': f"file:///nonexistent/{checkpoint_name}",
+            'config_name': config_name, 'checkpoint_name': checkpoint_name,
+        }
+    with open(os.path.join(root, 'models.json'), 'w') as f:
+        json.dump(models, f, indent=4)
+    with open(os.path.join(root, 'config.json'), 'w') as f:
+        json.dump({'scratch_dir': os.path.join(root, 'scratch'), 'result_cache_dir': os.path.join(root, 'result_cache'),
+                   'tuning_file': os.path.join(root, 'tuning.json')}, f, indent=4)
+
+
+class Instruments:
+    """Times the PHASES of one SeparationCore and counts the bytes shutil copies."""
+
+    def __init__(self, core):
+        self.phases = dict.fromkeys(PHASES, 0.0)
+        self.bytes_copied = 0
+        for phase, method_path in PHASES.items():
+            owner = core
+            *parents, method_name = method_path.split('.')
+            for parent in parents:
+                owner = getattr(owner, parent)
+            setattr(owner, method_name, self._timed(phase, getattr(owner, method_name)))
+        self.copyfile = shutil.copyfile
+        shutil.copyfile = self._counted_copyfile  # copy, copy2, copytree and move all go through it
+
+    def _timed(self, phase, method):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.phases[phase] += time.perf_counter() - start
+        return timed
+
+    def _counted_copyfile(self, src, dst, *args, **kwargs):
+        result = self.copyfile(src, dst, *args, **kwargs)
+        self.bytes_copied += os.path.getsize(dst)
+        return result
+
+    def close(self):
+        shutil.copyfile = self.copyfile
+
+
+def read_stand_in_log(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            runs = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        runs = []
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+    return runs
+
+
+def folder_stats(folder):
+    files = size = 0
+    for dirpath, _, filenames in os.walk(folder):
+        for name in filenames:
+            if name.startswith('metrics-'):
+                continue  # The batch's metrics summary
+            files += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return files, size
+
+
+def run_flow(flow, workspace, input_folder, output_folder, args):
+    """Runs one flow once. Returns its measurements."""
+    core = AutoGUI.SeparationCore()
+    core.echo = None
+    core.options = dict(core.DEFAULT_OPTIONS, input_path=input_folder, output_folder=output_folder,
+                        model_folder_sort=False, use_warm_worker=False, use_result_cache=args.cache,
+                        use_default_params=not args.custom_params, overlap=4, chunk_size=485100,
+                        parallel_jobs=args.jobs if flow == 'independent_parallel' else 1)
+    instruments = Instruments(core)
+    stand_in_log = os.path.join(workspace, 'logs', 'stand_in.jsonl')
+    os.environ['BENCH_STAND_IN_LOG'] = stand_in_log
+    read_stand_in_log(stand_in_log)
+
+    start = time.perf_counter()
+    try:
+        if flow == 'single':
+            ok = core.separate(MODELS[0])
+        elif flow == 'sequential':
+            ok = core.process_multi_model(list(MODELS), 'Sequential', [None, ['vocals'], None])
+        elif flow.startswith('independent'):
+            ok = core.process_multi_model(list(MODELS), 'Independent')
+        else:
+            # Every track's vocals from the two vocal models of an Independent run
+            source = output_folder + '-source'
+            if not os.path.isdir(source):
+                core.options.update(output_folder=source)
+                core.process_multi_model(list(MODELS[:2]), 'Independent')
+                core.options.update(output_folder=output_folder)
+                read_stand_in_log(stand_in_log)
+                instruments.phases = dict.fromkeys(PHASES, 0.0)
+                instruments.bytes_copied = 0
+                start = time.perf_counter()
+            ok = True
+            for track in AutoGUI.list_audio_files(input_folder):
+                name = os.path.splitext(os.path.basename(track))[0]
+                files = [os.path.join(source, model, f"{name}_vocals.wav") for model in MODELS[:2]]
+                ok = core.process_ensemble('avg_wave', files, [1, 1], os.path.join(output_folder, f"{name}.wav")) and ok
+        wall = time.perf_counter() - start
+    finally:
+        instruments.close()
+        core.shutdown()
+
+    runs = read_stand_in_log(stand_in_log)
+    stand_in_seconds = sum(run['end'] - run['start'] for run in runs)
+    files, size = folder_stats(output_folder)
+    return {
+        'ok': bool(ok),
+        'wall_seconds': wall,
+        # Only meaningful for serial flows: parallel stand-ins overlap each other
+        'overhead_seconds': max(0.0, wall - stand_in_seconds),
+        'stand_in_seconds': stand_in_seconds,
+        'processes': len(runs),
+        'phases': instruments.phases,
+        'output_files': files,
+        'files_per_second': files / wall if wall else None,
+        'bytes_written': size,
+        'bytes_copied': instruments.bytes_copied,
+    }
+
+
+def summarize(measurements):
+    """Median of every number over the repeats; the rest from the first run."""
+    summary = dict(measurements[0])
+    summary['ok'] = all(m['ok'] for m in measurements)
+    for key, value in measurements[0].items():
+        if isinstance(value, float):
+            summary[key] = round(statistics.median(m[key] for m in measurements), 4)
+    summary['phases'] = {phase: round(statistics.median(m['phases'][phase] for m in measurements), 4)
+                         for phase in PHASES}
+    summary['wall_seconds_min'] = round(min(m['wall_seconds'] for m in measurements), 4)
+    return summary
+
+
+def compare(report, baseline, tolerance, slack=0.05):
+    """Returns the flows whose overhead grew by more than tolerance (and slack seconds) over the baseline."""
+    regressions = []
+    for flow, result in report['flows'].items():
+        before = baseline.get('flows', {}).get(flow)
+        if before is None:
+            continue
+        limit = before['overhead_seconds'] * (1 + tolerance) + slack
+        if result['overhead_seconds'] > limit:
+            regressions.append(f"{flow}: overhead {result['overhead_seconds']:.3f} s, baseline {before['overhead_seconds']:.3f} s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tracks", type=int, default=10, help="Number of synthetic tracks")
+    parser.add_argument("--seconds", type=float, default=10, help="Length of each track")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--checkpoint-kb", type=int, default=1024, help="Size of the fake checkpoints")
+    parser.add_argument("--seconds-per-track", type=float, default=0, help="Simulated model time per track")
+    parser.add_argument("--flows", nargs='+', choices=FLOWS, default=list(FLOWS))
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per flow; the report gives the median")
+    parser.add_argument("--jobs", type=int, default=2, help="parallel_jobs of the independent_parallel flow")
+    parser.add_argument("--cache", action="store_true", help="Use the result cache (later repeats then hit it)")
+    parser.add_argument("--custom-params", action="store_true", help="Use a custom chunk size/overlap (derived configs)")
+    parser.add_argument("--workspace", help="Folder to work in (default: a temporary folder, removed afterwards)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    parser.add_argument("--compare", help="Baseline report to compare the overheads with")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed relative overhead growth for --compare")
+    args = parser.parse_args()
+
+    workspace = os.path.abspath(args.workspace or tempfile.mkdtemp(prefix='musicsepgui-bench-'))
+    os.makedirs(workspace, exist_ok=True)
+    previous_dir = os.getcwd()
+    os.environ['BENCH_SECONDS_PER_TRACK'] = str(args.seconds_per_track)
+    try:
+        make_workspace(workspace, args)
+        os.chdir(workspace)  # SeparationCore finds inference.py, models.json and ckpts/ here
+        input_folder = os.path.join(workspace, 'input')
+        input_bytes = write_tracks(input_folder, args.tracks, args.seconds, args.sample_rate)
+
+        report = {
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'cpus': len(AutoGUI.cpu_slots(os.cpu_count() or 1)),
+            'tracks': args.tracks,
+            'track_seconds': args.seconds,
+            'input_bytes': input_bytes,
+            'seconds_per_track': args.seconds_per_track,
+            'cache': args.cache,
+            'flows': {},
+        }
+        for flow in args.flows:
+            measurements = []
+            for repeat in range(args.repeat):
+                output_folder = os.path.join(workspace, 'output', f"{flow}-{repeat}")
+                measurements.append(run_flow(flow, workspace, input_folder, output_folder, args))
+            report['flows'][flow] = summarize(measurements)
+    finally:
+        os.chdir(previous_dir)
+        if not args.workspace:
+            shutil.rmtree(workspace, ignore_errors=True)
+
+    text = json.dumps(report, indent=4)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    exit_code = 0 if all(result['ok'] for result in report['flows'].values()) else 1
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+    return exit_code
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,40 @@
+"""
+Stand-in for Music-Source-Separation-Training's ensemble.py, for benchmarking AutoGUI.
+
+Takes the same command line and writes --output, but copies the heaviest weighted input
+instead of combining the files. Timings go to BENCH_STAND_IN_LOG like the inference stand-in.
+"""
+import argparse
+import json
+import os
+import shutil
+import time
+
+START = time.time()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=str, required=True, nargs='+')
+    parser.add_argument("--type", type=str, default='avg_wave')
+    parser.add_argument("--weights", type=float, nargs='+')
+    parser.add_argument("--output", default="res.wav", type=str)
+    args = parser.parse_args()
+
+    weights = args.weights or [1] * len(args.files)
+    if len(weights) != len(args.files):
+        raise SystemExit("Should be equal number of weights and files")
+    bytes_read = sum(os.path.getsize(path) for path in args.files)
+    source = max(zip(weights, args.files))[1]
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    shutil.copyfile(source, args.output)
+
+    log_path = os.environ.get('BENCH_STAND_IN_LOG')
+    if log_path:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'script': 'ensemble', 'start': START, 'end': time.time(), 'tracks': 1,
+                                'bytes_read': bytes_read, 'bytes_written': os.path.getsize(args.output)}) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Stand-in for Music-Source-Separation-Training's inference.py, for benchmarking AutoGUI.
+
+It takes the same command line as the real script (already patched the way
+AutoGUI.check_and_modify_inference_py leaves it) and writes the same output files,
+<track>_<instrument>.<wav|flac> in --store_dir, but copies the input instead of running
+a model. BENCH_SECONDS_PER_TRACK adds simulated model time per track, and every run
+appends its timings as a JSON line to BENCH_STAND_IN_LOG.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+START = time.time()
+
+
+def parse_args_inference(dict_args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model_type", type=str, default='mdx23c')
+    parser.add_argument("--config_path", type=str)
+    parser.add_argument("--start_check_point", type=str, default='')
+    parser.add_argument("--input_folder", type=str)
+    parser.add_argument("--store_dir", type=str, default="")
+    parser.add_argument("--device_ids", nargs='+', type=int, default=0)
+    parser.add_argument("--extract_instrumental", action='store_true')
+    parser.add_argument("--disable_detailed_pbar", action='store_true')
+    parser.add_argument("--force_cpu", action='store_true')
+    parser.add_argument("--flac_file", action='store_true')
+    parser.add_argument("--wav_file", action='store_true')
+    parser.add_argument("--pcm_type", type=str, choices=['PCM_16', 'PCM_24'], default='PCM_24')
+    parser.add_argument("--use_tta", action='store_true')
+    return parser.parse_args(dict_args)
+
+
+def load_instruments(config_path):
+    import yaml
+
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)
+    training = config.get('training', {})
+    instruments = list(training.get('instruments', ['vocals', 'other']))
+    if training.get('target_instrument'):
+        instruments = [training['target_instrument']]
+    return instruments
+
+
+def run_folder(args):
+    if getattr(args, 'input_path', None) and os.path.isfile(args.input_path):
+        mixture_paths = [args.input_path]
+    else:
+        mixture_paths = sorted(glob.glob(os.path.join(args.input_folder, '*.*')))
+    os.makedirs(args.store_dir, exist_ok=True)
+
+    instruments = load_instruments(args.config_path)
+    if args.extract_instrumental and len(instruments) == 1:
+        instruments.append('instrumental')
+    with open(args.start_check_point, 'rb') as f:  # "Load the model"
+        f.read()
+    model_loaded = time.time()
+
+    seconds_per_track = float(os.environ.get('BENCH_SECONDS_PER_TRACK', '0'))
+    bytes_read = bytes_written = 0
+    for path in mixture_paths:
+        with open(path, 'rb') as f:
+            audio = f.read()
+        bytes_read += len(audio)
+        for percent in (0, 25, 50, 75, 100):
+            sys.stderr.write(f"\rProcessing audio chunks:  {percent}%|#")
+            sys.stderr.flush()
+            if percent < 100 and seconds_per_track:
+                time.sleep(seconds_per_track / 4)
+        sys.stderr.write("\n")
+
+        file_name = os.path.splitext(os.path.basename(path))[0]
+        codec = 'flac' if args.flac_file else 'wav'
+        for instr in instruments:
+            output_path = os.path.join(args.store_dir, f"{file_name}_{instr}.{codec}")
+            with open(output_path, 'wb') as f:
+                f.write(audio)
+            bytes_written += len(audio)
+
+    log_path = os.environ.get('BENCH_STAND_IN_LOG')
+    if log_path:
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'script': 'inference', 'start': START, 'model_loaded': model_loaded, 'end': time.time(),
+                                'tracks': len(mixture_paths), 'bytes_read': bytes_read, 'bytes_written': bytes_written}) + "\n")
+
+
+def proc_folder(dict_args):
+    custom_input_path = None
+    if "--input_path" in sys.argv:
+        idx = sys.argv.index("--input_path")
+        if idx + 1 < len(sys.argv):
+            custom_input_path = sys.argv[idx + 1]
+            del sys.argv[idx:idx + 2]
+    args = parse_args_inference(dict_args)
+    if custom_input_path:
+        args.input_path = custom_input_path
+        if not args.input_folder:
+            args.input_folder = custom_input_path if os.path.isdir(custom_input_path) else os.path.dirname(custom_input_path)
+    run_folder(args)
+
+
+if __name__ == "__main__":
+    proc_folder(None)